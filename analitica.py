@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: analitica.py
+Descripción: Análisis del historial de incidencias para orientación: alumnos
+             reincidentes, tendencia por alumno, mapa de lugar por hora, tipo por
+             gravedad y variación semana contra semana.
+
+             Las incidencias de todos los libros (ciclos archivados y el actual) se
+             cargan una vez en arreglos de NumPy por columna. Lugar, tipo, gravedad y
+             alumno se guardan como códigos enteros, y la relación incidencia-alumno
+             como dos arreglos paralelos, así que cada consulta es un bincount o un
+             np.unique sobre enteros y no un recorrido fila por fila.
+
+             Los ciclos cerrados se leen de su copia columnar (ver columnar.py) sin
+             copiar los datos; solo el libro actual se interpreta desde el Excel.
+
+             Los resultados se guardan en memoria como vistas materializadas. Se
+             descartan cuando cambia algún libro o cuando el registro llama a
+             invalidar().
+
+                 python analitica.py reincidentes --top 10
+                 python analitica.py tendencia "Ana García López"
+                 python analitica.py mapa --desde 2025-01-01
+                 python analitica.py cruce
+                 python analitica.py semanal --semanas 8
+"""
+
+import os
+import argparse
+import threading
+from datetime import datetime, date, time, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from excelgen import EXCEL_PATH, GRAVEDADES, leer_incidencias, nombres_participantes
+from rotacion import rutas_ledger
+from metricas import medir
+import columnar
+
+SIN_FECHA = -(2 ** 31)
+SIN_HORA = -1
+SIN_GRAVEDAD = -1
+EPOCA = date(1970, 1, 1)
+# 1970-01-01 fue jueves: sumando 3 días, las semanas empiezan en lunes
+DESFASE_SEMANA = 3
+# Columna de códigos -> lista de categorías de la tabla
+CATEGORIAS = {"lugar": "lugares", "tipo": "tipos"}
+
+# Caché por libro actual: ruta -> {'firma', 'tabla', 'vistas'}
+_cache = {}
+_candado = threading.Lock()
+
+
+def _requiere_numpy():
+    if np is None:
+        raise RuntimeError("El análisis requiere NumPy. Instálalo con: pip install numpy")
+
+
+# --- Carga columnar ---
+
+def _dia(valor, memo):
+    """Días desde 1970-01-01, o SIN_FECHA."""
+    if isinstance(valor, datetime):
+        return (valor.date() - EPOCA).days
+    if isinstance(valor, date):
+        return (valor - EPOCA).days
+    texto = str(valor or "")[:10]
+    dia = memo.get(texto)
+    if dia is None:
+        try:
+            dia = (datetime.strptime(texto, "%Y-%m-%d").date() - EPOCA).days
+        except ValueError:
+            dia = SIN_FECHA
+        memo[texto] = dia
+    return dia
+
+
+def _hora(valor):
+    """Hora del día (0-23), o SIN_HORA."""
+    if isinstance(valor, (datetime, time)):
+        return valor.hour
+    texto = str(valor or "").strip()
+    try:
+        return int(texto.split(":")[0]) % 24
+    except ValueError:
+        return SIN_HORA
+
+
+def _fecha(dia):
+    return (EPOCA + timedelta(days=int(dia))).isoformat()
+
+
+def construir_tabla(filas):
+    """
+    Convierte filas con el formato de leer_incidencias en una tabla columnar:
+    arreglos por incidencia (dia, hora, lugar, tipo, gravedad), los pares
+    incidencia-alumno (part_inc, part_alumno) y las categorías de cada código.
+    """
+    _requiere_numpy()
+    codigos = {"lugar": {}, "tipo": {}, "alumno": {}}
+    codigo_gravedad = {g: i for i, g in enumerate(GRAVEDADES)}
+    memo_fechas = {}
+    dias, horas, lugares, tipos, gravedades = [], [], [], [], []
+    part_inc, part_alumno = [], []
+    for i, fila in enumerate(filas):
+        dias.append(_dia(fila["fecha"], memo_fechas))
+        horas.append(_hora(fila["hora"]))
+        lugar = fila["lugar"] or ""
+        lugares.append(codigos["lugar"].setdefault(lugar, len(codigos["lugar"])))
+        tipo = fila.get("tipo") or ""
+        tipos.append(codigos["tipo"].setdefault(tipo, len(codigos["tipo"])))
+        gravedades.append(codigo_gravedad.get(fila["gravedad"], SIN_GRAVEDAD))
+        alumnos = codigos["alumno"]
+        for nombre in nombres_participantes(fila["participantes"]):
+            part_inc.append(i)
+            part_alumno.append(alumnos.setdefault(nombre, len(alumnos)))
+    return {
+        "dia": np.array(dias, dtype=np.int32),
+        "hora": np.array(horas, dtype=np.int8),
+        "lugar": np.array(lugares, dtype=np.int32),
+        "tipo": np.array(tipos, dtype=np.int32),
+        "gravedad": np.array(gravedades, dtype=np.int8),
+        "part_inc": np.array(part_inc, dtype=np.int32),
+        "part_alumno": np.array(part_alumno, dtype=np.int32),
+        # Categorías en orden de código
+        "lugares": list(codigos["lugar"]),
+        "tipos": list(codigos["tipo"]),
+        "alumnos": list(codigos["alumno"]),
+    }
+
+
+def _firma_ledger(ruta):
+    firma = []
+    for r in rutas_ledger(ruta):
+        try:
+            st = os.stat(r)
+        except OSError:
+            continue
+        firma.append((r, st.st_size, st.st_mtime_ns))
+    return tuple(firma)
+
+
+def _tabla_libro(libro):
+    """Tabla de un libro: sobre su copia columnar si la hay, si no desde el Excel."""
+    columnas = columnar.abrir(libro)
+    if columnas is None:
+        return construir_tabla(leer_incidencias(libro))
+    minutos = np.frombuffer(columnas["minutos"], dtype=np.int16)
+    return {
+        "dia": np.frombuffer(columnas["dia"], dtype=np.int32),
+        "hora": np.where(minutos >= 0, minutos // 60, SIN_HORA).astype(np.int8),
+        "lugar": np.frombuffer(columnas["lugar"], dtype=np.int32),
+        "tipo": np.frombuffer(columnas["tipo"], dtype=np.int32),
+        "gravedad": np.frombuffer(columnas["gravedad"], dtype=np.int8),
+        "part_inc": np.frombuffer(columnas["part_inc"], dtype=np.int32),
+        "part_alumno": np.frombuffer(columnas["part_alumno"], dtype=np.int32),
+        "lugares": columnas["lugares"],
+        "tipos": columnas["tipos"],
+        "alumnos": columnas["alumnos"],
+    }
+
+
+def unir_tablas(tablas):
+    """Une las tablas de varios libros, traduciendo los códigos a un solo diccionario."""
+    if len(tablas) == 1:
+        return tablas[0]
+    unida = {"lugares": [], "tipos": [], "alumnos": []}
+    columnas = {k: [] for k in ("dia", "hora", "lugar", "tipo", "gravedad", "part_inc", "part_alumno")}
+    codigos = {"lugares": {}, "tipos": {}, "alumnos": {}}
+    desplazamiento = 0
+    for tabla in tablas:
+        for categoria, columna in (("lugares", "lugar"), ("tipos", "tipo"), ("alumnos", "part_alumno")):
+            globales = codigos[categoria]
+            mapa = np.array([globales.setdefault(c, len(globales)) for c in tabla[categoria]], dtype=np.int32)
+            columnas[columna].append(mapa[tabla[columna]] if len(mapa) else tabla[columna])
+        for columna in ("dia", "hora", "gravedad"):
+            columnas[columna].append(tabla[columna])
+        columnas["part_inc"].append(tabla["part_inc"] + desplazamiento)
+        desplazamiento += len(tabla["dia"])
+    for columna, partes in columnas.items():
+        unida[columna] = np.concatenate(partes) if partes else np.array([], dtype=np.int32)
+    for categoria in codigos:
+        unida[categoria] = list(codigos[categoria])
+    return unida
+
+
+def _entrada(ruta):
+    """Entrada de la caché del libro, recargando la tabla si algún libro cambió."""
+    firma = _firma_ledger(ruta)
+    with _candado:
+        entrada = _cache.get(ruta)
+        if entrada is None or entrada["firma"] != firma:
+            with medir("analitica.cargar", archivo=ruta) as extra:
+                libros = rutas_ledger(ruta)
+                tabla = unir_tablas([_tabla_libro(l) for l in libros]) if libros else construir_tabla([])
+                extra["incidencias"] = len(tabla["dia"])
+            entrada = {"firma": firma, "tabla": tabla, "vistas": {}}
+            _cache[ruta] = entrada
+        return entrada
+
+
+def cargar(ruta=EXCEL_PATH):
+    """Tabla columnar de todas las incidencias del libro y sus ciclos archivados."""
+    return _entrada(ruta)["tabla"]
+
+
+def invalidar(ruta=EXCEL_PATH):
+    """Descarta la tabla y las vistas del libro; se llama después de registrar."""
+    with _candado:
+        _cache.pop(ruta, None)
+
+
+def _vista(ruta, nombre, calcular, *args):
+    """Devuelve la vista 'nombre' con esos argumentos, calculándola solo la primera vez."""
+    entrada = _entrada(ruta)
+    clave = (nombre,) + args
+    vistas = entrada["vistas"]
+    if clave not in vistas:
+        with medir("analitica." + nombre):
+            vistas[clave] = calcular(entrada["tabla"], *args)
+    return vistas[clave]
+
+
+def _mascara(tabla, desde, hasta):
+    """Máscara booleana por incidencia para el rango de fechas 'AAAA-MM-DD' (inclusivo)."""
+    dia = tabla["dia"]
+    mascara = dia != SIN_FECHA
+    if desde:
+        mascara &= dia >= _dia(desde, {})
+    if hasta:
+        mascara &= dia <= _dia(hasta, {})
+    return mascara
+
+
+# --- Vistas ---
+
+def _calc_reincidentes(tabla, top, minimo, desde, hasta):
+    n_alumnos = len(tabla["alumnos"])
+    if n_alumnos == 0:
+        return []
+    seleccion = _mascara(tabla, desde, hasta)[tabla["part_inc"]]
+    incs = tabla["part_inc"][seleccion]
+    alumnos = tabla["part_alumno"][seleccion]
+    gravedad = tabla["gravedad"][incs].astype(np.int64)
+
+    total = np.bincount(alumnos, minlength=n_alumnos)
+    valida = gravedad >= 0
+    por_gravedad = np.bincount(alumnos[valida] * len(GRAVEDADES) + gravedad[valida],
+                               minlength=n_alumnos * len(GRAVEDADES)).reshape(n_alumnos, len(GRAVEDADES))
+    ultima = np.full(n_alumnos, SIN_FECHA, dtype=np.int32)
+    np.maximum.at(ultima, alumnos, tabla["dia"][incs])
+
+    # Más incidencias primero; a igualdad, más graves
+    orden = np.lexsort((-por_gravedad[:, 1], -por_gravedad[:, 2], -total))
+    orden = orden[total[orden] >= minimo][:top]
+    return [
+        dict({"alumno": tabla["alumnos"][a], "total": int(total[a]),
+              "ultima": _fecha(ultima[a]) if ultima[a] != SIN_FECHA else None},
+             **{g: int(por_gravedad[a, j]) for j, g in enumerate(GRAVEDADES)})
+        for a in orden
+    ]
+
+
+def reincidentes(ruta=EXCEL_PATH, top=10, minimo=2, desde=None, hasta=None):
+    """
+    Alumnos con más incidencias (al menos 'minimo'), ordenados por total y gravedad:
+    [{'alumno', 'total', 'Leve', 'Moderada', 'Grave', 'ultima'}].
+    """
+    return _vista(ruta, "reincidentes", _calc_reincidentes, top, minimo, desde, hasta)
+
+
+def _periodos(dias, periodo):
+    if periodo == "mes":
+        return dias.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return (dias.astype(np.int64) + DESFASE_SEMANA) // 7
+
+
+def _inicio_periodo(valor, periodo):
+    if periodo == "mes":
+        return str(np.datetime64(int(valor), "M"))
+    return _fecha(int(valor) * 7 - DESFASE_SEMANA)
+
+
+def _calc_tendencia(tabla, alumno, periodo):
+    try:
+        codigo = tabla["alumnos"].index(alumno)
+    except ValueError:
+        return []
+    incs = tabla["part_inc"][tabla["part_alumno"] == codigo]
+    incs = incs[tabla["dia"][incs] != SIN_FECHA]
+    if len(incs) == 0:
+        return []
+    periodos = _periodos(tabla["dia"][incs], periodo)
+    unicos, posicion = np.unique(periodos, return_inverse=True)
+    gravedad = tabla["gravedad"][incs].astype(np.int64)
+    valida = gravedad >= 0
+    n = len(GRAVEDADES)
+    por_gravedad = np.bincount(posicion[valida] * n + gravedad[valida],
+                               minlength=len(unicos) * n).reshape(len(unicos), n)
+    totales = np.bincount(posicion, minlength=len(unicos))
+    return [
+        dict({"periodo": _inicio_periodo(p, periodo), "total": int(totales[i])},
+             **{g: int(por_gravedad[i, j]) for j, g in enumerate(GRAVEDADES)})
+        for i, p in enumerate(unicos)
+    ]
+
+
+def tendencia_alumno(alumno, ruta=EXCEL_PATH, periodo="semana"):
+    """
+    Incidencias del alumno por semana (inicio en lunes) o por mes:
+    [{'periodo', 'total', 'Leve', 'Moderada', 'Grave'}], solo periodos con incidencias.
+    """
+    return _vista(ruta, "tendencia", _calc_tendencia, alumno, periodo)
+
+
+def _calc_mapa(tabla, desde, hasta):
+    n_lugares = len(tabla["lugares"])
+    seleccion = _mascara(tabla, desde, hasta) & (tabla["hora"] != SIN_HORA)
+    indice = tabla["lugar"][seleccion].astype(np.int64) * 24 + tabla["hora"][seleccion]
+    matriz = np.bincount(indice, minlength=n_lugares * 24).reshape(n_lugares, 24)
+    return {"lugares": tabla["lugares"], "horas": list(range(24)), "conteos": matriz.tolist()}
+
+
+def mapa_lugar_hora(ruta=EXCEL_PATH, desde=None, hasta=None):
+    """Conteo de incidencias por lugar (filas) y hora del día (columnas 0-23)."""
+    return _vista(ruta, "mapa", _calc_mapa, desde, hasta)
+
+
+def _calc_cruce(tabla, desde, hasta):
+    n_tipos = len(tabla["tipos"])
+    n = len(GRAVEDADES)
+    seleccion = _mascara(tabla, desde, hasta) & (tabla["gravedad"] >= 0)
+    indice = tabla["tipo"][seleccion].astype(np.int64) * n + tabla["gravedad"][seleccion]
+    matriz = np.bincount(indice, minlength=n_tipos * n).reshape(n_tipos, n)
+    return {"tipos": tabla["tipos"], "gravedades": list(GRAVEDADES), "conteos": matriz.tolist()}
+
+
+def tipo_por_gravedad(ruta=EXCEL_PATH, desde=None, hasta=None):
+    """Tabla cruzada de tipo de incidencia (filas) por gravedad (columnas)."""
+    return _vista(ruta, "cruce", _calc_cruce, desde, hasta)
+
+
+def _calc_serie(tabla, periodo, desde, hasta):
+    seleccion = _mascara(tabla, desde, hasta) & (tabla["gravedad"] >= 0)
+    if not seleccion.any():
+        return []
+    periodos = _periodos(tabla["dia"][seleccion], periodo)
+    unicos, posicion = np.unique(periodos, return_inverse=True)
+    n = len(GRAVEDADES)
+    matriz = np.bincount(posicion * n + tabla["gravedad"][seleccion],
+                         minlength=len(unicos) * n).reshape(len(unicos), n)
+    return [
+        dict({"periodo": _inicio_periodo(p, periodo)}, **{g: int(matriz[i, j]) for j, g in enumerate(GRAVEDADES)})
+        for i, p in enumerate(unicos)
+    ]
+
+
+def serie_gravedad(ruta=EXCEL_PATH, periodo="mes", desde=None, hasta=None):
+    """Incidencias por semana o mes y gravedad: [{'periodo', 'Leve', 'Moderada', 'Grave'}]."""
+    return _vista(ruta, "serie", _calc_serie, periodo, desde, hasta)
+
+
+def _calc_conteo(tabla, campo, desde, hasta):
+    seleccion = _mascara(tabla, desde, hasta)
+    categorias = tabla[CATEGORIAS[campo]]
+    conteos = np.bincount(tabla[campo][seleccion], minlength=len(categorias))
+    orden = np.argsort(-conteos, kind="stable")
+    return [(categorias[i], int(conteos[i])) for i in orden if conteos[i]]
+
+
+def conteo_por(campo, ruta=EXCEL_PATH, desde=None, hasta=None):
+    """Incidencias por 'lugar' o 'tipo', de mayor a menor: [(categoria, n)]."""
+    if campo not in CATEGORIAS:
+        raise ValueError(f"Campo no válido: {campo}")
+    return _vista(ruta, "conteo", _calc_conteo, campo, desde, hasta)
+
+
+def _calc_semanal(tabla, semanas, hoy):
+    semana_actual = (_dia(hoy, {}) + DESFASE_SEMANA) // 7
+    primera = semana_actual - semanas
+    # Se calcula una semana más para tener la variación de la primera
+    seleccion = tabla["dia"] != SIN_FECHA
+    semana = (tabla["dia"][seleccion].astype(np.int64) + DESFASE_SEMANA) // 7
+    gravedad = tabla["gravedad"][seleccion].astype(np.int64)
+    en_rango = (semana >= primera) & (semana <= semana_actual)
+    posicion = semana[en_rango] - primera
+    gravedad = gravedad[en_rango]
+    n = len(GRAVEDADES)
+    totales = np.bincount(posicion, minlength=semanas + 1)
+    valida = gravedad >= 0
+    por_gravedad = np.bincount(posicion[valida] * n + gravedad[valida],
+                               minlength=(semanas + 1) * n).reshape(semanas + 1, n)
+    resultado = []
+    for i in range(1, semanas + 1):
+        anterior = int(totales[i - 1])
+        actual = int(totales[i])
+        fila = {"semana": _fecha((primera + i) * 7 - DESFASE_SEMANA), "total": actual,
+                "variacion": actual - anterior,
+                "variacion_pct": round((actual - anterior) * 100.0 / anterior, 1) if anterior else None}
+        fila.update({g: int(por_gravedad[i, j]) for j, g in enumerate(GRAVEDADES)})
+        resultado.append(fila)
+    return resultado
+
+
+def variacion_semanal(ruta=EXCEL_PATH, semanas=8, hoy=None):
+    """
+    Incidencias de las últimas 'semanas' semanas (la actual incluida) con su variación
+    respecto a la semana anterior: [{'semana', 'total', 'variacion', 'variacion_pct', ...}].
+    """
+    hoy = str(hoy or date.today())[:10]
+    return _vista(ruta, "semanal", _calc_semanal, semanas, hoy)
+
+
+# --- Línea de comandos ---
+
+def _imprimir_matriz(filas, columnas, conteos, ancho=22):
+    usadas = [j for j in range(len(columnas)) if any(c[j] for c in conteos)]
+    print(f"{'':<{ancho}}" + "".join(f"{str(columnas[j]):>9}" for j in usadas))
+    for nombre, fila in zip(filas, conteos):
+        print(f"{str(nombre)[:ancho - 1]:<{ancho}}" + "".join(f"{fila[j]:>9}" for j in usadas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análisis del historial de incidencias.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--desde", help="Fecha inicial AAAA-MM-DD.")
+    parser.add_argument("--hasta", help="Fecha final AAAA-MM-DD.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_rein = sub.add_parser("reincidentes", help="Alumnos con más incidencias.")
+    p_rein.add_argument("--top", type=int, default=10)
+    p_rein.add_argument("--minimo", type=int, default=2)
+    p_tend = sub.add_parser("tendencia", help="Incidencias de un alumno por semana o mes.")
+    p_tend.add_argument("alumno")
+    p_tend.add_argument("--mes", action="store_true", help="Agrupar por mes en lugar de por semana.")
+    sub.add_parser("mapa", help="Incidencias por lugar y hora.")
+    sub.add_parser("cruce", help="Tipo de incidencia por gravedad.")
+    p_sem = sub.add_parser("semanal", help="Variación semana contra semana.")
+    p_sem.add_argument("--semanas", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.comando == "reincidentes":
+        print(f"{'Alumno':<35} {'Total':>6} {'Leve':>6} {'Mod.':>6} {'Grave':>6}  Última")
+        for r in reincidentes(args.excel, args.top, args.minimo, args.desde, args.hasta):
+            print(f"{r['alumno'][:34]:<35} {r['total']:>6} {r['Leve']:>6} {r['Moderada']:>6} "
+                  f"{r['Grave']:>6}  {r['ultima'] or ''}")
+    elif args.comando == "tendencia":
+        filas = tendencia_alumno(args.alumno, args.excel, "mes" if args.mes else "semana")
+        if not filas:
+            print(f"No hay incidencias de {args.alumno}.")
+        for r in filas:
+            print(f"{r['periodo']:<12} {r['total']:>4}  " + "  ".join(f"{g}: {r[g]}" for g in GRAVEDADES))
+    elif args.comando == "mapa":
+        m = mapa_lugar_hora(args.excel, args.desde, args.hasta)
+        _imprimir_matriz(m["lugares"], [f"{h}h" for h in m["horas"]], m["conteos"])
+    elif args.comando == "cruce":
+        c = tipo_por_gravedad(args.excel, args.desde, args.hasta)
+        _imprimir_matriz(c["tipos"], c["gravedades"], c["conteos"], ancho=30)
+    else:
+        for r in variacion_semanal(args.excel, args.semanas):
+            pct = f"{r['variacion_pct']:+.1f}%" if r["variacion_pct"] is not None else "-"
+            print(f"{r['semana']}  {r['total']:>5}  {r['variacion']:+5d}  {pct:>8}")
+
+
+if __name__ == "__main__":
+    main()
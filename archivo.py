@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: archivo.py
+Descripción: Empaquetado mensual de los documentos Word de incidencias. Los .docx de
+             meses cerrados se guardan en un solo paquete comprimido por mes
+             (incidencias/archivo/AAAA-MM.paq) con un índice al lado (AAAA-MM.json).
+
+             Cada .docx es un zip; en el paquete se guarda cada parte por separado,
+             comprimida con zlib, y las imágenes (los logos del encabezado, que se
+             repiten en todos los documentos) se guardan una sola vez por contenido.
+             El índice guarda, por nombre de documento, la posición y el largo de
+             cada parte, así que extraer un documento no requiere recorrer el paquete.
+
+             Los links del Excel siguen apuntando a incidencias/<nombre>.docx;
+             resolver_documento() devuelve el archivo original si existe o lo extrae
+             del paquete del mes correspondiente. El mes sale del nombre del
+             documento; los documentos con otro nombre se empaquetan por su fecha de
+             modificación y su mes queda anotado en archivo/meses.json.
+
+                 python archivo.py empaquetar
+                 python archivo.py extraer incidencias/Incidencia_Rigo_20250301_101500.docx
+"""
+
+import os
+import io
+import re
+import copy
+import json
+import zlib
+import hashlib
+import zipfile
+import argparse
+from datetime import datetime
+
+from metricas import medir
+
+INCIDENCIAS_DIR = "incidencias"
+ARCHIVO_SUBDIR = "archivo"
+EXTRAIDOS_SUBDIR = "extraidos"
+MESES_ARCHIVO = "meses.json"
+PREFIJO_MEDIA = "word/media/"
+NIVEL_COMPRESION = 9
+# Fecha y hora del nombre que genera servicio.reservar_nombre_documento
+PATRON_FECHA_NOMBRE = re.compile(r"_(\d{4})(\d{2})\d{2}_\d{6}(?:_\d+)?\.docx$", re.IGNORECASE)
+
+# Caché de índices: ruta del índice -> (mtime_ns, índice)
+_cache_indices = {}
+
+
+def _dir_archivo(directorio):
+    return os.path.join(directorio, ARCHIVO_SUBDIR)
+
+
+def mes_documento(ruta):
+    """Mes 'AAAA-MM' del documento, según su nombre o, si no, su fecha de modificación."""
+    mes = mes_documento_por_nombre(os.path.basename(ruta))
+    if mes:
+        return mes
+    return datetime.fromtimestamp(os.path.getmtime(ruta)).strftime("%Y-%m")
+
+
+def mes_documento_por_nombre(nombre):
+    """Mes 'AAAA-MM' tomado del nombre del documento, o None."""
+    m = PATRON_FECHA_NOMBRE.search(nombre)
+    return f"{m.group(1)}-{m.group(2)}" if m else None
+
+
+def _ruta_meses(directorio):
+    return os.path.join(_dir_archivo(directorio), MESES_ARCHIVO)
+
+
+def _leer_meses(directorio):
+    """{nombre: mes} de los documentos empaquetados cuyo nombre no trae la fecha (con caché)."""
+    ruta = _ruta_meses(directorio)
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except OSError:
+        return {}
+    en_cache = _cache_indices.get(ruta)
+    if en_cache and en_cache[0] == mtime:
+        return en_cache[1]
+    with open(ruta, encoding="utf-8") as f:
+        meses = json.load(f)
+    _cache_indices[ruta] = (mtime, meses)
+    return meses
+
+
+def mes_empaquetado(nombre, directorio=INCIDENCIAS_DIR):
+    """Mes del paquete donde está (o estaría) el documento 'nombre', o None."""
+    return mes_documento_por_nombre(nombre) or _leer_meses(directorio).get(nombre)
+
+
+def _rutas_paquete(mes, directorio):
+    base = os.path.join(_dir_archivo(directorio), mes)
+    return base + ".paq", base + ".json"
+
+
+def _indice_vacio():
+    return {"version": 1, "documentos": {}, "media": {}}
+
+
+def leer_indice(mes, directorio=INCIDENCIAS_DIR):
+    """Índice del paquete de un mes (con caché), o None si no existe."""
+    _, ruta_indice = _rutas_paquete(mes, directorio)
+    try:
+        mtime = os.stat(ruta_indice).st_mtime_ns
+    except OSError:
+        return None
+    en_cache = _cache_indices.get(ruta_indice)
+    if en_cache and en_cache[0] == mtime:
+        return en_cache[1]
+    with open(ruta_indice, encoding="utf-8") as f:
+        indice = json.load(f)
+    _cache_indices[ruta_indice] = (mtime, indice)
+    return indice
+
+
+def _escribir_indice(ruta_indice, indice):
+    temporal = ruta_indice + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(indice, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta_indice)
+
+
+def _agregar_documento(paquete, indice, ruta_doc):
+    """Agrega las partes de un .docx al final del paquete y las registra en el índice."""
+    miembros = []
+    with zipfile.ZipFile(ruta_doc) as zf:
+        for info in zf.infolist():
+            datos = zf.read(info)
+            if info.filename.startswith(PREFIJO_MEDIA):
+                clave = hashlib.sha1(datos).hexdigest()
+                if clave not in indice["media"]:
+                    # Las imágenes ya vienen comprimidas; se guardan tal cual
+                    offset = paquete.seek(0, os.SEEK_END)
+                    paquete.write(datos)
+                    indice["media"][clave] = [offset, len(datos)]
+                miembros.append([info.filename, "m", clave])
+            else:
+                comprimido = zlib.compress(datos, NIVEL_COMPRESION)
+                offset = paquete.seek(0, os.SEEK_END)
+                paquete.write(comprimido)
+                miembros.append([info.filename, "z", offset, len(comprimido)])
+    indice["documentos"][os.path.basename(ruta_doc)] = miembros
+
+
+def documentos_para_empaquetar(directorio=INCIDENCIAS_DIR, hasta_mes=None):
+    """
+    {mes: [rutas]} de los .docx sueltos del directorio cuyo mes ya cerró
+    (anterior a hasta_mes, por defecto el mes actual).
+    """
+    hasta_mes = hasta_mes or datetime.now().strftime("%Y-%m")
+    por_mes = {}
+    with os.scandir(directorio) as it:
+        for entrada in it:
+            if not entrada.is_file() or not entrada.name.lower().endswith(".docx") or entrada.name.startswith("~$"):
+                continue
+            if entrada.stat().st_size == 0:
+                # Nombre reservado de un documento que aún se está generando
+                continue
+            mes = mes_documento(entrada.path)
+            if mes < hasta_mes:
+                por_mes.setdefault(mes, []).append(entrada.path)
+    return por_mes
+
+
+def empaquetar(directorio=INCIDENCIAS_DIR, hasta_mes=None, borrar_originales=True):
+    """
+    Empaqueta los documentos de meses cerrados. Los originales se borran solo después
+    de que el paquete y su índice quedaron escritos en disco.
+    Devuelve {mes: documentos_empaquetados}.
+    """
+    resultado = {}
+    os.makedirs(_dir_archivo(directorio), exist_ok=True)
+    for mes, rutas in sorted(documentos_para_empaquetar(directorio, hasta_mes).items()):
+        ruta_paq, ruta_indice = _rutas_paquete(mes, directorio)
+        # Copia: el índice en caché no debe cambiar si el empaquetado falla a medias
+        indice = copy.deepcopy(leer_indice(mes, directorio)) or _indice_vacio()
+        nuevos = []
+        with medir("archivo.empaquetar", archivo=ruta_paq, mes=mes):
+            with open(ruta_paq, "ab") as paquete:
+                for ruta_doc in sorted(rutas):
+                    if os.path.basename(ruta_doc) in indice["documentos"]:
+                        nuevos.append(ruta_doc)
+                        continue
+                    try:
+                        _agregar_documento(paquete, indice, ruta_doc)
+                    except zipfile.BadZipFile:
+                        continue
+                    nuevos.append(ruta_doc)
+                paquete.flush()
+                os.fsync(paquete.fileno())
+            _escribir_indice(ruta_indice, indice)
+            sin_fecha = {os.path.basename(r): mes for r in nuevos
+                         if not mes_documento_por_nombre(os.path.basename(r))}
+            if sin_fecha:
+                _escribir_indice(_ruta_meses(directorio), dict(_leer_meses(directorio), **sin_fecha))
+        if borrar_originales:
+            for ruta_doc in nuevos:
+                os.remove(ruta_doc)
+        resultado[mes] = len(nuevos)
+    return resultado
+
+
+def extraer_bytes(nombre, mes=None, directorio=INCIDENCIAS_DIR):
+    """Reconstruye el .docx 'nombre' desde su paquete. Devuelve los bytes o None."""
+    mes = mes or mes_empaquetado(nombre, directorio)
+    indice = leer_indice(mes, directorio) if mes else None
+    if not indice or nombre not in indice["documentos"]:
+        return None
+    ruta_paq, _ = _rutas_paquete(mes, directorio)
+    salida = io.BytesIO()
+    with open(ruta_paq, "rb") as paquete, zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for miembro in indice["documentos"][nombre]:
+            if miembro[1] == "m":
+                offset, largo = indice["media"][miembro[2]]
+                paquete.seek(offset)
+                zf.writestr(miembro[0], paquete.read(largo), compress_type=zipfile.ZIP_STORED)
+            else:
+                paquete.seek(miembro[2])
+                zf.writestr(miembro[0], zlib.decompress(paquete.read(miembro[3])))
+    return salida.getvalue()
+
+
+def esta_empaquetado(link, directorio=None):
+    """
+    Indica si el documento del link está dentro de algún paquete mensual. Por
+    defecto se busca en la carpeta del propio link.
+    """
+    directorio = directorio or os.path.dirname(link or "") or INCIDENCIAS_DIR
+    nombre = os.path.basename(link or "")
+    mes = mes_empaquetado(nombre, directorio)
+    indice = leer_indice(mes, directorio) if mes else None
+    return bool(indice and nombre in indice["documentos"])
+
+
+def resolver_documento(link, directorio=None):
+    """
+    Devuelve una ruta legible para el link del Excel: el archivo original si existe,
+    o una copia extraída del paquete mensual (se reutiliza si ya se extrajo). Por
+    defecto el paquete se busca en la carpeta del propio link.
+    Devuelve None si el documento no está en ningún lado.
+    """
+    if link and os.path.exists(link):
+        return link
+    directorio = directorio or os.path.dirname(link or "") or INCIDENCIAS_DIR
+    nombre = os.path.basename(link or "")
+    destino = os.path.join(_dir_archivo(directorio), EXTRAIDOS_SUBDIR, nombre)
+    if os.path.exists(destino):
+        return destino
+    datos = extraer_bytes(nombre, directorio=directorio)
+    if datos is None:
+        return None
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "wb") as f:
+        f.write(datos)
+    return destino
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paquetes mensuales de documentos de incidencias.")
+    parser.add_argument("--directorio", default=INCIDENCIAS_DIR)
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_emp = sub.add_parser("empaquetar", help="Empaqueta los documentos de meses cerrados.")
+    p_emp.add_argument("--hasta-mes", help="Empaquetar meses anteriores a AAAA-MM (por defecto el actual).")
+    p_emp.add_argument("--conservar", action="store_true", help="No borrar los documentos originales.")
+    p_ext = sub.add_parser("extraer", help="Extrae un documento a partir de su link.")
+    p_ext.add_argument("link")
+    args = parser.parse_args()
+
+    if args.comando == "empaquetar":
+        resultado = empaquetar(args.directorio, args.hasta_mes, borrar_originales=not args.conservar)
+        if not resultado:
+            print("No hay documentos de meses cerrados.")
+        for mes, n in resultado.items():
+            print(f"{mes}: {n} documentos")
+    else:
+        ruta = resolver_documento(args.link, args.directorio)
+        print(ruta if ruta else f"No se encontró el documento: {args.link}")
+
+
+if __name__ == "__main__":
+    main()
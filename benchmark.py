@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: benchmark.py
+Descripción: Mediciones reproducibles del registro de incidencias. Genera datos
+             sintéticos con una semilla fija (alumnos, incidencias y participantes)
+             y mide cada etapa con distintos tamaños:
+
+                 - generar_word con 1 a 70 firmantes
+                 - registrar_incidencia y actualizar_dashboard con 100 a 100k filas
+                 - lectura/escritura de alumnos.json (pestaña de administración)
+
+             Cada caso corre en un proceso nuevo para que el pico de memoria (RSS) sea
+             el de ese caso. Los resultados se guardan en JSON y se pueden comparar
+             contra una corrida anterior para detectar regresiones:
+
+                 python benchmark.py
+                 python benchmark.py --filas 100,1000 --comparar benchmarks/base.json
+
+             Con --memoria se genera en cambio un reporte de memoria (tracemalloc)
+             de las lecturas del Excel: carga completa contra lectura en streaming.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+RESULTADOS_DIR = "benchmarks"
+SEMILLA = 2025
+FILAS = [100, 1000, 10000, 100000]
+FIRMANTES = [1, 5, 10, 35, 70]
+ALUMNOS = [100, 1000, 10000]
+# Porcentaje de aumento (tiempo, memoria o tamaño) a partir del cual se marca regresión
+UMBRAL_REGRESION = 0.20
+
+NOMBRES = ["Ana", "Luis", "María", "José", "Sofía", "Diego", "Valeria", "Carlos", "Lucía", "Jorge",
+           "Fernanda", "Miguel", "Camila", "Andrés", "Paula", "Ricardo", "Daniela", "Emilio"]
+APELLIDOS = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez",
+             "Ramírez", "Flores", "Torres", "Vázquez", "Morales", "Reyes", "Cruz", "Ortiz"]
+LUGARES = ["El patio", "El salón", "Los baños", "La biblioteca", "El comedor"]
+TIPOS = ["Indisciplina", "Agresión física", "Agresión verbal", "Bullying", "Vandalismo",
+         "Falta de respeto al personal"]
+GRAVEDADES = ["Leve", "Moderada", "Grave"]
+PESOS_GRAVEDAD = [0.6, 0.3, 0.1]
+PALABRAS = ("el alumno se encontraba jugando cuando empujó a su compañero durante el recreo y "
+            "al ser llamado la atención respondió con groserías frente al grupo se habló con "
+            "ambos en la dirección y se acordó avisar a los padres de familia").split()
+
+
+# --- Generación de datos sintéticos ---
+
+def generar_alumnos(n, rng):
+    """Lista de alumnos con el formato de alumnos.json."""
+    alumnos = []
+    for i in range(n):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)} {i}"
+        alumnos.append({
+            "nombre": nombre,
+            "padre": f"{rng.choice(NOMBRES)} {nombre.split()[1]}",
+            "grado": str(rng.randint(1, 6)),
+            "grupo": rng.choice("ABCD"),
+        })
+    return alumnos
+
+
+def generar_incidencia(rng, alumnos, n_participantes=None, fecha=None):
+    """Incidencia con los mismos campos que arma generar_doc."""
+    if n_participantes is None:
+        n_participantes = min(len(alumnos), rng.choice([1, 1, 1, 2, 2, 3, 4]))
+    participantes = [{"nombre": a["nombre"], "grado": a["grado"], "grupo": a["grupo"]}
+                     for a in rng.sample(alumnos, n_participantes)]
+    if fecha is None:
+        fecha = datetime(2024, 8, 26) + timedelta(days=rng.randint(0, 300))
+    return {
+        "fecha": fecha.strftime("%Y-%m-%d"),
+        "hora": f"{rng.randint(7, 14):02d}:{rng.randint(0, 59):02d}",
+        "lugar": rng.choice(LUGARES),
+        "actividad": "el recreo",
+        "tipo_inc": rng.choice(TIPOS),
+        "gravedad": rng.choices(GRAVEDADES, PESOS_GRAVEDAD)[0],
+        "narracion": " ".join(rng.choice(PALABRAS) for _ in range(rng.randint(20, 80))),
+        "medidas": "Se habló con los alumnos.",
+        "seguimiento": "Revisar la próxima semana.",
+        "participantes": participantes,
+    }
+
+
+def generar_excel(ruta, n_filas, rng, alumnos):
+    """Crea un bitacoras.xlsx con n_filas incidencias (en modo de solo escritura)."""
+    from excelgen import ENCABEZADO_INCIDENCIAS, formatear_participantes
+
+    wb = Workbook(write_only=True)
+    ws_dash = wb.create_sheet("Dashboard")
+    ws_dash.append(["Dashboard de Incidencias"])
+    ws_inc = wb.create_sheet("Incidencias")
+    ws_inc.append(ENCABEZADO_INCIDENCIAS)
+    inicio = datetime(2020, 8, 24)
+    for i in range(n_filas):
+        inc = generar_incidencia(rng, alumnos, fecha=inicio + timedelta(minutes=97 * i))
+        ws_inc.append([inc["fecha"], inc["hora"], inc["lugar"], inc["gravedad"],
+                       formatear_participantes(inc["participantes"]),
+                       os.path.join("incidencias", f"Incidencia_{i}.docx"), inc["tipo_inc"]])
+    ws_faltas = wb.create_sheet("Registro de Faltas")
+    ws_faltas.append(["Alumno", "Total de Faltas", "Leve", "Moderada", "Grave"])
+    wb.save(ruta)
+
+
+# --- Casos de medición ---
+
+def _caso_word(tmp, rng, firmantes):
+    from wordgen import generar_word
+
+    alumnos = generar_alumnos(max(firmantes, 10), rng)
+    inc = generar_incidencia(rng, alumnos, n_participantes=firmantes)
+    inc["gravedad"] = "Grave"
+    padres = {a["nombre"]: a["padre"] for a in alumnos}
+    salida = os.path.join(tmp, "doc.docx")
+    inicio = time.perf_counter()
+    generar_word(**inc, padres_dict=padres, output_path=salida, school_name="Escuela",
+                 director_name="Director", teacher_name="Maestro", grade="6", group="A",
+                 location="Ciudad")
+    return time.perf_counter() - inicio, os.path.getsize(salida)
+
+
+def _caso_registrar(tmp, rng, filas):
+    from excelgen import registrar_incidencia
+
+    alumnos = generar_alumnos(200, rng)
+    ruta = os.path.join(tmp, "bitacoras.xlsx")
+    generar_excel(ruta, filas, rng, alumnos)
+    inc = generar_incidencia(rng, alumnos)
+    inc["link"] = os.path.join("incidencias", "nuevo.docx")
+    inicio = time.perf_counter()
+    registrar_incidencia(inc, ruta=ruta)
+    return time.perf_counter() - inicio, os.path.getsize(ruta)
+
+
+def _caso_dashboard(tmp, rng, filas):
+    from excelgen import actualizar_dashboard
+
+    ruta = os.path.join(tmp, "bitacoras.xlsx")
+    generar_excel(ruta, filas, rng, generar_alumnos(200, rng))
+    inicio = time.perf_counter()
+    actualizar_dashboard(ruta=ruta)
+    return time.perf_counter() - inicio, os.path.getsize(ruta)
+
+
+def _caso_json_alumnos(tmp, rng, n):
+    from json_manager import leer_json, escribir_json
+
+    ruta = os.path.join(tmp, "alumnos.json")
+    escribir_json(ruta, generar_alumnos(n, rng))
+    inicio = time.perf_counter()
+    # Lo que hace guardar_cambios_alumno: leer, modificar un alumno y reescribir todo
+    alumnos = leer_json(ruta, [])
+    alumnos[len(alumnos) // 2]["grupo"] = "Z"
+    escribir_json(ruta, alumnos)
+    return time.perf_counter() - inicio, os.path.getsize(ruta)
+
+
+CASOS = {
+    "generar_word": _caso_word,
+    "registrar_incidencia": _caso_registrar,
+    "actualizar_dashboard": _caso_dashboard,
+    "json_alumnos": _caso_json_alumnos,
+}
+
+
+def _pico_memoria_kb():
+    """Pico de memoria residente del proceso en KB, o None si no se puede medir."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En macOS ru_maxrss viene en bytes, en Linux en KB
+    return pico // 1024 if sys.platform == "darwin" else pico
+
+
+def _ejecutar_caso(etapa, parametro, semilla, cola):
+    rng = random.Random(f"{semilla}-{etapa}-{parametro}")
+    tmp = tempfile.mkdtemp(prefix="bench_bitacoras_")
+    try:
+        usar_tracemalloc = _pico_memoria_kb() is None
+        if usar_tracemalloc:
+            tracemalloc.start()
+        segundos, tamano = CASOS[etapa](tmp, rng, parametro)
+        if usar_tracemalloc:
+            pico_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        else:
+            pico_kb = _pico_memoria_kb()
+        cola.put({"segundos": segundos, "pico_kb": pico_kb, "bytes_salida": tamano})
+    except Exception as e:
+        cola.put({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def medir(etapa, parametro, semilla=SEMILLA):
+    """Ejecuta un caso en un proceso nuevo y devuelve sus mediciones."""
+    ctx = multiprocessing.get_context("spawn")
+    cola = ctx.Queue()
+    proceso = ctx.Process(target=_ejecutar_caso, args=(etapa, parametro, semilla, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    resultado.update({"etapa": etapa, "parametro": parametro})
+    return resultado
+
+
+def ejecutar(filas=FILAS, firmantes=FIRMANTES, alumnos=ALUMNOS, semilla=SEMILLA, progreso=print):
+    """Corre todos los casos y devuelve el documento de resultados."""
+    plan = [("generar_word", n) for n in firmantes]
+    plan += [(etapa, n) for n in filas for etapa in ("registrar_incidencia", "actualizar_dashboard")]
+    plan += [("json_alumnos", n) for n in alumnos]
+
+    resultados = []
+    for etapa, parametro in plan:
+        r = medir(etapa, parametro, semilla)
+        resultados.append(r)
+        if progreso:
+            if "error" in r:
+                progreso(f"{etapa:<22} {parametro:>7}  ERROR {r['error']}")
+            else:
+                progreso(f"{etapa:<22} {parametro:>7}  {r['segundos'] * 1000:9.1f} ms  "
+                         f"{r['pico_kb'] or 0:>8} KB  {r['bytes_salida']:>10} B")
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "semilla": semilla,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+
+
+def comparar(actual, base, umbral=UMBRAL_REGRESION):
+    """
+    Compara dos corridas caso por caso. Devuelve la lista de regresiones:
+    (etapa, parametro, metrica, valor_base, valor_actual).
+    """
+    indice = {(r["etapa"], r["parametro"]): r for r in base["resultados"] if "error" not in r}
+    regresiones = []
+    for r in actual["resultados"]:
+        anterior = indice.get((r["etapa"], r["parametro"]))
+        if anterior is None or "error" in r:
+            continue
+        for metrica in ("segundos", "pico_kb", "bytes_salida"):
+            antes, ahora = anterior.get(metrica), r.get(metrica)
+            if antes and ahora and ahora > antes * (1 + umbral):
+                regresiones.append((r["etapa"], r["parametro"], metrica, antes, ahora))
+    return regresiones
+
+
+def _contar_carga_completa(ruta):
+    """Conteo por gravedad como se hacía antes: cargando el libro completo."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(ruta)
+    conteo = {g: 0 for g in GRAVEDADES}
+    for row in wb["Incidencias"].iter_rows(min_row=2, max_col=4, values_only=True):
+        if row and row[3] in conteo:
+            conteo[row[3]] += 1
+    return conteo
+
+
+def reporte_memoria(filas=FILAS, semilla=SEMILLA, progreso=print):
+    """
+    Pico de memoria Python (tracemalloc) de cada lectura del Excel según el número de
+    filas. Las lecturas en streaming deben mantenerse casi planas; la carga completa
+    crece con el tamaño del libro.
+    """
+    from excelgen import contar_por_gravedad, contar_faltas, buscar_incidencias
+
+    lecturas = {
+        "carga_completa": _contar_carga_completa,
+        "contar_por_gravedad": contar_por_gravedad,
+        "contar_faltas": contar_faltas,
+        "buscar_incidencias": lambda ruta: sum(1 for _ in buscar_incidencias(ruta, gravedad="Grave")),
+    }
+    resultados = []
+    tmp = tempfile.mkdtemp(prefix="bench_bitacoras_")
+    try:
+        for n in filas:
+            rng = random.Random(f"{semilla}-memoria-{n}")
+            ruta = os.path.join(tmp, f"bitacoras_{n}.xlsx")
+            generar_excel(ruta, n, rng, generar_alumnos(200, rng))
+            for nombre, lectura in lecturas.items():
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                lectura(ruta)
+                segundos = time.perf_counter() - inicio
+                pico_kb = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+                resultados.append({"lectura": nombre, "filas": n, "pico_kb": pico_kb, "segundos": segundos})
+                if progreso:
+                    progreso(f"{nombre:<22} {n:>7}  {pico_kb:>9} KB  {segundos * 1000:9.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "semilla": semilla,
+        "python": platform.python_version(),
+        "memoria": resultados,
+    }
+
+
+def _lista_enteros(texto):
+    return [int(x) for x in texto.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mediciones reproducibles del registro de incidencias.")
+    parser.add_argument("--filas", type=_lista_enteros, default=FILAS, help="Tamaños del Excel, ej. 100,1000")
+    parser.add_argument("--firmantes", type=_lista_enteros, default=FIRMANTES)
+    parser.add_argument("--alumnos", type=_lista_enteros, default=ALUMNOS)
+    parser.add_argument("--semilla", type=int, default=SEMILLA)
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto en benchmarks/).")
+    parser.add_argument("--comparar", help="Resultados anteriores contra los cuales comparar.")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION)
+    parser.add_argument("--memoria", action="store_true", help="Reporte de memoria de las lecturas del Excel.")
+    args = parser.parse_args()
+
+    if args.memoria:
+        corrida = reporte_memoria(args.filas, args.semilla)
+        prefijo = "memoria"
+    else:
+        corrida = ejecutar(args.filas, args.firmantes, args.alumnos, args.semilla)
+        prefijo = "resultados"
+    salida = args.salida or os.path.join(
+        RESULTADOS_DIR, f"{prefijo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(corrida, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}")
+
+    if args.comparar and not args.memoria:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(corrida, base, args.umbral)
+        for etapa, parametro, metrica, antes, ahora in regresiones:
+            print(f"REGRESIÓN {etapa} ({parametro}) {metrica}: {antes} -> {ahora}")
+        if regresiones:
+            sys.exit(1)
+        print("Sin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: cartas.py
+Descripción: Cartas de notificación a padres de familia por incidencias graves,
+             generadas en lote a partir de una plantilla de Word compartida.
+
+             La plantilla (por defecto data/plantillas/carta_padres.docx, con el
+             mismo encabezado y logos de la bitácora) contiene campos como
+             {{padre}} o {{detalle}}. Se compila una sola vez: se leen sus partes y
+             el XML del cuerpo se divide en trozos fijos y campos. Cada carta es la
+             unión de esos trozos con los valores escapados para XML, sin volver a
+             construir el documento con python-docx.
+
+             Se genera una carta por alumno, dirigida a su padre o madre, con todas
+             sus incidencias graves del periodo (dos hermanos reciben cartas
+             separadas aunque tengan el mismo padre), en archivos separados o unidas
+             en un solo documento (una carta por página) para imprimir.
+
+                 python cartas.py                              (últimos 7 días)
+                 python cartas.py --desde 2025-03-03 --hasta 2025-03-07 --unir
+
+             La plantilla se puede editar en Word; los campos disponibles son:
+             {{padre}}, {{alumnos}}, {{detalle}}, {{fecha}}, {{escuela}},
+             {{ubicacion}}, {{director}} y {{maestro}}.
+"""
+
+import os
+import re
+import zipfile
+import argparse
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from docx.shared import Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from wordgen import nuevo_documento, agregar_encabezado, agregar_titulo
+from excelgen import EXCEL_PATH, nombres_participantes
+from rotacion import libros_del_periodo
+import json_manager as jm
+from metricas import medir
+import columnar
+
+PLANTILLA_CARTA = os.path.join(jm.DATA_DIR, "plantillas", "carta_padres.docx")
+CARTAS_DIR = "cartas"
+PARTE_DOCUMENTO = "word/document.xml"
+DIAS_PREDETERMINADOS = 7
+# Un campo {{nombre}}; Word puede partirlo en varios runs al editar la plantilla,
+# así que se aceptan etiquetas XML entre sus caracteres.
+_ETIQUETA = r"(?:<[^>]*>)*"
+PATRON_CAMPO = re.compile(r"\{" + _ETIQUETA + r"\{" + _ETIQUETA + r"((?:[a-z_]" + _ETIQUETA + r")+)\}"
+                          + _ETIQUETA + r"\}")
+SALTO_LINEA = '</w:t><w:br/><w:t xml:space="preserve">'
+SALTO_PAGINA = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# Caché de plantillas compiladas: ruta -> (mtime_ns, plantilla)
+_plantillas = {}
+
+
+# --- Plantilla ---
+
+def crear_plantilla(ruta=PLANTILLA_CARTA):
+    """Crea la plantilla predeterminada con el encabezado de la bitácora."""
+    doc = nuevo_documento()
+    agregar_encabezado(doc)
+    agregar_titulo(doc, "NOTIFICACIÓN A PADRES DE FAMILIA - {{escuela}}", "{{ubicacion}}")
+
+    p = doc.add_paragraph("{{ubicacion}}, a {{fecha}}")
+    p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    doc.add_paragraph()
+    doc.add_paragraph("Estimado(a) {{padre}}:")
+    textos = [
+        "Por medio de la presente le informamos que su hijo(a) {{alumnos}} participó en las "
+        "siguientes incidencias, clasificadas como graves de acuerdo con el reglamento escolar:",
+        "{{detalle}}",
+        "Le solicitamos presentarse en la dirección de la escuela a la brevedad posible para "
+        "tratar lo sucedido y acordar las medidas de seguimiento correspondientes.",
+        "Sin más por el momento, agradecemos su atención.",
+    ]
+    for texto in textos:
+        p = doc.add_paragraph(texto)
+        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+        for run in p.runs:
+            run.font.size = Pt(12)
+    doc.add_paragraph()
+    p = doc.add_paragraph("Atentamente\n\n\n_______________________________\n{{director}}\nDirector(a)"
+                          "\n\n\n_______________________________\n{{maestro}}\nMaestro(a) de grupo")
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.add_paragraph()
+    doc.add_paragraph("Nombre y firma de enterado: _______________________________")
+
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    doc.save(ruta)
+    return ruta
+
+
+def compilar_plantilla(ruta=PLANTILLA_CARTA):
+    """
+    Lee la plantilla y la divide en partes fijas. Devuelve un diccionario con las
+    partes del .docx, el XML antes y después del cuerpo y el cuerpo como lista de
+    trozos fijos intercalados con nombres de campo. Se reutiliza mientras la
+    plantilla no cambie.
+    """
+    if not os.path.exists(ruta):
+        crear_plantilla(ruta)
+    mtime = os.stat(ruta).st_mtime_ns
+    en_cache = _plantillas.get(ruta)
+    if en_cache and en_cache[0] == mtime:
+        return en_cache[1]
+
+    with medir("cartas.compilar", archivo=ruta):
+        with zipfile.ZipFile(ruta) as zf:
+            partes = [(info.filename, zf.read(info)) for info in zf.infolist()]
+        xml = dict(partes)[PARTE_DOCUMENTO].decode("utf-8")
+        inicio_cuerpo = xml.index("<w:body>") + len("<w:body>")
+        # El último sectPr (márgenes y referencia al encabezado) se escribe una sola vez
+        fin_cuerpo = xml.rindex("<w:sectPr")
+        cuerpo = xml[inicio_cuerpo:fin_cuerpo]
+
+        trozos, campos = [], []
+        posicion = 0
+        for m in PATRON_CAMPO.finditer(cuerpo):
+            trozos.append(cuerpo[posicion:m.start()])
+            campos.append(re.sub(r"<[^>]*>", "", m.group(1)))
+            posicion = m.end()
+        trozos.append(cuerpo[posicion:])
+        plantilla = {
+            "partes": [(nombre, datos) for nombre, datos in partes if nombre != PARTE_DOCUMENTO],
+            "antes": xml[:inicio_cuerpo],
+            "despues": xml[fin_cuerpo:],
+            "trozos": trozos,
+            "campos": campos,
+        }
+    _plantillas[ruta] = (mtime, plantilla)
+    return plantilla
+
+
+def _valor_xml(valor):
+    """Escapa el valor para XML; los saltos de línea se vuelven saltos de Word."""
+    return SALTO_LINEA.join(escape(linea) for linea in str(valor).split("\n"))
+
+
+def llenar_cuerpo(plantilla, valores):
+    """XML del cuerpo de una carta con los campos sustituidos."""
+    trozos, campos = plantilla["trozos"], plantilla["campos"]
+    salida = [trozos[0]]
+    for campo, trozo in zip(campos, trozos[1:]):
+        salida.append(_valor_xml(valores.get(campo, "")))
+        salida.append(trozo)
+    return "".join(salida)
+
+
+def _escribir_docx(plantilla, cuerpo, destino):
+    """Escribe el .docx con las partes de la plantilla y el cuerpo indicado."""
+    documento = (plantilla["antes"] + cuerpo + plantilla["despues"]).encode("utf-8")
+    temporal = destino + ".tmp"
+    with zipfile.ZipFile(temporal, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr(PARTE_DOCUMENTO, documento)
+        for nombre, datos in plantilla["partes"]:
+            zf.writestr(nombre, datos)
+    os.replace(temporal, destino)
+    return destino
+
+
+# --- Datos ---
+
+def incidencias_graves(desde, hasta, ruta=EXCEL_PATH):
+    """Incidencias graves del periodo en los libros del Excel que lo cubren."""
+    for libro in libros_del_periodo(ruta, desde, hasta):
+        for fila in columnar.leer_libro(libro):
+            if fila["gravedad"] == "Grave" and desde <= str(fila["fecha"])[:10] <= hasta:
+                yield fila
+
+
+def cartas_por_alumno(incidencias, alumnos):
+    """
+    Agrupa las incidencias por (padre o madre, alumno) de cada participante.
+    Devuelve [{'padre', 'alumnos': [alumno], 'incidencias': [...]}] ordenado por
+    nombre del padre y del alumno.
+    """
+    datos_alumno = {a.get("nombre"): a for a in alumnos}
+    cartas = {}
+    for inc in incidencias:
+        for nombre in nombres_participantes(inc["participantes"]):
+            alumno = datos_alumno.get(nombre, {})
+            padre = alumno.get("padre") or f"Padre/Madre de familia de {nombre}"
+            carta = cartas.setdefault((padre, nombre), {"padre": padre, "alumnos": [nombre], "incidencias": []})
+            carta["incidencias"].append(dict(inc, alumno=nombre))
+    return [cartas[clave] for clave in sorted(cartas)]
+
+
+def _unir_nombres(nombres):
+    return nombres[0] if len(nombres) == 1 else ", ".join(nombres[:-1]) + " y " + nombres[-1]
+
+
+def valores_carta(carta, config, fecha=None):
+    """Valores de los campos de la plantilla para una carta."""
+    detalle = []
+    for inc in carta["incidencias"]:
+        linea = f"• {str(inc['fecha'])[:10]}, {inc['hora']} horas, en {inc['lugar']}"
+        if inc.get("tipo"):
+            linea += f": {inc['tipo']}"
+        if len(carta["alumnos"]) > 1:
+            linea += f" ({inc['alumno']})"
+        detalle.append(linea)
+    return {
+        "padre": carta["padre"],
+        "alumnos": _unir_nombres(carta["alumnos"]),
+        "detalle": "\n".join(detalle),
+        "fecha": (fecha or date.today()).strftime("%d/%m/%Y"),
+        "escuela": config.get("school_name") or "",
+        "ubicacion": config.get("location") or "",
+        "director": config.get("director_name") or "",
+        "maestro": config.get("teacher_name") or "",
+    }
+
+
+# --- Generación ---
+
+def _nombre_archivo(texto):
+    return re.sub(r"[^\w]+", "_", texto).strip("_") or "carta"
+
+
+def generar_cartas(desde, hasta, unir=False, ruta=EXCEL_PATH, plantilla=PLANTILLA_CARTA,
+                   directorio=CARTAS_DIR, config=None, alumnos=None):
+    """
+    Genera las cartas de las incidencias graves entre desde y hasta. Devuelve la
+    lista de documentos creados (uno solo si unir es True).
+    """
+    config = jm.obtener_config() if config is None else config
+    alumnos = jm.obtener_alumnos() if alumnos is None else alumnos
+    compilada = compilar_plantilla(plantilla)
+    cartas = cartas_por_alumno(incidencias_graves(desde, hasta, ruta), alumnos)
+    if not cartas:
+        return []
+    os.makedirs(directorio, exist_ok=True)
+
+    with medir("cartas.generar", cartas=len(cartas), unidas=unir):
+        cuerpos = (llenar_cuerpo(compilada, valores_carta(c, config)) for c in cartas)
+        if unir:
+            destino = os.path.join(directorio, f"Cartas_{desde}_{hasta}.docx")
+            return [_escribir_docx(compilada, SALTO_PAGINA.join(cuerpos), destino)]
+        generadas = []
+        for carta, cuerpo in zip(cartas, cuerpos):
+            nombre = _nombre_archivo(f"{carta['padre']}_{carta['alumnos'][0]}")
+            destino = os.path.join(directorio, f"Carta_{nombre}_{desde}_{hasta}.docx")
+            generadas.append(_escribir_docx(compilada, cuerpo, destino))
+        return generadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cartas a padres de familia por incidencias graves.")
+    hoy = date.today()
+    parser.add_argument("--desde", default=(hoy - timedelta(days=DIAS_PREDETERMINADOS - 1)).isoformat())
+    parser.add_argument("--hasta", default=hoy.isoformat())
+    parser.add_argument("--unir", action="store_true", help="Un solo documento con todas las cartas.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--plantilla", default=PLANTILLA_CARTA)
+    parser.add_argument("--salida", default=CARTAS_DIR, help="Carpeta de las cartas.")
+    args = parser.parse_args()
+
+    generadas = generar_cartas(args.desde, args.hasta, args.unir, args.excel, args.plantilla, args.salida)
+    if not generadas:
+        print(f"No hay incidencias graves del {args.desde} al {args.hasta}.")
+    for ruta in generadas:
+        print(ruta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: columnar.py
+Descripción: Copia columnar de los libros de ciclos cerrados (ej.
+             data/bitacoras_2024-2025.xlsx -> data/bitacoras_2024-2025.columnas)
+             para leer años de historial sin interpretar el XML del Excel.
+
+             El archivo tiene un encabezado JSON (versión, firma del libro de origen,
+             diccionarios de lugares, tipos y alumnos, y la posición de cada sección)
+             seguido de secciones binarias alineadas a 8 bytes:
+                 dia (int32, días desde 1970-01-01), minutos (int16, -1 sin hora),
+                 gravedad (int8, índice en GRAVEDADES o -1), lugar y tipo (int32,
+                 código en su diccionario), part_inc y part_alumno (int32, pares
+                 incidencia-alumno), y el texto libre (participantes y link) como un
+                 montón UTF-8 con el fin de cada valor en un arreglo uint32.
+             Los valores de fecha, hora o gravedad que no se pueden codificar sin
+             cambiarlos (texto que no es fecha, hora con otro formato, gravedad
+             desconocida) se guardan tal cual en el encabezado ("crudos") y se
+             devuelven sin cambios al leer.
+
+             Se abre con mmap: las columnas son memoryview sobre el archivo (o
+             arreglos de NumPy con np.frombuffer) sin copiar ni interpretar nada.
+
+             Los libros de ciclos cerrados no cambian, así que su copia se genera la
+             primera vez que se leen y se reutiliza mientras la firma (tamaño y fecha
+             de modificación) del libro coincida. El libro actual se sigue leyendo del
+             Excel, salvo que tenga una copia al día generada a mano. Antes de
+             reemplazar una copia se cierra su mapeo (en Windows un archivo mapeado
+             no se puede reemplazar).
+
+                 python columnar.py                  (genera las copias de los ciclos cerrados)
+                 python columnar.py --actual         (también la del libro actual)
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from datetime import datetime, date, time, timedelta
+
+from excelgen import EXCEL_PATH, GRAVEDADES, leer_incidencias, nombres_participantes
+from rotacion import PATRON_ARCHIVO_CICLO, rutas_ledger
+from metricas import medir
+
+MAGICO = b"BITCOL01"
+VERSION = 2
+EXTENSION = ".columnas"
+EPOCA = date(1970, 1, 1)
+SIN_FECHA = -(2 ** 31)
+SIN_MINUTOS = -1
+SIN_GRAVEDAD = -1
+_LARGO = struct.Struct("<I")
+
+# Nombre de la sección -> código de tipo de array/memoryview
+SECCIONES = {
+    "dia": "i", "minutos": "h", "gravedad": "b", "lugar": "i", "tipo": "i",
+    "part_inc": "i", "part_alumno": "i", "participantes_fin": "I", "link_fin": "I",
+}
+MONTONES = ("participantes", "link")
+
+# Copias abiertas: ruta -> (firma del libro, columnas)
+_abiertos = {}
+
+
+def ruta_columnar(libro):
+    base, _ = os.path.splitext(libro)
+    return base + EXTENSION
+
+
+def es_cerrado(libro):
+    """Indica si el libro es de un ciclo escolar archivado."""
+    return bool(PATRON_ARCHIVO_CICLO.search(libro))
+
+
+def _firma(libro):
+    st = os.stat(libro)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _dia(valor, memo):
+    if isinstance(valor, datetime):
+        return (valor.date() - EPOCA).days
+    if isinstance(valor, date):
+        return (valor - EPOCA).days
+    texto = str(valor or "")[:10]
+    dia = memo.get(texto)
+    if dia is None:
+        try:
+            dia = (datetime.strptime(texto, "%Y-%m-%d").date() - EPOCA).days
+        except ValueError:
+            dia = SIN_FECHA
+        memo[texto] = dia
+    return dia
+
+
+def _minutos(valor):
+    if isinstance(valor, (datetime, time)):
+        return valor.hour * 60 + valor.minute
+    horas, _, minutos = str(valor or "").strip().partition(":")
+    try:
+        return (int(horas) % 24) * 60 + int(minutos[:2] or 0)
+    except ValueError:
+        return SIN_MINUTOS
+
+
+def _texto_fecha(dia):
+    return "" if dia == SIN_FECHA else (EPOCA + timedelta(days=dia)).isoformat()
+
+
+def _texto_hora(minutos):
+    return "" if minutos == SIN_MINUTOS else f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def _crudo(valor, decodificado):
+    """
+    Valor que hay que guardar tal cual porque no sale igual de las columnas, o None.
+    Las fechas y horas de Excel (datetime, time) se devuelven como texto normalizado.
+    """
+    if valor is None or isinstance(valor, (datetime, date, time)):
+        return None
+    if isinstance(valor, str):
+        return None if valor == decodificado else valor
+    return valor if isinstance(valor, (int, float)) else str(valor)
+
+
+# --- Escritura ---
+
+def generar(libro, destino=None):
+    """Escribe la copia columnar del libro. Devuelve su ruta."""
+    destino = destino or ruta_columnar(libro)
+    firma = _firma(libro)
+    columnas = {nombre: array(codigo) for nombre, codigo in SECCIONES.items()}
+    montones = {nombre: bytearray() for nombre in MONTONES}
+    codigos = {"lugar": {}, "tipo": {}, "alumno": {}}
+    codigo_gravedad = {g: i for i, g in enumerate(GRAVEDADES)}
+    memo_fechas = {}
+    crudos = {}
+
+    with medir("columnar.generar", archivo=libro) as extra:
+        n = 0
+        for fila in leer_incidencias(libro):
+            dia, minutos = _dia(fila["fecha"], memo_fechas), _minutos(fila["hora"])
+            gravedad = codigo_gravedad.get(fila["gravedad"], SIN_GRAVEDAD)
+            columnas["dia"].append(dia)
+            columnas["minutos"].append(minutos)
+            columnas["gravedad"].append(gravedad)
+            for campo, decodificado in (("fecha", _texto_fecha(dia)), ("hora", _texto_hora(minutos)),
+                                        ("gravedad", GRAVEDADES[gravedad] if gravedad != SIN_GRAVEDAD else "")):
+                crudo = _crudo(fila[campo], decodificado)
+                if crudo is not None:
+                    crudos.setdefault(str(n), {})[campo] = crudo
+            columnas["lugar"].append(codigos["lugar"].setdefault(fila["lugar"] or "", len(codigos["lugar"])))
+            columnas["tipo"].append(codigos["tipo"].setdefault(fila["tipo"] or "", len(codigos["tipo"])))
+            for nombre in nombres_participantes(fila["participantes"]):
+                columnas["part_inc"].append(n)
+                columnas["part_alumno"].append(codigos["alumno"].setdefault(nombre, len(codigos["alumno"])))
+            for monton in MONTONES:
+                montones[monton] += str(fila[monton] or "").encode("utf-8")
+                columnas[monton + "_fin"].append(len(montones[monton]))
+            n += 1
+        extra["incidencias"] = n
+
+        # Secciones con su posición relativa al inicio de los datos
+        partes, secciones, posicion = [], {}, 0
+        for nombre, datos in [(k, columnas[k].tobytes()) for k in SECCIONES] + \
+                             [(k, bytes(montones[k])) for k in MONTONES]:
+            relleno = -posicion % 8
+            partes.append(b"\0" * relleno + datos)
+            posicion += relleno
+            secciones[nombre] = [posicion, len(datos)]
+            posicion += len(datos)
+        encabezado = json.dumps({
+            "version": VERSION, "fuente": firma, "orden": sys.byteorder, "incidencias": n,
+            "lugares": list(codigos["lugar"]), "tipos": list(codigos["tipo"]),
+            "alumnos": list(codigos["alumno"]), "crudos": crudos, "secciones": secciones,
+        }, ensure_ascii=False).encode("utf-8")
+        inicio = len(MAGICO) + _LARGO.size + len(encabezado)
+        encabezado += b" " * (-inicio % 8)
+
+        temporal = f"{destino}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(MAGICO + _LARGO.pack(len(encabezado)) + encabezado)
+            for parte in partes:
+                f.write(parte)
+        anterior = _abiertos.pop(destino, None)
+        if anterior:
+            _cerrar(anterior[1])
+        try:
+            os.replace(temporal, destino)
+        except OSError:
+            os.remove(temporal)
+            raise
+    return destino
+
+
+# --- Lectura ---
+
+def _cerrar(columnas):
+    """
+    Libera las vistas de las columnas y cierra el mapeo. Si alguien conserva una
+    vista propia (ej. un arreglo de NumPy), el mapeo se cierra al liberarla.
+    """
+    for valor in columnas.values():
+        if isinstance(valor, memoryview):
+            try:
+                valor.release()
+            except (ValueError, BufferError):
+                pass
+    try:
+        columnas["_mapa"].close()
+    except BufferError:
+        pass
+
+
+def _mapear(ruta, firma):
+    """Columnas del archivo, o None si no existe, es de otra versión o no corresponde a la firma."""
+    try:
+        with open(ruta, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    encabezado = None
+    if mapa[:len(MAGICO)] == MAGICO:
+        largo = _LARGO.unpack_from(mapa, len(MAGICO))[0]
+        inicio = len(MAGICO) + _LARGO.size
+        try:
+            encabezado = json.loads(mapa[inicio:inicio + largo].decode("utf-8"))
+        except ValueError:
+            pass
+    if (encabezado is None or encabezado.get("version") != VERSION or encabezado.get("fuente") != firma
+            or encabezado.get("orden") != sys.byteorder):
+        # Sin cerrarlo, en Windows no se podría reemplazar el archivo
+        mapa.close()
+        return None
+    datos = memoryview(mapa)[inicio + largo:]
+    columnas = {
+        "incidencias": encabezado["incidencias"],
+        "lugares": encabezado["lugares"], "tipos": encabezado["tipos"], "alumnos": encabezado["alumnos"],
+        "crudos": {int(n): valores for n, valores in encabezado["crudos"].items()},
+        "_mapa": mapa, "_datos": datos,
+    }
+    for nombre, (posicion, tamano) in encabezado["secciones"].items():
+        seccion = datos[posicion:posicion + tamano]
+        columnas[nombre] = seccion.cast(SECCIONES[nombre]) if nombre in SECCIONES else seccion
+    return columnas
+
+
+def abrir(libro, generar_si_falta=None):
+    """
+    Columnas del libro desde su copia columnar. Si la copia falta o no está al día,
+    se genera cuando generar_si_falta es True (por defecto, solo para ciclos
+    cerrados); si no, devuelve None y hay que leer el Excel.
+    """
+    if generar_si_falta is None:
+        generar_si_falta = es_cerrado(libro)
+    ruta = ruta_columnar(libro)
+    firma = _firma(libro)
+    abierto = _abiertos.get(ruta)
+    if abierto and abierto[0] == firma:
+        return abierto[1]
+    if abierto:
+        # El libro cambió: el mapeo anterior ya no sirve y bloquearía el reemplazo
+        _cerrar(_abiertos.pop(ruta)[1])
+    with medir("columnar.abrir", archivo=ruta):
+        columnas = _mapear(ruta, firma)
+    if columnas is None and generar_si_falta:
+        try:
+            generar(libro)
+        except OSError as e:
+            # Por ejemplo, una carpeta compartida de solo lectura
+            print(f"Advertencia: no se pudo generar {ruta}: {e}", file=sys.stderr)
+            return None
+        columnas = _mapear(ruta, firma)
+    if columnas is not None:
+        _abiertos[ruta] = (firma, columnas)
+    return columnas
+
+
+def filas(columnas):
+    """Itera las incidencias con el mismo formato que leer_incidencias."""
+    lugares, tipos, crudos = columnas["lugares"], columnas["tipos"], columnas["crudos"]
+    participantes, links = columnas["participantes"], columnas["link"]
+    fechas = {}
+    inicio_p = inicio_l = 0
+    for n, (dia, minutos, gravedad, lugar, tipo, fin_p, fin_l) in enumerate(zip(
+            columnas["dia"], columnas["minutos"], columnas["gravedad"], columnas["lugar"],
+            columnas["tipo"], columnas["participantes_fin"], columnas["link_fin"])):
+        fecha = fechas.get(dia)
+        if fecha is None:
+            fecha = fechas[dia] = _texto_fecha(dia)
+        fila = {
+            "fecha": fecha,
+            "hora": _texto_hora(minutos),
+            "lugar": lugares[lugar],
+            "gravedad": GRAVEDADES[gravedad] if gravedad != SIN_GRAVEDAD else "",
+            "participantes": bytes(participantes[inicio_p:fin_p]).decode("utf-8"),
+            "link": bytes(links[inicio_l:fin_l]).decode("utf-8"),
+            "tipo": tipos[tipo],
+        }
+        if n in crudos:
+            fila.update(crudos[n])
+        yield fila
+        inicio_p, inicio_l = fin_p, fin_l
+
+
+def leer_libro(libro):
+    """Incidencias de un libro: de su copia columnar si la hay, si no del Excel."""
+    columnas = abrir(libro)
+    if columnas is None:
+        return leer_incidencias(libro)
+    return filas(columnas)
+
+
+def leer_ledger(ruta=EXCEL_PATH):
+    """Incidencias de los ciclos archivados y del libro actual, en orden."""
+    for libro in rutas_ledger(ruta):
+        yield from leer_libro(libro)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera las copias columnares de los libros del Excel.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--actual", action="store_true", help="Incluir el libro actual.")
+    args = parser.parse_args()
+
+    for libro in rutas_ledger(args.excel):
+        if es_cerrado(libro) or args.actual:
+            ruta = generar(libro)
+            print(f"{ruta} ({os.path.getsize(ruta) // 1024} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: consistencia.py
+Descripción: Verificación de consistencia entre la hoja 'Incidencias' y los documentos
+             Word guardados en la carpeta de incidencias. Detecta links colgantes
+             (el documento ya no existe) y documentos huérfanos (no registrados en
+             Excel), y permite reenlazar o registrar los huérfanos.
+"""
+
+import os
+import re
+import sys
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl import load_workbook
+from docx import Document
+
+from excelgen import EXCEL_PATH, autosize_sheet, actualizar_dashboard, participantes_con_grupo
+from rotacion import rutas_ledger
+from archivo import ARCHIVO_SUBDIR, esta_empaquetado
+
+INCIDENCIAS_DIR = "incidencias"
+COLUMNA_LINK = "Link al Documento"
+
+# Tamaño de lote para las consultas al sistema de archivos. En un recurso SMB cada
+# llamada tiene latencia de red, así que se agrupan varias rutas por tarea.
+TAMANO_LOTE = 256
+MAX_HILOS = 16
+
+# Incidencia_<nombres>_<AAAAMMDD>_<HHMMSS>[_n].docx (ver servicio.reservar_nombre_documento)
+PATRON_NOMBRE_DOC = re.compile(r"^Incidencia_(?P<nombres>.*)_(?P<fecha>\d{8})_(?P<hora>\d{6})(?:_\d+)?\.docx$")
+
+
+def _clave_ruta(ruta):
+    """Normaliza una ruta para poder compararla sin importar separadores o mayúsculas."""
+    return os.path.normcase(os.path.abspath(ruta))
+
+
+def _en_lotes(elementos, tamano=TAMANO_LOTE):
+    for i in range(0, len(elementos), tamano):
+        yield elementos[i:i + tamano]
+
+
+def leer_links(ruta_excel=EXCEL_PATH):
+    """
+    Devuelve una lista de (fila, link) de la hoja 'Incidencias'.
+    Usa el modo de solo lectura de openpyxl para no materializar el libro completo.
+    """
+    wb = load_workbook(ruta_excel, read_only=True)
+    try:
+        ws = wb["Incidencias"]
+        filas = ws.iter_rows(values_only=True)
+        encabezado = next(filas, None) or ()
+        try:
+            col_link = list(encabezado).index(COLUMNA_LINK)
+        except ValueError:
+            col_link = 5
+        links = []
+        for num_fila, row in enumerate(filas, start=2):
+            if not row or not row[0]:
+                continue
+            link = row[col_link] if len(row) > col_link else None
+            links.append((num_fila, str(link) if link else ""))
+        return links
+    finally:
+        wb.close()
+
+
+def listar_documentos(directorio=INCIDENCIAS_DIR):
+    """
+    Lista recursivamente los .docx del directorio. Devuelve {clave_ruta: ruta}.
+    El listado ya trae la información de existencia, así que los links que apunten
+    dentro de este directorio no necesitan un stat individual. Se omite la carpeta de
+    paquetes mensuales (ver archivo.py).
+    """
+    documentos = {}
+    pendientes = [directorio]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with os.scandir(actual) as it:
+                for entrada in it:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if entrada.name != ARCHIVO_SUBDIR:
+                            pendientes.append(entrada.path)
+                    elif entrada.name.lower().endswith(".docx") and not entrada.name.startswith("~$"):
+                        documentos[_clave_ruta(entrada.path)] = entrada.path
+        except OSError:
+            continue
+    return documentos
+
+
+def _existen(rutas):
+    """Stat de un lote de rutas; devuelve las que existen."""
+    return [r for r in rutas if os.path.isfile(r)]
+
+
+def _hash_archivo(ruta, bloque=1 << 20):
+    h = hashlib.sha1()
+    try:
+        with open(ruta, "rb") as f:
+            for trozo in iter(lambda: f.read(bloque), b""):
+                h.update(trozo)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _hashes(rutas, pool):
+    rutas = list(rutas)
+    return dict(zip(rutas, pool.map(_hash_archivo, rutas)))
+
+
+def verificar(ruta_excel=EXCEL_PATH, directorio=INCIDENCIAS_DIR, con_hash=False, max_hilos=MAX_HILOS):
+    """
+    Compara el registro de Excel contra los documentos en disco.
+
+    Devuelve un diccionario con:
+        - 'colgantes': lista de {'libro', 'fila', 'link', 'candidato'} cuyo documento no existe.
+          'candidato' es la ruta de un documento huérfano con el mismo nombre, si hay uno.
+        - 'huerfanos': lista de rutas de documentos que ningún registro referencia.
+        - 'duplicados': grupos de huérfanos con contenido idéntico (solo con con_hash).
+    """
+    inicio = datetime.now()
+    # Los ciclos escolares archivados también referencian documentos
+    links = [(libro, fila, link) for libro in rutas_ledger(ruta_excel) for fila, link in leer_links(libro)]
+    documentos = listar_documentos(directorio)
+
+    referenciados = set()
+    colgantes = []
+    externos = []
+    for libro, fila, link in links:
+        if not link:
+            colgantes.append({"libro": libro, "fila": fila, "link": link, "candidato": None})
+            continue
+        clave = _clave_ruta(link)
+        if clave in documentos:
+            referenciados.add(clave)
+        else:
+            externos.append((libro, fila, link, clave))
+
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        # Solo los links fuera del directorio listado requieren stat individual.
+        rutas_externas = [link for _, _, link, _ in externos]
+        existentes = set()
+        for encontrados in pool.map(_existen, _en_lotes(rutas_externas)):
+            existentes.update(encontrados)
+        for libro, fila, link, clave in externos:
+            if link in existentes or esta_empaquetado(link, directorio):
+                referenciados.add(clave)
+            else:
+                colgantes.append({"libro": libro, "fila": fila, "link": link, "candidato": None})
+
+        huerfanos = [ruta for clave, ruta in documentos.items() if clave not in referenciados]
+
+        # Reenlace por nombre de archivo: un documento movido conserva su nombre.
+        por_nombre = {}
+        for ruta in huerfanos:
+            por_nombre.setdefault(os.path.basename(ruta).lower(), []).append(ruta)
+
+        ambiguos = [rutas for rutas in por_nombre.values() if len(rutas) > 1]
+        hashes = {}
+        if con_hash:
+            hashes = _hashes(huerfanos, pool)
+        elif ambiguos:
+            hashes = _hashes((r for rutas in ambiguos for r in rutas), pool)
+
+    usados = set()
+    for c in colgantes:
+        if not c["link"]:
+            continue
+        candidatos = [r for r in por_nombre.get(os.path.basename(c["link"]).lower(), []) if r not in usados]
+        if len(candidatos) == 1 or (candidatos and len({hashes.get(r) for r in candidatos}) == 1):
+            c["candidato"] = candidatos[0]
+            usados.add(candidatos[0])
+
+    duplicados = []
+    if con_hash:
+        por_hash = {}
+        for ruta in huerfanos:
+            if hashes.get(ruta):
+                por_hash.setdefault(hashes[ruta], []).append(ruta)
+        duplicados = [rutas for rutas in por_hash.values() if len(rutas) > 1]
+
+    colgantes.sort(key=lambda c: (c["libro"], c["fila"]))
+    return {
+        "total_registros": len(links),
+        "total_documentos": len(documentos),
+        "colgantes": colgantes,
+        "huerfanos": sorted(r for r in huerfanos if r not in usados),
+        "duplicados": duplicados,
+        "segundos": (datetime.now() - inicio).total_seconds(),
+    }
+
+
+def datos_desde_nombre(ruta):
+    """
+    Reconstruye fecha, hora y participantes a partir del nombre de archivo generado
+    por generar_doc. Devuelve None si el nombre no sigue el formato.
+    """
+    m = PATRON_NOMBRE_DOC.match(os.path.basename(ruta))
+    if not m:
+        return None
+    fecha = datetime.strptime(m.group("fecha") + m.group("hora"), "%Y%m%d%H%M%S")
+    return {
+        "fecha": fecha.strftime("%Y-%m-%d"),
+        "hora": fecha.strftime("%H:%M"),
+        "participantes": m.group("nombres").replace("_", ", "),
+    }
+
+
+def participantes_desde_documento(ruta):
+    """
+    Participantes del documento en el formato de la columna 'Participantes'
+    ("Nombre (5° 'A'), ..."), tomados de las filas 'Alumno' de la tabla de firmas.
+    Devuelve None si el documento no se puede leer o no tiene esas filas.
+    """
+    try:
+        doc = Document(ruta)
+    except Exception:
+        return None
+    alumnos = [fila.cells[1].text.strip() for tabla in doc.tables for fila in tabla.rows
+               if len(fila.cells) > 1 and fila.cells[0].text.strip() == "Alumno"]
+    texto = ", ".join(alumnos)
+    return texto if participantes_con_grupo(texto) else None
+
+
+def reparar(reporte, ruta_excel=EXCEL_PATH, reenlazar=True, registrar_huerfanos=False):
+    """
+    Aplica las correcciones del reporte en una sola escritura del libro:
+        - reenlazar: actualiza el link de los registros colgantes con candidato.
+        - registrar_huerfanos: agrega una fila por cada documento huérfano cuyo nombre
+          permita reconstruir la fecha y hora, con los participantes de su tabla de
+          firmas. Lugar y gravedad quedan vacíos para que se completen a mano. Los
+          documentos sin tabla de firmas legible no se registran.
+    Devuelve (reenlazados, registrados).
+    """
+    reenlazados = registrados = 0
+    # Los libros de ciclos cerrados están congelados; solo se corrige el libro actual
+    pendientes_reenlace = [c for c in reporte["colgantes"]
+                           if c["candidato"] and _clave_ruta(c["libro"]) == _clave_ruta(ruta_excel)] if reenlazar else []
+    pendientes_registro = []
+    if registrar_huerfanos:
+        for ruta in reporte["huerfanos"]:
+            datos = datos_desde_nombre(ruta)
+            if not datos:
+                continue
+            # Los nombres del archivo no traen grado ni grupo; las consultas y los
+            # índices ignorarían la fila
+            datos["participantes"] = participantes_desde_documento(ruta)
+            if datos["participantes"]:
+                pendientes_registro.append((ruta, datos))
+            else:
+                print(f"Advertencia: no se registró {ruta}: no se pudieron leer sus participantes",
+                      file=sys.stderr)
+    if not pendientes_reenlace and not pendientes_registro:
+        return 0, 0
+
+    wb = load_workbook(ruta_excel)
+    ws = wb["Incidencias"]
+    encabezado = [c.value for c in ws[1]]
+    col_link = encabezado.index(COLUMNA_LINK) + 1 if COLUMNA_LINK in encabezado else 6
+
+    for c in pendientes_reenlace:
+        ws.cell(row=c["fila"], column=col_link, value=c["candidato"])
+        reenlazados += 1
+    for ruta, datos in pendientes_registro:
+        ws.append([datos["fecha"], datos["hora"], "", "", datos["participantes"], ruta])
+        registrados += 1
+
+    autosize_sheet(ws)
+    wb.save(ruta_excel)
+    if registrados:
+        actualizar_dashboard(ruta_excel)
+    return reenlazados, registrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica la consistencia entre el Excel y los documentos Word.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--directorio", default=INCIDENCIAS_DIR)
+    parser.add_argument("--hash", action="store_true", help="Calcula el hash de los huérfanos para detectar copias.")
+    parser.add_argument("--reparar", action="store_true", help="Reenlaza los registros colgantes con candidato.")
+    parser.add_argument("--registrar-huerfanos", action="store_true", help="Registra en Excel los documentos huérfanos.")
+    args = parser.parse_args()
+
+    reporte = verificar(args.excel, args.directorio, con_hash=args.hash)
+    print(f"Registros: {reporte['total_registros']}  Documentos: {reporte['total_documentos']}  "
+          f"({reporte['segundos']:.2f} s)")
+    print(f"Links colgantes: {len(reporte['colgantes'])}")
+    for c in reporte["colgantes"]:
+        destino = f" -> {c['candidato']}" if c["candidato"] else ""
+        print(f"  {os.path.basename(c['libro'])} fila {c['fila']}: {c['link'] or '(sin link)'}{destino}")
+    print(f"Documentos huérfanos: {len(reporte['huerfanos'])}")
+    for ruta in reporte["huerfanos"]:
+        print(f"  {ruta}")
+    for grupo in reporte["duplicados"]:
+        print(f"  Copias idénticas: {', '.join(grupo)}")
+
+    if args.reparar or args.registrar_huerfanos:
+        reenlazados, registrados = reparar(reporte, args.excel, reenlazar=args.reparar,
+                                           registrar_huerfanos=args.registrar_huerfanos)
+        print(f"Reenlazados: {reenlazados}  Registrados: {registrados}")
+
+
+if __name__ == "__main__":
+    main()
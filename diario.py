@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: diario.py
+Descripción: Diario de escritura anticipada (write-ahead log) del registro de
+             incidencias. Antes de generar el Word, cada incidencia se agrega al
+             diario del libro (ej. data/bitacoras.diario.jsonl) y se fuerza a disco
+             con fsync. Las filas del Excel se aplican después desde el diario, varias
+             a la vez con un solo guardado del libro, y se marcan como aplicadas.
+
+             Si el Excel no se puede guardar (por ejemplo, porque alguien lo tiene
+             abierto), las incidencias quedan pendientes en el diario y se aplican en
+             el siguiente registro o al iniciar el programa (ver servicio.reproducir).
+
+             Cada línea del diario es un JSON con una operación:
+                 {"op": "registro", "id", "ts", "link", "incidente", "fila"}
+                 {"op": "aplicado", "ids": [...]}
+                 {"op": "descartado", "ids": [...]}    (el Word no se pudo generar)
+"""
+
+import os
+import sys
+import json
+import uuid
+import threading
+from datetime import datetime
+
+from excelgen import registrar_incidencias, leer_incidencias
+from rotacion import rotar_si_hay_cerradas
+from metricas import medir
+import particiones
+import analitica
+
+# Con más de este tamaño, el diario se reescribe dejando solo las entradas pendientes
+COMPACTAR_BYTES = 256 * 1024
+
+# Un candado por diario: los hilos del servidor escriben en el mismo archivo
+_candados = {}
+_candado_global = threading.Lock()
+
+
+def ruta_diario(ruta_excel):
+    """Diario del libro: junto al Excel, con el mismo nombre base."""
+    base, _ = os.path.splitext(ruta_excel)
+    return base + ".diario.jsonl"
+
+
+def _candado(ruta):
+    with _candado_global:
+        return _candados.setdefault(ruta, threading.Lock())
+
+
+def _escribir_lineas(ruta, registros):
+    """Agrega registros al diario y no regresa hasta que están en disco."""
+    datos = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in registros)
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _leer(ruta):
+    """Itera los registros del diario. Una última línea incompleta (corte de luz) se ignora."""
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                continue
+
+
+def _pendientes(ruta):
+    registros = {}
+    for r in _leer(ruta):
+        if r.get("op") == "registro":
+            registros[r["id"]] = r
+        elif r.get("op") in ("aplicado", "descartado"):
+            for id_ in r.get("ids", []):
+                registros.pop(id_, None)
+    return list(registros.values())
+
+
+def anotar(ruta_excel, incidente, link, fila):
+    """
+    Agrega una incidencia al diario antes de generar su documento. 'fila' son los
+    datos que se escribirán en la hoja 'Incidencias'. Devuelve la entrada.
+    """
+    entrada = {
+        "op": "registro", "id": uuid.uuid4().hex, "ts": datetime.now().isoformat(timespec="seconds"),
+        "link": link, "incidente": incidente, "fila": fila,
+    }
+    ruta = ruta_diario(ruta_excel)
+    with _candado(ruta), medir("diario.anotar", archivo=ruta):
+        _escribir_lineas(ruta, [entrada])
+    return entrada
+
+
+def _cerrar(ruta_excel, op, ids):
+    if not ids:
+        return
+    ruta = ruta_diario(ruta_excel)
+    with _candado(ruta):
+        _escribir_lineas(ruta, [{"op": op, "ids": list(ids)}])
+        if os.path.getsize(ruta) > COMPACTAR_BYTES:
+            _compactar(ruta)
+
+
+def marcar_aplicadas(ruta_excel, ids):
+    _cerrar(ruta_excel, "aplicado", ids)
+
+
+def descartar(ruta_excel, ids):
+    """Anula entradas cuyo documento no se pudo generar."""
+    _cerrar(ruta_excel, "descartado", ids)
+
+
+def _compactar(ruta):
+    """Reescribe el diario solo con las entradas pendientes (se llama con el candado tomado)."""
+    pendientes = _pendientes(ruta)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        for r in pendientes:
+            f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def pendientes(ruta_excel):
+    """Entradas registradas que aún no se aplican al Excel ni se descartaron."""
+    ruta = ruta_diario(ruta_excel)
+    with _candado(ruta):
+        return _pendientes(ruta)
+
+
+def hay_pendientes(ruta_excel):
+    ruta = ruta_diario(ruta_excel)
+    return os.path.exists(ruta) and os.path.getsize(ruta) > 0 and bool(pendientes(ruta_excel))
+
+
+def sin_aplicar(ruta_excel, entradas):
+    """
+    Entradas cuyo link todavía no está en el Excel. Las que ya están (el guardado
+    se hizo pero no se alcanzó a marcarlas) se marcan como aplicadas.
+    """
+    if not entradas:
+        return []
+    en_excel = {f["link"] for f in leer_incidencias(ruta_excel)} if os.path.exists(ruta_excel) else set()
+    marcar_aplicadas(ruta_excel, [e["id"] for e in entradas if e["link"] in en_excel])
+    return [e for e in entradas if e["link"] not in en_excel]
+
+
+def aplicar(ruta_excel, entradas, con_resumen=False):
+    """
+    Escribe en el Excel las filas de las entradas con un solo guardado y las marca
+    como aplicadas. Si el guardado falla, la excepción se propaga y las entradas
+    siguen pendientes en el diario. Los errores posteriores al guardado solo se
+    reportan: las filas ya están en el Excel y no deben volver a escribirse. Las
+    filas de un ciclo ya cerrado se pasan enseguida a su libro archivado.
+    """
+    if not entradas:
+        return 0
+    filas = [e["fila"] for e in entradas]
+    with medir("diario.aplicar", entradas=len(entradas)):
+        firma_previa = particiones.firma_excel(ruta_excel)
+        registrar_incidencias(filas, ruta=ruta_excel)
+    try:
+        # Si esto falla o el programa se cierra aquí, sin_aplicar ve que el link ya
+        # está en el Excel y la entrada no se duplica.
+        marcar_aplicadas(ruta_excel, [e["id"] for e in entradas])
+        analitica.invalidar(ruta_excel)
+        if con_resumen:
+            particiones.acumular_resumen(ruta_excel, filas, firma_previa)
+        if rotar_si_hay_cerradas([f["fecha"] for f in filas], ruta_excel):
+            analitica.invalidar(ruta_excel)
+    except Exception as e:
+        # El resumen de la partición se reconstruye al leerlo si no corresponde al Excel
+        print(f"Advertencia: las incidencias se guardaron en {ruta_excel}, pero falló un paso posterior: {e}",
+              file=sys.stderr)
+    return len(entradas)
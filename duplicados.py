@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: duplicados.py
+Descripción: Detección de incidencias posiblemente duplicadas al registrar. Cuando
+             varios adultos presencian el mismo evento, la misma pelea se registra
+             dos o tres veces (por distintos maestros o al reintentar después de un
+             error) e infla el dashboard y las faltas de cada alumno.
+
+             Cada incidencia se resume en una firma MinHash de dos partes: una sobre
+             los alumnos, el lugar y el tipo, y otra sobre los trigramas de palabras
+             de la narración. Las firmas se reparten en bandas (LSH) indexadas junto
+             con la fecha, así que una consulta solo compara contra las incidencias
+             del mismo día que coinciden en alguna banda, sin importar cuántos años
+             de historial tenga el índice.
+
+             Los candidatos se califican por la coincidencia de alumnos, lugar, tipo
+             y narración; los que están dentro de VENTANA_MINUTOS y superan UMBRAL se
+             reportan como posibles duplicados.
+
+             El índice vive junto al Excel (ej. data/bitacoras.duplicados.jsonl): una
+             línea por incidencia (la fecha y un JSON), agregada al registrarla. Las
+             cubetas de un día se arman la primera vez que se consulta. Si no existe, se
+             construye con las filas de los libros (sin narración, que no está en el
+             Excel). Otros procesos que escriban en el mismo índice se ven en la
+             siguiente consulta. Si una incidencia reportada ya no está en los libros
+             ni pendiente en el diario (se borró la fila), el índice se reconstruye.
+
+                 python duplicados.py --reporte          (pares duplicados en el registro)
+                 python duplicados.py --reconstruir
+"""
+
+import os
+import re
+import json
+import struct
+import hashlib
+import argparse
+import threading
+import unicodedata
+from datetime import datetime, date, time, timedelta
+
+from excelgen import EXCEL_PATH, nombres_participantes
+from rotacion import rutas_ledger, libros_del_periodo
+from metricas import medir
+import columnar
+import diario
+
+# Permutaciones por parte de la firma y filas por banda: 8 bandas de 4 filas cada una
+PERMUTACIONES = 32
+FILAS_BANDA = 4
+VENTANA_MINUTOS = 120
+UMBRAL = 0.6
+PESO_ALUMNOS = 0.5
+PESO_LUGAR = 0.2
+PESO_TIPO = 0.1
+PESO_NARRACION = 0.2
+MAX_RESULTADOS = 5
+
+_PRIMO = (1 << 61) - 1
+_VACIO = _PRIMO  # Valor de una firma sin elementos (narración vacía)
+_EMPAQUE = struct.Struct(f"<{2 * PERMUTACIONES}Q")
+
+
+def _coeficientes():
+    """Coeficientes fijos (a, b) de las permutaciones h(x) = (a*x + b) mod p."""
+    coeficientes = []
+    for i in range(PERMUTACIONES):
+        semilla = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(semilla[:8], "little") % (_PRIMO - 1) + 1
+        b = int.from_bytes(semilla[8:], "little") % _PRIMO
+        coeficientes.append((a, b))
+    return coeficientes
+
+
+_COEFICIENTES = _coeficientes()
+
+# Índices cargados: ruta del índice -> _Indice
+_indices = {}
+# Reentrante: _indice() puede reconstruir dentro de una consulta que ya lo tiene
+_candado = threading.RLock()
+
+
+# --- Firmas ---
+
+def _normalizar(texto):
+    """Minúsculas, sin acentos y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.findall(r"\w+", texto.lower()))
+
+
+def _minhash(elementos):
+    valores = [int.from_bytes(hashlib.blake2b(e.encode("utf-8"), digest_size=8).digest(), "little")
+               for e in elementos]
+    if not valores:
+        return [_VACIO] * PERMUTACIONES
+    return [min((a * x + b) % _PRIMO for x in valores) for a, b in _COEFICIENTES]
+
+
+def _trigramas(texto):
+    palabras = _normalizar(texto).split()
+    if len(palabras) < 3:
+        return set(palabras)
+    return {" ".join(palabras[i:i + 3]) for i in range(len(palabras) - 2)}
+
+
+def _a_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    try:
+        return datetime.strptime(str(valor)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _a_minutos(valor):
+    if isinstance(valor, (datetime, time)):
+        return valor.hour * 60 + valor.minute
+    m = re.match(r"\s*(\d{1,2}):(\d{2})", str(valor or ""))
+    return int(m.group(1)) * 60 + int(m.group(2)) if m else None
+
+
+def resumir(incidente):
+    """
+    Datos de una incidencia que usa el índice. Acepta tanto el diccionario del
+    formulario (participantes como lista, 'tipo_inc', 'narracion') como una fila de
+    leer_incidencias (participantes como texto, 'tipo').
+    """
+    participantes = incidente.get("participantes") or []
+    if isinstance(participantes, str):
+        nombres = nombres_participantes(participantes)
+    else:
+        nombres = [p.get("nombre", "") for p in participantes]
+    alumnos = sorted({_normalizar(n) for n in nombres if _normalizar(n)})
+    lugar = _normalizar(incidente.get("lugar"))
+    tipo = _normalizar(incidente.get("tipo_inc") or incidente.get("tipo"))
+    narracion = incidente.get("narracion") or ""
+
+    estructura = {"a:" + a for a in alumnos} | {"l:" + lugar, "t:" + tipo}
+    firma = _minhash(sorted(estructura)) + _minhash(sorted(_trigramas(narracion)))
+    fecha = _a_fecha(incidente.get("fecha"))
+    return {
+        "fecha": fecha.isoformat() if fecha else None,
+        "minutos": _a_minutos(incidente.get("hora")),
+        "hora": str(incidente.get("hora") or "")[:5],
+        "lugar": incidente.get("lugar") or "",
+        "tipo": incidente.get("tipo_inc") or incidente.get("tipo") or "",
+        "alumnos": alumnos,
+        "nombres": nombres,
+        "firma": firma,
+    }
+
+
+def _bandas(firma):
+    """(parte, banda, valores) de cada banda no vacía de la firma."""
+    for parte in range(2):
+        inicio = parte * PERMUTACIONES
+        for banda in range(PERMUTACIONES // FILAS_BANDA):
+            valores = tuple(firma[inicio + banda * FILAS_BANDA:inicio + (banda + 1) * FILAS_BANDA])
+            if valores[0] != _VACIO:
+                yield parte, banda, valores
+
+
+def _puntaje(a, b):
+    """Similitud entre 0 y 1; 0 si no comparten ningún alumno."""
+    alumnos_a, alumnos_b = set(a["alumnos"]), set(b["alumnos"])
+    comunes = len(alumnos_a & alumnos_b)
+    if not comunes:
+        return 0.0
+    pesos = [
+        (PESO_ALUMNOS, comunes / len(alumnos_a | alumnos_b)),
+        (PESO_LUGAR, float(_normalizar(a["lugar"]) == _normalizar(b["lugar"]))),
+        (PESO_TIPO, float(_normalizar(a["tipo"]) == _normalizar(b["tipo"]))),
+    ]
+    narracion_a, narracion_b = a["firma"][PERMUTACIONES:], b["firma"][PERMUTACIONES:]
+    # Las filas reconstruidas desde el Excel no tienen narración
+    if narracion_a[0] != _VACIO and narracion_b[0] != _VACIO:
+        iguales = sum(x == y for x, y in zip(narracion_a, narracion_b))
+        pesos.append((PESO_NARRACION, iguales / PERMUTACIONES))
+    return sum(p * v for p, v in pesos) / sum(p for p, _ in pesos)
+
+
+# --- Índice ---
+
+def ruta_indice(ruta_excel=EXCEL_PATH):
+    """Índice del libro: junto al Excel, con el mismo nombre base."""
+    base, _ = os.path.splitext(ruta_excel)
+    return base + ".duplicados.jsonl"
+
+
+def _a_linea(link, resumen):
+    """Línea del índice: la fecha, un tabulador y el registro en JSON."""
+    registro = {k: resumen[k] for k in ("minutos", "hora", "lugar", "tipo", "alumnos", "nombres")}
+    registro["link"] = link
+    registro["firma"] = _EMPAQUE.pack(*resumen["firma"]).hex()
+    return f"{resumen['fecha'] or ''}\t{json.dumps(registro, ensure_ascii=False)}\n"
+
+
+def _de_linea(fecha, datos):
+    registro = json.loads(datos)
+    registro["fecha"] = fecha
+    registro["firma"] = list(_EMPAQUE.unpack(bytes.fromhex(registro["firma"])))
+    return registro
+
+
+class _Indice:
+    """
+    Índice en memoria. Al cargar, las líneas solo se agrupan por fecha; las de un
+    día se decodifican y se reparten en cubetas LSH la primera vez que se consulta
+    ese día, así que abrir años de historial no cuesta más que leer el archivo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.posicion = 0
+        self.lineas = {}  # fecha -> líneas aún sin decodificar
+        self.dias = {}    # fecha -> (entradas, cubetas)
+
+    def _agregar_linea(self, linea):
+        fecha, _, datos = linea.partition(b"\t")
+        fecha = fecha.decode("ascii", "ignore")
+        if not fecha or not datos:
+            return
+        if fecha in self.dias:
+            self._agregar_en_dia(fecha, self.dias[fecha], datos)
+        else:
+            self.lineas.setdefault(fecha, []).append(datos)
+
+    def _agregar_en_dia(self, fecha, dia, datos):
+        try:
+            registro = _de_linea(fecha, datos)
+        except (ValueError, KeyError, struct.error):
+            return
+        entradas, cubetas = dia
+        numero = len(entradas)
+        entradas.append(registro)
+        for banda in _bandas(registro["firma"]):
+            cubetas.setdefault(banda, []).append(numero)
+
+    def dia(self, fecha):
+        """(entradas, cubetas) de una fecha, decodificándolas la primera vez."""
+        dia = self.dias.get(fecha)
+        if dia is None:
+            dia = self.dias[fecha] = ([], {})
+            for datos in self.lineas.pop(fecha, ()):
+                self._agregar_en_dia(fecha, dia, datos)
+        return dia
+
+    def fechas(self):
+        return sorted(set(self.lineas) | set(self.dias))
+
+    def actualizar(self):
+        """Lee las líneas agregadas al archivo desde la última vez (por este u otro proceso)."""
+        if not os.path.exists(self.ruta):
+            return
+        if os.path.getsize(self.ruta) < self.posicion:
+            # El índice se reconstruyó
+            self.__init__(self.ruta)
+        with open(self.ruta, "rb") as f:
+            f.seek(self.posicion)
+            datos = f.read()
+        # Una línea a medio escribir se lee en la siguiente consulta
+        fin = datos.rfind(b"\n") + 1
+        for linea in datos[:fin].splitlines():
+            self._agregar_linea(linea)
+        self.posicion += fin
+
+    def candidatos(self, resumen):
+        """(fecha, número, entrada) de las que comparten alguna banda en los días de la ventana."""
+        dia = date.fromisoformat(resumen["fecha"])
+        dias = {dia}
+        if resumen["minutos"] is not None:
+            if resumen["minutos"] < VENTANA_MINUTOS:
+                dias.add(dia - timedelta(days=1))
+            if resumen["minutos"] + VENTANA_MINUTOS >= 24 * 60:
+                dias.add(dia + timedelta(days=1))
+        encontrados = []
+        for fecha in sorted(d.isoformat() for d in dias):
+            entradas, cubetas = self.dia(fecha)
+            numeros = set()
+            for banda in _bandas(resumen["firma"]):
+                numeros.update(cubetas.get(banda, ()))
+            encontrados.extend((fecha, n, entradas[n]) for n in sorted(numeros))
+        return encontrados
+
+
+def _diferencia_minutos(a, b):
+    if a["minutos"] is None or b["minutos"] is None:
+        return 0 if a["fecha"] == b["fecha"] else None
+    dias = (date.fromisoformat(a["fecha"]) - date.fromisoformat(b["fecha"])).days
+    return abs(dias * 24 * 60 + a["minutos"] - b["minutos"])
+
+
+def _escribir(ruta, lineas):
+    """Agrega líneas al índice con una sola escritura en modo append."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    fd = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, "".join(lineas).encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def reconstruir(ruta_excel=EXCEL_PATH):
+    """
+    Reescribe el índice con las filas de todos los libros y las incidencias aún
+    pendientes en el diario. Devuelve cuántas indexó.
+    """
+    ruta = ruta_indice(ruta_excel)
+    with _candado, medir("duplicados.reconstruir", archivo=ruta):
+        lineas = [_a_linea(fila["link"], resumir(fila))
+                  for fila in columnar.leer_ledger(ruta_excel)]
+        lineas += [_a_linea(e["link"], resumir(e["incidente"])) for e in diario.pendientes(ruta_excel)]
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.writelines(lineas)
+        os.replace(temporal, ruta)
+        _indices.pop(ruta, None)
+    return len(lineas)
+
+
+def _indice(ruta_excel):
+    """Índice del libro al día con su archivo; se construye la primera vez."""
+    ruta = ruta_indice(ruta_excel)
+    if not os.path.exists(ruta) and rutas_ledger(ruta_excel):
+        reconstruir(ruta_excel)
+    with _candado:
+        indice = _indices.get(ruta)
+        if indice is None:
+            indice = _indices[ruta] = _Indice(ruta)
+        with medir("duplicados.actualizar", archivo=ruta):
+            indice.actualizar()
+    return indice
+
+
+def buscar(incidente, ruta_excel=EXCEL_PATH, umbral=UMBRAL, excluir=None):
+    """
+    Incidencias ya registradas que probablemente son la misma que 'incidente', de la
+    más a la menos parecida: [{'link', 'fecha', 'hora', 'lugar', 'tipo', 'alumnos',
+    'puntaje'}]. 'excluir' es un link que no se reporta (la propia incidencia).
+    """
+    resumen = resumir(incidente)
+    if not resumen["fecha"]:
+        return []
+    # Otro hilo puede estar agregando entradas al mismo día mientras se consulta
+    with _candado:
+        candidatos = _indice(ruta_excel).candidatos(resumen)
+    similares = []
+    with medir("duplicados.buscar"):
+        for _, _, entrada in candidatos:
+            diferencia = _diferencia_minutos(resumen, entrada)
+            if entrada["link"] == excluir or diferencia is None or diferencia > VENTANA_MINUTOS:
+                continue
+            puntaje = _puntaje(resumen, entrada)
+            if puntaje >= umbral:
+                similares.append({"link": entrada["link"], "fecha": entrada["fecha"], "hora": entrada["hora"],
+                                  "lugar": entrada["lugar"], "tipo": entrada["tipo"],
+                                  "alumnos": entrada["nombres"], "puntaje": round(puntaje, 2)})
+    if similares:
+        vigentes = _links_registrados(ruta_excel, [s["fecha"] for s in similares])
+        if any(s["link"] not in vigentes for s in similares):
+            # Se borraron filas del Excel: el índice ya no corresponde a los libros
+            reconstruir(ruta_excel)
+            similares = [s for s in similares if s["link"] in vigentes]
+    similares.sort(key=lambda s: -s["puntaje"])
+    return similares[:MAX_RESULTADOS]
+
+
+def _links_registrados(ruta_excel, fechas):
+    """Links de los libros de esas fechas más los pendientes en el diario."""
+    links = {e["link"] for e in diario.pendientes(ruta_excel)}
+    for libro in libros_del_periodo(ruta_excel, min(fechas), max(fechas)):
+        links.update(fila["link"] for fila in columnar.leer_libro(libro))
+    return links
+
+
+def agregar(incidente, link, ruta_excel=EXCEL_PATH):
+    """Agrega al índice una incidencia recién registrada."""
+    _indice(ruta_excel)
+    _escribir(ruta_indice(ruta_excel), [_a_linea(link, resumir(incidente))])
+
+
+def describir(similares):
+    """Texto para avisar al usuario de los posibles duplicados."""
+    lineas = ["Ya hay incidencias registradas muy parecidas:"]
+    for s in similares:
+        lineas.append(f"• {s['fecha']} {s['hora']} en {s['lugar']} ({s['tipo']}): "
+                      f"{', '.join(s['alumnos'])}")
+    return "\n".join(lineas)
+
+
+def pares_duplicados(ruta_excel=EXCEL_PATH, umbral=UMBRAL):
+    """Pares (anterior, posterior) de incidencias del índice que parecen la misma."""
+    with _candado:
+        return _pares_duplicados(_indice(ruta_excel), umbral)
+
+
+def _pares_duplicados(indice, umbral):
+    pares = []
+    for fecha in indice.fechas():
+        for numero, entrada in enumerate(indice.dia(fecha)[0]):
+            for otra_fecha, otro, anterior in indice.candidatos(entrada):
+                if (otra_fecha, otro) >= (fecha, numero):
+                    continue
+                diferencia = _diferencia_minutos(entrada, anterior)
+                if diferencia is not None and diferencia <= VENTANA_MINUTOS:
+                    puntaje = _puntaje(entrada, anterior)
+                    if puntaje >= umbral:
+                        pares.append((anterior, entrada, round(puntaje, 2)))
+    return pares
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de incidencias duplicadas.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--reconstruir", action="store_true", help="Reconstruye el índice desde los libros.")
+    parser.add_argument("--reporte", action="store_true", help="Lista los pares de posibles duplicados.")
+    parser.add_argument("--umbral", type=float, default=UMBRAL)
+    args = parser.parse_args()
+
+    if args.reconstruir:
+        print(f"{reconstruir(args.excel)} incidencias indexadas en {ruta_indice(args.excel)}")
+    if args.reporte or not args.reconstruir:
+        pares = pares_duplicados(args.excel, args.umbral)
+        for anterior, posterior, puntaje in pares:
+            print(f"{puntaje:.2f}  {anterior['fecha']} {anterior['hora']} {anterior['link']}\n"
+                  f"      {posterior['fecha']} {posterior['hora']} {posterior['link']}")
+        print(f"{len(pares)} posibles duplicados.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,26 @@ Descripción: Generación y actualización del Excel con dashboard, registro de
 """
 
 import os
+import re
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment
 from openpyxl.chart import PieChart, Reference
 from openpyxl.utils import get_column_letter
 
+from metricas import medir
+
 EXCEL_PATH = os.path.join("data", "bitacoras.xlsx")
+GRAVEDADES = ["Leve", "Moderada", "Grave"]
+# Hoja con los totales de ciclos escolares cerrados (ver rotacion.py)
+HOJA_HISTORICO = "Histórico"
+TOTAL_INCIDENCIAS = "(Total de incidencias)"
+
+ENCABEZADO_INCIDENCIAS = ["Fecha", "Hora", "Lugar", "Gravedad", "Participantes", "Link al Documento", "Tipo"]
+COLUMNA_TIPO = 7
+
+# "Nombre (6° 'A')" tal como lo escribe formatear_participantes
+PATRON_PARTICIPANTE = re.compile(r"([^,(]+?)\s*\([^()]*?° '[^']*'\)")
+PATRON_PARTICIPANTE_GRUPO = re.compile(r"([^,(]+?)\s*\(([^()]*?)° '([^']*)'\)")
 
 
 def autosize_sheet(ws, min_width=8):
@@ -28,14 +42,15 @@ def autosize_sheet(ws, min_width=8):
         ws.column_dimensions[col_letter].width = max(min_width, width + 2)
 
 
-def inicializar_excel():
+def inicializar_excel(ruta=EXCEL_PATH):
     """
     Crea el archivo Excel con las hojas necesarias y los encabezados correctos si no existe.
     """
-    if not os.path.exists("data"):
-        os.makedirs("data")
+    directorio = os.path.dirname(ruta) or "."
+    if not os.path.exists(directorio):
+        os.makedirs(directorio)
 
-    if not os.path.exists(EXCEL_PATH):
+    if not os.path.exists(ruta):
         wb = Workbook()
 
         # Dashboard (página principal)
@@ -48,9 +63,7 @@ def inicializar_excel():
 
         # Hoja de Incidencias (simplificada)
         ws_inc = wb.create_sheet("Incidencias")
-        ws_inc.append([
-            "Fecha", "Hora", "Lugar", "Gravedad", "Participantes", "Link al Documento"
-        ])
+        ws_inc.append(ENCABEZADO_INCIDENCIAS)
 
         # Hoja para el Registro de Faltas con columnas de severidad
         ws_faltas = wb.create_sheet("Registro de Faltas")
@@ -58,38 +71,151 @@ def inicializar_excel():
 
         autosize_sheet(ws_inc)
         autosize_sheet(ws_faltas)
-        wb.save(EXCEL_PATH)
+        wb.save(ruta)
+
 
+def formatear_participantes(participantes):
+    """Convierte la lista de participantes al texto de la columna 'Participantes'."""
+    # Asumimos que cada participante es un diccionario con 'nombre', 'grado', 'grupo'
+    return ", ".join(f"{p['nombre']} ({p['grado']}° '{p['grupo']}')" for p in participantes)
 
-def registrar_incidencia(datos):
+
+def registrar_incidencia(datos, ruta=EXCEL_PATH):
     """
     Registra una nueva incidencia en la hoja 'Incidencias'.
     Maneja una lista de diccionarios para los participantes.
     """
-    wb = load_workbook(EXCEL_PATH)
+    registrar_incidencias([datos], ruta=ruta, con_dashboard=False)
+
+
+def registrar_incidencias(lista_datos, ruta=EXCEL_PATH, con_dashboard=True):
+    """
+    Registra varias incidencias con una sola carga y un solo guardado del libro.
+    Si con_dashboard es True, también recalcula el Dashboard antes de guardar.
+    El libro se guarda en un temporal que luego lo reemplaza, así que quien lo lea
+    en ese momento (en modo de solo lectura) nunca ve un archivo a medio guardar.
+    """
+    with medir("excel.cargar", archivo=ruta):
+        wb = load_workbook(ruta)
     ws = wb["Incidencias"]
+    # Libros creados antes de la columna 'Tipo'
+    if ws.cell(row=1, column=COLUMNA_TIPO).value is None:
+        ws.cell(row=1, column=COLUMNA_TIPO, value="Tipo")
+
+    for datos in lista_datos:
+        ws.append([
+            datos["fecha"], datos["hora"], datos["lugar"], datos["gravedad"],
+            formatear_participantes(datos["participantes"]), datos.get("link", ""),
+            datos.get("tipo", "")
+        ])
+
+    with medir("excel.autosize", hoja="Incidencias"):
+        autosize_sheet(ws)
+    if con_dashboard:
+        with medir("excel.dashboard"):
+            _escribir_dashboard(wb)
+    with medir("excel.guardar", archivo=ruta, filas_nuevas=len(lista_datos)):
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        wb.save(temporal)
+        os.replace(temporal, ruta)
+
+
+def nombres_participantes(texto):
+    """Extrae los nombres del texto de la columna 'Participantes'."""
+    return [n.strip() for n in PATRON_PARTICIPANTE.findall(texto or "") if n.strip()]
+
+
+def participantes_con_grupo(texto):
+    """Extrae (nombre, grado, grupo) de cada participante del texto de la columna 'Participantes'."""
+    return [(n.strip(), g.strip(), gr.strip()) for n, g, gr in PATRON_PARTICIPANTE_GRUPO.findall(texto or "")
+            if n.strip()]
+
+
+# --- Lecturas ---
+# Todas las consultas que no modifican el libro recorren la hoja en modo de solo
+# lectura (streaming): no se crean objetos por celda ni por estilo, así que la
+# memoria no crece con el número de filas como ocurre con load_workbook normal.
+
+def leer_incidencias(ruta=EXCEL_PATH):
+    """
+    Itera las filas de la hoja 'Incidencias' como diccionarios, en modo de solo lectura.
+    """
+    with medir("excel.abrir_lectura", archivo=ruta):
+        wb = load_workbook(ruta, read_only=True)
+    try:
+        for row in wb["Incidencias"].iter_rows(min_row=2, max_col=COLUMNA_TIPO, values_only=True):
+            if not row or not row[0]:
+                continue
+            row = tuple(row) + (None,) * (COLUMNA_TIPO - len(row))
+            yield {
+                "fecha": row[0], "hora": row[1], "lugar": row[2], "gravedad": row[3],
+                "participantes": row[4] or "", "link": row[5] or "", "tipo": row[6] or "",
+            }
+    finally:
+        wb.close()
 
-    # Formatear la lista de participantes
-    participantes_str_list = []
-    for p in datos["participantes"]:
-        # Asumimos que p es un diccionario con 'nombre', 'grado', 'grupo'
-        participantes_str_list.append(f"{p['nombre']} ({p['grado']}° '{p['grupo']}')")
-    participantes_str = ", ".join(participantes_str_list)
 
-    ws.append([
-        datos["fecha"], datos["hora"], datos["lugar"], datos["gravedad"],
-        participantes_str, datos.get("link", "")
-    ])
+def buscar_incidencias(ruta=EXCEL_PATH, desde=None, hasta=None, gravedad=None, lugar=None, alumno=None):
+    """
+    Itera las incidencias que cumplen los filtros. Las fechas se comparan como texto
+    'AAAA-MM-DD'; 'alumno' busca el texto dentro de la columna de participantes.
+    """
+    alumno = alumno.lower() if alumno else None
+    for fila in leer_incidencias(ruta):
+        fecha = str(fila["fecha"])
+        if desde and fecha < desde:
+            continue
+        if hasta and fecha > hasta:
+            continue
+        if gravedad and fila["gravedad"] != gravedad:
+            continue
+        if lugar and fila["lugar"] != lugar:
+            continue
+        if alumno and alumno not in str(fila["participantes"]).lower():
+            continue
+        yield fila
 
-    autosize_sheet(ws)
-    wb.save(EXCEL_PATH)
 
+def contar_por_gravedad(ruta=EXCEL_PATH):
+    """Conteo de incidencias por gravedad, sin cargar el libro completo."""
+    total_gravedad = {g: 0 for g in GRAVEDADES}
+    for fila in leer_incidencias(ruta):
+        if fila["gravedad"] in total_gravedad:
+            total_gravedad[fila["gravedad"]] += 1
+    return total_gravedad
 
-def actualizar_dashboard():
+
+def contar_faltas(ruta=EXCEL_PATH):
+    """
+    Faltas por alumno con el desglose de la hoja 'Registro de Faltas':
+    {alumno: {'Total': n, 'Leve': n, 'Moderada': n, 'Grave': n}}.
+    """
+    faltas = {}
+    for fila in leer_incidencias(ruta):
+        for nombre in nombres_participantes(fila["participantes"]):
+            conteo = faltas.setdefault(nombre, {"Total": 0, "Leve": 0, "Moderada": 0, "Grave": 0})
+            conteo["Total"] += 1
+            if fila["gravedad"] in GRAVEDADES:
+                conteo[fila["gravedad"]] += 1
+    return faltas
+
+
+# --- Escrituras ---
+
+def actualizar_dashboard(ruta=EXCEL_PATH):
     """
     Actualiza la hoja Dashboard con el resumen de gravedad.
     """
-    wb = load_workbook(EXCEL_PATH)
+    with medir("excel.cargar", archivo=ruta):
+        wb = load_workbook(ruta)
+    with medir("excel.dashboard"):
+        _escribir_dashboard(wb)
+    with medir("excel.guardar", archivo=ruta):
+        wb.save(ruta)
+
+
+def _escribir_dashboard(wb):
+    """Reescribe la hoja Dashboard de un libro ya cargado."""
     ws_dash = wb["Dashboard"]
     ws_inc = wb["Incidencias"]
 
@@ -100,7 +226,7 @@ def actualizar_dashboard():
     ws_dash._charts = []
 
     # --- Contar incidencias por gravedad ---
-    total_gravedad = {"Leve": 0, "Moderada": 0, "Grave": 0}
+    total_gravedad = {g: 0 for g in GRAVEDADES}
     for row in ws_inc.iter_rows(min_row=2, max_col=4, values_only=True):
         if not row or not row[0]:
             continue
@@ -129,5 +255,16 @@ def actualizar_dashboard():
     pie.set_categories(labels)
     ws_dash.add_chart(pie, "D3")
 
+    # Totales de ciclos anteriores, leídos del resumen precalculado
+    if HOJA_HISTORICO in wb.sheetnames:
+        fila = 22
+        for col, titulo in enumerate(["Ciclo", "Total"] + GRAVEDADES, start=1):
+            celda = ws_dash.cell(row=fila, column=col, value=titulo)
+            celda.font = Font(bold=True)
+        for row in wb[HOJA_HISTORICO].iter_rows(min_row=2, max_col=6, values_only=True):
+            if row and row[1] == TOTAL_INCIDENCIAS:
+                fila += 1
+                for col, valor in enumerate([row[0], row[2], row[3], row[4], row[5]], start=1):
+                    ws_dash.cell(row=fila, column=col, value=valor)
+
     autosize_sheet(ws_dash)
-    wb.save(EXCEL_PATH)
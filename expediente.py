@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: expediente.py
+Descripción: Expediente de un alumno para reuniones con padres de familia: un
+             documento de Word con su historial de incidencias (línea de tiempo,
+             totales por gravedad y narraciones).
+
+             En el Excel los participantes están juntos en un solo texto por
+             incidencia, así que buscar a un alumno obligaría a revisar todas las
+             filas. En su lugar se mantiene un índice alumno -> incidencias junto al
+             Excel (ej. data/bitacoras.alumnos.jsonl): una línea por incidencia con
+             los nombres normalizados de sus alumnos, un tabulador y el registro en
+             JSON (con la narración, las medidas y el seguimiento). El registro agrega
+             cada incidencia nueva al índice; al cargarlo, las líneas solo se reparten
+             por alumno y únicamente se decodifican las del alumno consultado.
+
+             Si el índice no existe se construye con las filas de los libros. Esas
+             incidencias no traen la narración (no está en el Excel); el expediente
+             la toma del documento de Word de la incidencia, si existe.
+
+                 python expediente.py "Ana García López"
+                 python expediente.py "Ana García López" --desde 2024-08-26 --salida ana.docx
+                 python expediente.py --reconstruir
+"""
+
+import os
+import json
+import argparse
+import threading
+from datetime import date
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from wordgen import nuevo_documento, agregar_encabezado, agregar_titulo, agregar_subtitulo, agregar_tabla
+from excelgen import EXCEL_PATH, GRAVEDADES, participantes_con_grupo
+from particiones import normalizar_nombre
+import json_manager as jm
+from metricas import medir
+import columnar
+from archivo import resolver_documento
+
+EXPEDIENTES_DIR = "expedientes"
+
+# Índices cargados: ruta del índice -> _Indice
+_indices = {}
+_candado = threading.Lock()
+
+
+# --- Índice ---
+
+def ruta_indice(ruta_excel=EXCEL_PATH):
+    """Índice del libro: junto al Excel, con el mismo nombre base."""
+    base, _ = os.path.splitext(ruta_excel)
+    return base + ".alumnos.jsonl"
+
+
+def _registro(incidente, link):
+    """
+    Datos de la incidencia que guarda el índice. Acepta el diccionario del
+    formulario (participantes como lista) o una fila de leer_incidencias (texto);
+    en el segundo caso la narración queda en None.
+    """
+    participantes = incidente.get("participantes") or []
+    if isinstance(participantes, str):
+        alumnos = [list(p) for p in participantes_con_grupo(participantes)]
+    else:
+        alumnos = [[p.get("nombre", ""), str(p.get("grado", "")), str(p.get("grupo", ""))] for p in participantes]
+    return {
+        "fecha": str(incidente.get("fecha") or "")[:10], "hora": str(incidente.get("hora") or "")[:5],
+        "lugar": incidente.get("lugar") or "", "tipo": incidente.get("tipo_inc") or incidente.get("tipo") or "",
+        "gravedad": incidente.get("gravedad") or "", "alumnos": alumnos, "link": link,
+        "narracion": incidente.get("narracion") if "narracion" in incidente else None,
+        "medidas": incidente.get("medidas") or "", "seguimiento": incidente.get("seguimiento") or "",
+    }
+
+
+def _linea(registro):
+    claves = " ".join(sorted({normalizar_nombre(a[0]) for a in registro["alumnos"] if a[0]}))
+    return f"{claves}\t{json.dumps(registro, ensure_ascii=False)}\n"
+
+
+def _escribir(ruta, lineas):
+    """Agrega líneas al índice con una sola escritura en modo append."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    fd = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, "".join(lineas).encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+class _Indice:
+    """Líneas del índice repartidas por alumno, sin decodificar."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.posicion = 0
+        self.por_alumno = {}
+
+    def actualizar(self):
+        """Lee las líneas agregadas al archivo desde la última vez (por este u otro proceso)."""
+        if not os.path.exists(self.ruta):
+            return
+        if os.path.getsize(self.ruta) < self.posicion:
+            # El índice se reconstruyó
+            self.__init__(self.ruta)
+        with open(self.ruta, "rb") as f:
+            f.seek(self.posicion)
+            datos = f.read()
+        # Una línea a medio escribir se lee en la siguiente consulta
+        fin = datos.rfind(b"\n") + 1
+        for linea in datos[:fin].splitlines():
+            claves, _, registro = linea.partition(b"\t")
+            for clave in claves.decode("ascii", "ignore").split():
+                self.por_alumno.setdefault(clave, []).append(registro)
+        self.posicion += fin
+
+    def incidencias(self, clave):
+        registros = []
+        for datos in self.por_alumno.get(clave, ()):
+            try:
+                registros.append(json.loads(datos))
+            except ValueError:
+                continue
+        return registros
+
+
+def reconstruir(ruta_excel=EXCEL_PATH):
+    """
+    Reescribe el índice con las filas de todos los libros, conservando la narración
+    de las incidencias que ya estaban indexadas. Devuelve cuántas indexó.
+    """
+    ruta = ruta_indice(ruta_excel)
+    with _candado, medir("expediente.reconstruir", archivo=ruta):
+        previos = {}
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea.partition("\t")[2])
+                    except ValueError:
+                        continue
+                    previos[registro["link"]] = registro
+        lineas = [_linea(previos.get(fila["link"]) or _registro(fila, fila["link"]))
+                  for fila in columnar.leer_ledger(ruta_excel)]
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.writelines(lineas)
+        os.replace(temporal, ruta)
+        _indices.pop(ruta, None)
+    return len(lineas)
+
+
+def _indice(ruta_excel):
+    """Índice del libro al día con su archivo; se construye la primera vez."""
+    ruta = ruta_indice(ruta_excel)
+    if not os.path.exists(ruta) and os.path.exists(ruta_excel):
+        reconstruir(ruta_excel)
+    with _candado:
+        indice = _indices.get(ruta)
+        if indice is None:
+            indice = _indices[ruta] = _Indice(ruta)
+        with medir("expediente.actualizar", archivo=ruta):
+            indice.actualizar()
+    return indice
+
+
+def agregar(incidente, link, ruta_excel=EXCEL_PATH):
+    """Agrega al índice una incidencia recién registrada."""
+    _indice(ruta_excel)
+    _escribir(ruta_indice(ruta_excel), [_linea(_registro(incidente, link))])
+
+
+def incidencias_alumno(nombre, ruta_excel=EXCEL_PATH, desde=None, hasta=None):
+    """Incidencias del alumno ordenadas por fecha y hora, sin recorrer el Excel."""
+    clave = normalizar_nombre(nombre)
+    with medir("expediente.consultar"):
+        registros = [r for r in _indice(ruta_excel).incidencias(clave)
+                     if (not desde or r["fecha"] >= desde) and (not hasta or r["fecha"] <= hasta)]
+    return sorted(registros, key=lambda r: (r["fecha"], r["hora"]))
+
+
+# --- Documento ---
+
+def _narracion_documento(link):
+    """
+    Texto de la narración tomado del Word de la incidencia (el párrafo más largo),
+    para las incidencias indexadas desde el Excel. El documento puede estar en un
+    paquete mensual (ver archivo.py).
+    """
+    ruta = resolver_documento(link)
+    if ruta is None:
+        return ""
+    try:
+        doc = Document(ruta)
+    except Exception:
+        return ""
+    return max((p.text for p in doc.paragraphs), key=len, default="").strip()
+
+
+def totales(incidencias):
+    conteo = {g: 0 for g in GRAVEDADES}
+    for inc in incidencias:
+        if inc["gravedad"] in conteo:
+            conteo[inc["gravedad"]] += 1
+    return conteo
+
+
+def construir_expediente(nombre, incidencias, alumno=None, config=None, desde=None, hasta=None):
+    """Construye en memoria el expediente del alumno."""
+    config = config or {}
+    alumno = alumno or {}
+    doc = nuevo_documento()
+    agregar_encabezado(doc)
+    agregar_titulo(doc, f"EXPEDIENTE DEL ALUMNO - {config.get('school_name') or ''}", config.get("location"))
+
+    clave = normalizar_nombre(nombre)
+    grupos = sorted({f"{a[1]}° '{a[2]}'" for inc in incidencias for a in inc["alumnos"]
+                     if normalizar_nombre(a[0]) == clave})
+    agregar_tabla(doc, ["Alumno", "Grado y grupo", "Padre/Madre"], [(
+        alumno.get("nombre") or nombre,
+        f"{alumno['grado']}° '{alumno['grupo']}'" if alumno.get("grado") else ", ".join(grupos),
+        alumno.get("padre", ""),
+    )])
+    periodo = f"del {desde or (incidencias[0]['fecha'] if incidencias else '-')} al {hasta or date.today().isoformat()}"
+    p = doc.add_paragraph(f"Historial de incidencias {periodo}. Generado el {date.today().strftime('%d/%m/%Y')}.")
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    agregar_subtitulo(doc, "Totales por gravedad")
+    conteo = totales(incidencias)
+    agregar_tabla(doc, GRAVEDADES + ["Total"], [[conteo[g] for g in GRAVEDADES] + [len(incidencias)]])
+
+    if not incidencias:
+        doc.add_paragraph("El alumno no tiene incidencias registradas en el periodo.")
+        return doc
+
+    agregar_subtitulo(doc, "Línea de tiempo")
+    agregar_tabla(doc, ["Fecha", "Hora", "Lugar", "Tipo", "Gravedad", "Otros participantes"], [
+        (inc["fecha"], inc["hora"], inc["lugar"], inc["tipo"], inc["gravedad"],
+         ", ".join(a[0] for a in inc["alumnos"] if normalizar_nombre(a[0]) != clave))
+        for inc in incidencias
+    ])
+
+    agregar_subtitulo(doc, "Narraciones")
+    for inc in incidencias:
+        p = doc.add_paragraph()
+        p.add_run(f"{inc['fecha']} {inc['hora']} - {inc['tipo'] or 'Incidencia'} ({inc['gravedad']}), "
+                  f"{inc['lugar']}").bold = True
+        narracion = inc["narracion"] if inc["narracion"] is not None else _narracion_documento(inc["link"])
+        for etiqueta, texto in (("", narracion), ("Medidas: ", inc["medidas"]), ("Seguimiento: ", inc["seguimiento"])):
+            if texto:
+                p = doc.add_paragraph(etiqueta + texto)
+                p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+    return doc
+
+
+def generar_expediente(nombre, output_path=None, ruta=EXCEL_PATH, config=None, alumnos=None,
+                       desde=None, hasta=None):
+    """Genera el expediente del alumno y devuelve la ruta del documento."""
+    config = jm.obtener_config() if config is None else config
+    alumnos = jm.obtener_alumnos() if alumnos is None else alumnos
+    alumno = next((a for a in alumnos if normalizar_nombre(a.get("nombre", "")) == normalizar_nombre(nombre)), None)
+    if output_path is None:
+        output_path = os.path.join(EXPEDIENTES_DIR, f"Expediente_{normalizar_nombre(nombre)}.docx")
+    incidencias = incidencias_alumno(nombre, ruta, desde, hasta)
+    with medir("expediente.construir", incidencias=len(incidencias)):
+        doc = construir_expediente(nombre, incidencias, alumno, config, desde, hasta)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with medir("expediente.guardar", archivo=output_path):
+        doc.save(output_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el expediente de incidencias de un alumno.")
+    parser.add_argument("alumno", nargs="?")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--desde")
+    parser.add_argument("--hasta")
+    parser.add_argument("--salida", help="Ruta del documento (por defecto en expedientes/).")
+    parser.add_argument("--reconstruir", action="store_true", help="Reconstruye el índice de alumnos.")
+    args = parser.parse_args()
+
+    if args.reconstruir:
+        print(f"{reconstruir(args.excel)} incidencias indexadas en {ruta_indice(args.excel)}")
+    if args.alumno:
+        print(generar_expediente(args.alumno, args.salida, args.excel, desde=args.desde, hasta=args.hasta))
+    elif not args.reconstruir:
+        parser.error("Indique el nombre del alumno o --reconstruir.")
+
+
+if __name__ == "__main__":
+    main()
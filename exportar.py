@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: exportar.py
+Descripción: Extractos del registro de incidencias para la supervisión (por ejemplo,
+             "todas las incidencias graves de 5° en el trimestre") en CSV, JSONL o
+             Excel, sin filtrar la hoja a mano.
+
+             Las incidencias se leen en streaming de todos los libros (los ciclos
+             cerrados desde su copia columnar, ver columnar.py), pasan por los
+             filtros y se escriben una por una: en CSV y JSONL línea por línea y en
+             Excel con un libro de solo escritura. La memoria no depende del tamaño
+             del extracto. Los libros de ciclos fuera del rango de fechas no se abren.
+
+                 python exportar.py --desde 2025-01-06 --hasta 2025-03-28 --gravedad Grave --grado 5 --salida graves_5.xlsx
+                 python exportar.py --alumno "Ana García" --salida ana.csv
+                 python exportar.py --tipo Pelea --tipo Bullying --formato jsonl --salida -
+
+             Los filtros --gravedad, --tipo y --lugar se pueden repetir; 'alumno' busca
+             el texto dentro de los participantes y --grado/--grupo seleccionan las
+             incidencias donde participó algún alumno de ese grado o grupo.
+"""
+
+import os
+import csv
+import sys
+import json
+import argparse
+
+from openpyxl import Workbook
+
+from excelgen import EXCEL_PATH, GRAVEDADES, participantes_con_grupo
+from rotacion import libros_del_periodo
+from metricas import medir
+import columnar
+
+FORMATOS = ("csv", "jsonl", "xlsx")
+COLUMNAS = ["fecha", "hora", "lugar", "tipo", "gravedad", "participantes", "link"]
+ENCABEZADO = ["Fecha", "Hora", "Lugar", "Tipo", "Gravedad", "Participantes", "Link al Documento"]
+# Cada cuántas incidencias leídas se llama a la función de progreso
+CADA_PROGRESO = 5000
+
+
+def _conjunto(valor):
+    if not valor:
+        return None
+    return {valor} if isinstance(valor, str) else set(valor)
+
+
+def filtrar(filas, desde=None, hasta=None, gravedad=None, tipo=None, lugar=None, alumno=None,
+            grado=None, grupo=None):
+    """
+    Itera las filas que cumplen todos los filtros. Las fechas se comparan como texto
+    'AAAA-MM-DD'; gravedad, tipo y lugar aceptan un valor o una lista de valores.
+    """
+    gravedades, tipos, lugares = _conjunto(gravedad), _conjunto(tipo), _conjunto(lugar)
+    alumno = alumno.lower() if alumno else None
+    grado = str(grado) if grado else None
+    for fila in filas:
+        fecha = str(fila["fecha"])[:10]
+        if (desde and fecha < desde) or (hasta and fecha > hasta):
+            continue
+        if gravedades and fila["gravedad"] not in gravedades:
+            continue
+        if tipos and fila["tipo"] not in tipos:
+            continue
+        if lugares and fila["lugar"] not in lugares:
+            continue
+        if alumno and alumno not in str(fila["participantes"]).lower():
+            continue
+        if grado or grupo:
+            if not any((not grado or g == grado) and (not grupo or gr == grupo)
+                       for _, g, gr in participantes_con_grupo(fila["participantes"])):
+                continue
+        yield fila
+
+
+def incidencias(ruta=EXCEL_PATH, progreso=None, **filtros):
+    """
+    Itera las incidencias de todos los libros que cumplen los filtros (ver filtrar).
+    progreso(leidas, exportadas) se llama cada CADA_PROGRESO incidencias leídas y
+    al terminar.
+    """
+    cuenta = {"leidas": 0, "exportadas": 0}
+
+    def leer():
+        for libro in libros_del_periodo(ruta, filtros.get("desde"), filtros.get("hasta")):
+            for fila in columnar.leer_libro(libro):
+                cuenta["leidas"] += 1
+                if progreso and cuenta["leidas"] % CADA_PROGRESO == 0:
+                    progreso(cuenta["leidas"], cuenta["exportadas"])
+                yield fila
+
+    for fila in filtrar(leer(), **filtros):
+        cuenta["exportadas"] += 1
+        yield fila
+    if progreso:
+        progreso(cuenta["leidas"], cuenta["exportadas"])
+
+
+# --- Escritores ---
+
+def _valores(fila):
+    return [str(fila[c] or "") for c in COLUMNAS]
+
+
+def escribir_csv(filas, archivo):
+    """Escribe las filas en un archivo de texto abierto. Devuelve cuántas escribió."""
+    escritor = csv.writer(archivo)
+    escritor.writerow(ENCABEZADO)
+    n = 0
+    for fila in filas:
+        escritor.writerow(_valores(fila))
+        n += 1
+    return n
+
+
+def escribir_jsonl(filas, archivo):
+    n = 0
+    for fila in filas:
+        archivo.write(json.dumps(dict(zip(COLUMNAS, _valores(fila))), ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+
+def escribir_xlsx(filas, ruta):
+    """Escribe las filas en un libro nuevo en modo de solo escritura (sin cargarlas en memoria)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Incidencias")
+    ws.column_dimensions["F"].width = 60
+    ws.append(ENCABEZADO)
+    n = 0
+    for fila in filas:
+        ws.append(_valores(fila))
+        n += 1
+    wb.save(ruta)
+    return n
+
+
+def formato_de(ruta):
+    extension = os.path.splitext(ruta)[1].lower().lstrip(".")
+    return extension if extension in FORMATOS else "csv"
+
+
+def exportar(destino, formato=None, ruta=EXCEL_PATH, progreso=None, **filtros):
+    """
+    Exporta las incidencias que cumplen los filtros a 'destino' ('-' para la salida
+    estándar en CSV o JSONL). El formato se deduce de la extensión si no se indica.
+    Devuelve el número de incidencias exportadas.
+    """
+    formato = formato or formato_de(destino)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato}")
+    if destino == "-" and formato == "xlsx":
+        raise ValueError("El formato xlsx requiere un archivo de salida.")
+    filas = incidencias(ruta, progreso, **filtros)
+
+    with medir("exportar", formato=formato) as extra:
+        if destino == "-":
+            escribir = escribir_csv if formato == "csv" else escribir_jsonl
+            n = escribir(filas, sys.stdout)
+        else:
+            os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            try:
+                if formato == "xlsx":
+                    n = escribir_xlsx(filas, temporal)
+                else:
+                    # utf-8-sig: Excel abre el CSV con los acentos correctos
+                    codificacion = "utf-8-sig" if formato == "csv" else "utf-8"
+                    with open(temporal, "w", encoding=codificacion, newline="") as f:
+                        n = (escribir_csv if formato == "csv" else escribir_jsonl)(filas, f)
+                os.replace(temporal, destino)
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+        extra["incidencias"] = n
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta incidencias filtradas a CSV, JSONL o Excel.")
+    parser.add_argument("--salida", required=True, help="Archivo de salida, o '-' para la salida estándar.")
+    parser.add_argument("--formato", choices=FORMATOS, help="Por defecto, según la extensión de --salida.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--desde")
+    parser.add_argument("--hasta")
+    parser.add_argument("--gravedad", action="append", choices=GRAVEDADES)
+    parser.add_argument("--tipo", action="append")
+    parser.add_argument("--lugar", action="append")
+    parser.add_argument("--alumno")
+    parser.add_argument("--grado")
+    parser.add_argument("--grupo")
+    parser.add_argument("--silencioso", action="store_true", help="No mostrar el avance.")
+    args = parser.parse_args()
+
+    def progreso(leidas, exportadas):
+        print(f"\r{leidas} leídas, {exportadas} exportadas", end="", file=sys.stderr, flush=True)
+
+    filtros = {k: getattr(args, k) for k in ("desde", "hasta", "gravedad", "tipo", "lugar", "alumno", "grado", "grupo")}
+    try:
+        n = exportar(args.salida, args.formato, args.excel, None if args.silencioso else progreso, **filtros)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.silencioso:
+        print(file=sys.stderr)
+    if args.salida != "-":
+        print(f"{n} incidencias exportadas a {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: graficas.py
+Descripción: Gráficas en PNG o SVG para el tablero y los reportes de Word: gravedad
+             a lo largo del tiempo, incidencias por lugar y por tipo.
+
+             Cada gráfica se dibuja a partir de los agregados de analitica.py y se
+             guarda en data/cache/graficas/ con el hash de esos datos en el nombre.
+             Si los agregados no cambiaron, se devuelve el archivo ya dibujado sin
+             volver a abrir matplotlib. matplotlib se importa solo la primera vez que
+             hay que dibujar, para no retrasar el arranque del programa.
+
+                 python graficas.py                       (las tres gráficas en PNG)
+                 python graficas.py gravedad --formato svg --desde 2025-01-01
+                 python graficas.py --limpiar 30          (borra las no usadas en 30 días)
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+from excelgen import EXCEL_PATH, GRAVEDADES
+from json_manager import DATA_DIR
+from metricas import medir
+import analitica
+
+GRAFICAS_DIR = os.path.join(DATA_DIR, "cache", "graficas")
+FORMATOS = ("png", "svg")
+# Cambiar este número invalida todas las gráficas guardadas (por ejemplo, al cambiar el estilo)
+VERSION_ESTILO = 1
+TAMANO = (8, 4.5)
+DPI = 110
+COLORES_GRAVEDAD = {"Leve": "#8BC34A", "Moderada": "#FFB300", "Grave": "#E53935"}
+MAX_CATEGORIAS = 12
+
+_plt = None
+# pyplot guarda estado global: el servidor dibuja desde varios hilos, uno a la vez
+_candado_dibujo = threading.Lock()
+
+
+def _pyplot():
+    """Importa matplotlib con un backend sin ventana, solo cuando se necesita."""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _plt = plt
+    return _plt
+
+
+def _clave(nombre, datos, formato):
+    contenido = json.dumps([VERSION_ESTILO, nombre, formato, TAMANO, DPI, datos],
+                           ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:20]
+
+
+def renderizar(nombre, datos, dibujar, formato="png", directorio=GRAFICAS_DIR):
+    """
+    Devuelve la ruta de la gráfica 'nombre' para esos datos. Solo llama a
+    dibujar(ax, datos) si no hay una imagen guardada con el mismo hash.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato}")
+    ruta = os.path.join(directorio, f"{nombre}_{_clave(nombre, datos, formato)}.{formato}")
+    if os.path.exists(ruta):
+        # Marca de uso para limpiar()
+        os.utime(ruta)
+        return ruta
+    plt = _pyplot()
+    os.makedirs(directorio, exist_ok=True)
+    with _candado_dibujo, medir("graficas.dibujar", grafica=nombre, formato=formato):
+        fig, ax = plt.subplots(figsize=TAMANO, dpi=DPI)
+        try:
+            dibujar(ax, datos)
+            fig.tight_layout()
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            fig.savefig(temporal, format=formato)
+        finally:
+            plt.close(fig)
+        os.replace(temporal, ruta)
+    return ruta
+
+
+def limpiar(dias=30, directorio=GRAFICAS_DIR):
+    """Borra las gráficas que no se han usado en 'dias' días. Devuelve cuántas borró."""
+    if not os.path.isdir(directorio):
+        return 0
+    limite = time.time() - dias * 86400
+    borradas = 0
+    with os.scandir(directorio) as it:
+        for entrada in it:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+                borradas += 1
+    return borradas
+
+
+# --- Dibujos ---
+
+def _sin_datos(ax):
+    ax.text(0.5, 0.5, "Sin incidencias", ha="center", va="center", transform=ax.transAxes)
+    ax.set_axis_off()
+
+
+def dibujar_gravedad(ax, serie):
+    if not serie:
+        return _sin_datos(ax)
+    periodos = [s["periodo"] for s in serie]
+    posiciones = range(len(periodos))
+    for g in GRAVEDADES:
+        ax.plot(posiciones, [s[g] for s in serie], marker="o", markersize=3, label=g, color=COLORES_GRAVEDAD[g])
+    paso = max(1, len(periodos) // 12)
+    ax.set_xticks(list(posiciones)[::paso])
+    ax.set_xticklabels(periodos[::paso], rotation=45, ha="right", fontsize=8)
+    ax.set_ylabel("Incidencias")
+    ax.set_title("Incidencias por gravedad")
+    ax.legend()
+    ax.grid(axis="y", alpha=0.3)
+
+
+def dibujar_barras(titulo):
+    def dibujar(ax, conteos):
+        if not conteos:
+            return _sin_datos(ax)
+        conteos = conteos[:MAX_CATEGORIAS]
+        etiquetas = [c[0] or "(sin dato)" for c in reversed(conteos)]
+        ax.barh(etiquetas, [c[1] for c in reversed(conteos)], color="#1E88E5")
+        ax.set_xlabel("Incidencias")
+        ax.set_title(titulo)
+        ax.grid(axis="x", alpha=0.3)
+    return dibujar
+
+
+def dibujar_tipo_gravedad(ax, cruce):
+    filas = [(t or "(sin dato)", c) for t, c in zip(cruce["tipos"], cruce["conteos"]) if sum(c)]
+    if not filas:
+        return _sin_datos(ax)
+    filas = sorted(filas, key=lambda f: sum(f[1]))[-MAX_CATEGORIAS:]
+    etiquetas = [f[0] for f in filas]
+    izquierda = [0] * len(filas)
+    for j, g in enumerate(cruce["gravedades"]):
+        valores = [f[1][j] for f in filas]
+        ax.barh(etiquetas, valores, left=izquierda, label=g, color=COLORES_GRAVEDAD.get(g))
+        izquierda = [a + b for a, b in zip(izquierda, valores)]
+    ax.set_xlabel("Incidencias")
+    ax.set_title("Incidencias por tipo y gravedad")
+    ax.legend()
+    ax.grid(axis="x", alpha=0.3)
+
+
+# --- Gráficas ---
+
+def grafica_gravedad(ruta=EXCEL_PATH, periodo="mes", desde=None, hasta=None, formato="png"):
+    """Líneas de incidencias por gravedad a lo largo del tiempo (por mes o semana)."""
+    serie = analitica.serie_gravedad(ruta, periodo, desde, hasta)
+    return renderizar("gravedad", serie, dibujar_gravedad, formato)
+
+
+def grafica_lugar(ruta=EXCEL_PATH, desde=None, hasta=None, formato="png"):
+    """Barras de incidencias por lugar."""
+    conteos = analitica.conteo_por("lugar", ruta, desde, hasta)
+    return renderizar("lugar", conteos, dibujar_barras("Incidencias por lugar"), formato)
+
+
+def grafica_tipo(ruta=EXCEL_PATH, desde=None, hasta=None, formato="png"):
+    """Barras apiladas de incidencias por tipo y gravedad."""
+    cruce = analitica.tipo_por_gravedad(ruta, desde, hasta)
+    return renderizar("tipo", cruce, dibujar_tipo_gravedad, formato)
+
+
+GRAFICAS = {
+    "gravedad": grafica_gravedad,
+    "lugar": grafica_lugar,
+    "tipo": grafica_tipo,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera las gráficas de incidencias.")
+    parser.add_argument("graficas", nargs="*", help=f"Gráficas a generar: {', '.join(GRAFICAS)} (por defecto todas).")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--formato", choices=FORMATOS, default="png")
+    parser.add_argument("--desde")
+    parser.add_argument("--hasta")
+    parser.add_argument("--limpiar", type=int, metavar="DIAS", help="Borra las gráficas no usadas en DIAS días.")
+    args = parser.parse_args()
+
+    desconocidas = [g for g in args.graficas if g not in GRAFICAS]
+    if desconocidas:
+        parser.error(f"Gráficas desconocidas: {', '.join(desconocidas)}")
+    if args.limpiar is not None:
+        print(f"{limpiar(args.limpiar)} gráficas borradas.")
+        return
+    for nombre in args.graficas or GRAFICAS:
+        print(GRAFICAS[nombre](args.excel, desde=args.desde, hasta=args.hasta, formato=args.formato))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ Descripción: Funciones para gestionar (leer/escribir) los archivos de datos JSO
 import json
 import os
 
+from metricas import medir
+
 DATA_DIR = "data"
 ALUMNOS_FILE = os.path.join(DATA_DIR, "alumnos.json")
 LOCATIONS_FILE = os.path.join(DATA_DIR, "ubicaciones.json")
@@ -24,18 +26,27 @@ def leer_json(filepath, default_value=None):
         escribir_json(filepath, default_value)
         return default_value
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with medir("json.leer", archivo=filepath):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
     except (json.JSONDecodeError, IOError):
         return default_value
 
 def escribir_json(filepath, data):
-    """Escribe datos en un archivo JSON."""
+    """
+    Escribe datos en un archivo JSON. Se escribe en un archivo temporal que luego
+    reemplaza al original, así que quien lo lea nunca ve el archivo a medias.
+    """
+    temporal = f"{filepath}.{os.getpid()}.tmp"
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        with medir("json.escribir", archivo=filepath):
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(temporal, filepath)
         return True
     except IOError:
+        if os.path.exists(temporal):
+            os.remove(temporal)
         return False
 
 # --- Funciones específicas para cada tipo de dato ---
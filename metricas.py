@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: metricas.py
+Descripción: Medición opcional de tiempos por etapa del registro (construcción y
+             guardado del Word, carga y guardado del Excel, ajuste de columnas,
+             recálculo del dashboard y lectura/escritura de JSON).
+
+             Se activa con "metricas": true en config.json o con la variable de
+             entorno BITACORAS_METRICAS=1. Cada etapa se escribe como una línea JSON
+             en data/metricas/metricas.jsonl (archivo rotativo); las que superan
+             "umbral_lento_ms" (por defecto 2000) se marcan como lentas y se copian a
+             data/metricas/lentas.log.
+
+             Reporte de latencias:
+                 python metricas.py --dias 7
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
+
+METRICAS_DIR = os.path.join("data", "metricas")
+METRICAS_FILE = os.path.join(METRICAS_DIR, "metricas.jsonl")
+LENTAS_FILE = os.path.join(METRICAS_DIR, "lentas.log")
+TAMANO_MAXIMO = 1024 * 1024
+RESPALDOS = 5
+UMBRAL_LENTO_MS = 2000
+
+_activo = os.environ.get("BITACORAS_METRICAS") == "1"
+_umbral_ms = UMBRAL_LENTO_MS
+_logger = None
+
+
+def configurar(config):
+    """Activa o desactiva la medición según la configuración cargada."""
+    global _activo, _umbral_ms
+    _activo = bool(config.get("metricas")) or os.environ.get("BITACORAS_METRICAS") == "1"
+    _umbral_ms = float(config.get("umbral_lento_ms", UMBRAL_LENTO_MS))
+
+
+def activo():
+    return _activo
+
+
+def _obtener_logger():
+    global _logger
+    if _logger is None:
+        os.makedirs(METRICAS_DIR, exist_ok=True)
+        _logger = logging.getLogger("bitacoras.metricas")
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        formato = logging.Formatter("%(message)s")
+        todas = RotatingFileHandler(METRICAS_FILE, maxBytes=TAMANO_MAXIMO, backupCount=RESPALDOS, encoding="utf-8")
+        todas.setFormatter(formato)
+        lentas = RotatingFileHandler(LENTAS_FILE, maxBytes=TAMANO_MAXIMO, backupCount=RESPALDOS, encoding="utf-8")
+        lentas.setLevel(logging.WARNING)
+        lentas.setFormatter(formato)
+        _logger.addHandler(todas)
+        _logger.addHandler(lentas)
+    return _logger
+
+
+@contextmanager
+def medir(etapa, archivo=None, **extra):
+    """
+    Mide el bloque como la etapa indicada. Si se pasa 'archivo', al terminar se
+    registra su tamaño en bytes. El diccionario devuelto permite agregar datos
+    (por ejemplo, el número de filas) desde dentro del bloque.
+    """
+    if not _activo:
+        yield extra
+        return
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield extra
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        registro = {"ts": datetime.now().isoformat(timespec="milliseconds"), "etapa": etapa, "ms": round(ms, 2)}
+        if archivo:
+            try:
+                registro["bytes"] = os.path.getsize(archivo)
+            except OSError:
+                pass
+        registro.update(extra)
+        if error:
+            registro["error"] = error
+        lenta = ms > _umbral_ms
+        if lenta:
+            registro["lenta"] = True
+        try:
+            _obtener_logger().log(logging.WARNING if lenta else logging.INFO,
+                                  json.dumps(registro, ensure_ascii=False, default=str))
+        except OSError:
+            # Las métricas nunca deben impedir un registro
+            pass
+
+
+# --- Reporte ---
+
+def _archivos_metricas():
+    archivos = [METRICAS_FILE] + [f"{METRICAS_FILE}.{i}" for i in range(1, RESPALDOS + 1)]
+    return [a for a in archivos if os.path.exists(a)]
+
+
+def leer_registros(dias=7):
+    """Itera los registros de los últimos 'dias' días."""
+    desde = (datetime.now() - timedelta(days=dias)).isoformat()
+    for archivo in _archivos_metricas():
+        with open(archivo, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                if registro.get("ts", "") >= desde:
+                    yield registro
+
+
+def _percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    k = (len(valores_ordenados) - 1) * p
+    bajo = int(k)
+    alto = min(bajo + 1, len(valores_ordenados) - 1)
+    return valores_ordenados[bajo] + (valores_ordenados[alto] - valores_ordenados[bajo]) * (k - bajo)
+
+
+def resumir(dias=7):
+    """Devuelve {etapa: {'n', 'p50', 'p95', 'max', 'lentas', 'bytes_promedio'}}."""
+    por_etapa = {}
+    for r in leer_registros(dias):
+        por_etapa.setdefault(r["etapa"], []).append(r)
+    resumen = {}
+    for etapa, registros in sorted(por_etapa.items()):
+        tiempos = sorted(r["ms"] for r in registros)
+        tamanos = [r["bytes"] for r in registros if "bytes" in r]
+        resumen[etapa] = {
+            "n": len(registros),
+            "p50": _percentil(tiempos, 0.50),
+            "p95": _percentil(tiempos, 0.95),
+            "max": tiempos[-1],
+            "lentas": sum(1 for r in registros if r.get("lenta")),
+            "bytes_promedio": sum(tamanos) // len(tamanos) if tamanos else None,
+        }
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de latencias por etapa.")
+    parser.add_argument("--dias", type=int, default=7)
+    args = parser.parse_args()
+
+    resumen = resumir(args.dias)
+    if not resumen:
+        print(f"No hay métricas de los últimos {args.dias} días en {METRICAS_DIR}.")
+        return
+    print(f"{'Etapa':<20} {'N':>6} {'p50 ms':>10} {'p95 ms':>10} {'máx ms':>10} {'lentas':>7} {'bytes':>10}")
+    for etapa, r in resumen.items():
+        print(f"{etapa:<20} {r['n']:>6} {r['p50']:>10.1f} {r['p95']:>10.1f} {r['max']:>10.1f} "
+              f"{r['lentas']:>7} {r['bytes_promedio'] if r['bytes_promedio'] is not None else '':>10}")
+
+
+if __name__ == "__main__":
+    main()
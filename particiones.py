@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: particiones.py
+Descripción: Partición de los datos por escuela, grado y grupo. Cada partición tiene
+             su propio Excel, su carpeta de incidencias y un resumen precalculado:
+
+                 data/escuelas/<escuela>/config.json              (director, ubicación...)
+                 data/escuelas/<escuela>/<grado>_<grupo>/config.json   (maestro titular)
+                 data/escuelas/<escuela>/<grado>_<grupo>/bitacoras.xlsx
+                 data/escuelas/<escuela>/<grado>_<grupo>/resumen.json
+                 data/escuelas/<escuela>/<grado>_<grupo>/incidencias/
+                 data/escuelas/<escuela>[/<grado>_<grupo>]/particion.json  (nombres originales)
+
+             Los nombres de carpeta se normalizan, así que "Benito-Juárez" y "Benito
+             Juarez" caerían en la misma; particion.json guarda los nombres con los que
+             se creó la partición y se rechaza abrirla con otros.
+
+             Escribir en una partición solo toca sus propios archivos. Las consultas
+             de varias particiones suman los resumen.json (con caché en memoria) en
+             lugar de abrir el Excel de cada grupo.
+"""
+
+import os
+import re
+import json
+import argparse
+import unicodedata
+
+from excelgen import GRAVEDADES, nombres_participantes
+from rotacion import rutas_ledger
+from json_manager import DATA_DIR, leer_json, escribir_json, obtener_config
+import columnar
+
+ESCUELAS_DIR = os.path.join(DATA_DIR, "escuelas")
+RESUMEN_ARCHIVO = "resumen.json"
+NOMBRES_ARCHIVO = "particion.json"
+
+# Caché en memoria: ruta de resumen.json -> (mtime_ns, contenido)
+_cache_resumenes = {}
+# Caché del resumen combinado: escuela -> (firma de las particiones, resultado)
+_cache_global = {}
+
+
+def normalizar_nombre(texto):
+    """Convierte un nombre de escuela o grupo en un nombre de carpeta seguro."""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    texto = re.sub(r"[^A-Za-z0-9]+", "_", texto).strip("_").lower()
+    return texto or "sin_nombre"
+
+
+def directorio_particion(escuela, grado, grupo):
+    return os.path.join(ESCUELAS_DIR, normalizar_nombre(escuela), normalizar_nombre(f"{grado}_{grupo}"))
+
+
+def listar_particiones(escuela=None):
+    """Devuelve [(escuela, directorio)] de las particiones existentes."""
+    particiones = []
+    if not os.path.isdir(ESCUELAS_DIR):
+        return particiones
+    escuelas = [normalizar_nombre(escuela)] if escuela else sorted(os.listdir(ESCUELAS_DIR))
+    for nombre_escuela in escuelas:
+        dir_escuela = os.path.join(ESCUELAS_DIR, nombre_escuela)
+        if not os.path.isdir(dir_escuela):
+            continue
+        for nombre_grupo in sorted(os.listdir(dir_escuela)):
+            dir_grupo = os.path.join(dir_escuela, nombre_grupo)
+            if os.path.isdir(dir_grupo):
+                particiones.append((nombre_escuela, dir_grupo))
+    return particiones
+
+
+def config_particion(escuela, grado, grupo):
+    """
+    Configuración efectiva de una partición: la configuración general, sobrescrita
+    por la de la escuela y luego por la del grupo. El nombre de la escuela es el de
+    la partición salvo que la configuración de la escuela o del grupo lo cambie.
+    """
+    config = dict(obtener_config(), school_name=escuela)
+    dir_grupo = directorio_particion(escuela, grado, grupo)
+    for ruta in (os.path.join(os.path.dirname(dir_grupo), "config.json"), os.path.join(dir_grupo, "config.json")):
+        if os.path.exists(ruta):
+            config.update(leer_json(ruta, {}))
+    config.update({"school_name": config.get("school_name") or escuela, "grade": str(grado), "group": str(grupo)})
+    config["incidencias_dir"] = os.path.join(dir_grupo, "incidencias")
+    return config
+
+
+def _comparable(texto):
+    return " ".join(str(texto).split()).casefold()
+
+
+def _registrar_nombres(directorio, nombres):
+    """
+    Guarda los nombres originales de la carpeta la primera vez y lanza ValueError
+    si ya se creó con otros nombres que se normalizan igual.
+    """
+    ruta = os.path.join(directorio, NOMBRES_ARCHIVO)
+    previos = leer_json(ruta, {})
+    if not previos:
+        escribir_json(ruta, nombres)
+        return
+    for clave, valor in nombres.items():
+        if _comparable(previos.get(clave, valor)) != _comparable(valor):
+            raise ValueError(f"La carpeta {directorio} ya es de {clave} '{previos[clave]}', no de '{valor}'.")
+
+
+def rutas_particion(escuela, grado, grupo):
+    """
+    Devuelve (config, ruta_excel, incidencias_dir) de la partición, creando su
+    carpeta. Lanza ValueError si otra partición ya usa la misma carpeta.
+    """
+    dir_grupo = directorio_particion(escuela, grado, grupo)
+    os.makedirs(os.path.dirname(dir_grupo), exist_ok=True)
+    _registrar_nombres(os.path.dirname(dir_grupo), {"escuela": str(escuela)})
+    os.makedirs(dir_grupo, exist_ok=True)
+    _registrar_nombres(dir_grupo, {"escuela": str(escuela), "grado": str(grado), "grupo": str(grupo)})
+    config = config_particion(escuela, grado, grupo)
+    return config, os.path.join(dir_grupo, "bitacoras.xlsx"), config["incidencias_dir"]
+
+
+# --- Resúmenes precalculados ---
+
+def _firma(ruta):
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _resumen_vacio():
+    return {"total": 0, "gravedad": {g: 0 for g in GRAVEDADES}, "lugar": {}, "mes": {}, "alumno": {}}
+
+
+def _acumular(resumen, fila, participantes):
+    resumen["total"] += 1
+    if fila["gravedad"] in resumen["gravedad"]:
+        resumen["gravedad"][fila["gravedad"]] += 1
+    lugar = fila.get("lugar") or ""
+    resumen["lugar"][lugar] = resumen["lugar"].get(lugar, 0) + 1
+    mes = str(fila.get("fecha") or "")[:7]
+    resumen["mes"][mes] = resumen["mes"].get(mes, 0) + 1
+    for nombre in participantes:
+        resumen["alumno"][nombre] = resumen["alumno"].get(nombre, 0) + 1
+
+
+def reconstruir_resumen(ruta_excel):
+    """Recalcula el resumen de una partición leyendo sus libros (solo lectura)."""
+    resumen = _resumen_vacio()
+    # Incluye los ciclos escolares ya archivados junto al libro actual
+    for ruta in rutas_ledger(ruta_excel):
+        for fila in columnar.leer_libro(ruta):
+            _acumular(resumen, fila, nombres_participantes(fila["participantes"]))
+    resumen["firma_excel"] = _firma(ruta_excel)
+    escribir_json(os.path.join(os.path.dirname(ruta_excel), RESUMEN_ARCHIVO), resumen)
+    return resumen
+
+
+def acumular_resumen(ruta_excel, filas, firma_previa=None):
+    """
+    Suma al resumen de la partición las filas recién registradas. Si el resumen no
+    corresponde al Excel anterior a esta escritura (por ejemplo, alguien lo editó a
+    mano), se reconstruye completo.
+    """
+    ruta_resumen = os.path.join(os.path.dirname(ruta_excel), RESUMEN_ARCHIVO)
+    resumen = leer_json(ruta_resumen, None) if os.path.exists(ruta_resumen) else None
+    if not resumen or resumen.get("firma_excel") != firma_previa:
+        return reconstruir_resumen(ruta_excel)
+    for fila in filas:
+        _acumular(resumen, fila, [p["nombre"] for p in fila["participantes"]])
+    resumen["firma_excel"] = _firma(ruta_excel)
+    escribir_json(ruta_resumen, resumen)
+    return resumen
+
+
+def firma_excel(ruta_excel):
+    """Firma (tamaño, mtime) del Excel, para pasarla a acumular_resumen tras escribir."""
+    return _firma(ruta_excel)
+
+
+def leer_resumen(dir_particion):
+    """
+    Lee el resumen de una partición, usando la caché si el archivo no cambió. Si el
+    Excel se modificó por fuera del programa, el resumen se reconstruye.
+    """
+    ruta_resumen = os.path.join(dir_particion, RESUMEN_ARCHIVO)
+    ruta_excel = os.path.join(dir_particion, "bitacoras.xlsx")
+    if not os.path.exists(ruta_excel):
+        return _resumen_vacio()
+    firma = _firma(ruta_resumen)
+    en_cache = _cache_resumenes.get(ruta_resumen)
+    if firma and en_cache and en_cache[0] == firma[1]:
+        resumen = en_cache[1]
+    else:
+        resumen = leer_json(ruta_resumen, {}) if firma else {}
+    if resumen.get("firma_excel") != _firma(ruta_excel):
+        resumen = reconstruir_resumen(ruta_excel)
+        firma = _firma(ruta_resumen)
+    _cache_resumenes[ruta_resumen] = (firma[1], resumen)
+    return resumen
+
+
+def _firma_particiones(particiones):
+    return tuple(
+        (d, tuple(_firma(os.path.join(d, RESUMEN_ARCHIVO)) or ()), tuple(_firma(os.path.join(d, "bitacoras.xlsx")) or ()))
+        for _, d in particiones
+    )
+
+
+def resumen_global(escuela=None):
+    """
+    Combina los resúmenes de todas las particiones (o de una escuela). El resultado
+    se reutiliza mientras ningún resumen.json cambie.
+    """
+    particiones = listar_particiones(escuela)
+    firma = _firma_particiones(particiones)
+    clave = normalizar_nombre(escuela) if escuela else None
+    en_cache = _cache_global.get(clave)
+    if en_cache and en_cache[0] == firma:
+        return en_cache[1]
+
+    total = _resumen_vacio()
+    total["particiones"] = {}
+    for nombre_escuela, dir_particion in particiones:
+        resumen = leer_resumen(dir_particion)
+        total["particiones"][f"{nombre_escuela}/{os.path.basename(dir_particion)}"] = resumen["total"]
+        total["total"] += resumen["total"]
+        for campo in ("gravedad", "lugar", "mes", "alumno"):
+            for k, v in resumen[campo].items():
+                total[campo][k] = total[campo].get(k, 0) + v
+    # La firma se toma de nuevo por si algún resumen se reconstruyó durante la lectura
+    firma = _firma_particiones(particiones)
+    _cache_global[clave] = (firma, total)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Particiones de datos por escuela/grado/grupo.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("listar", help="Lista las particiones existentes.")
+    p_res = sub.add_parser("resumen", help="Resumen combinado de las particiones.")
+    p_res.add_argument("--escuela")
+    p_crear = sub.add_parser("crear", help="Crea la carpeta de una partición.")
+    for campo in ("escuela", "grado", "grupo"):
+        p_crear.add_argument(f"--{campo}", required=True)
+    args = parser.parse_args()
+
+    if args.comando == "listar":
+        for escuela, directorio in listar_particiones():
+            print(f"{escuela}\t{directorio}")
+    elif args.comando == "resumen":
+        print(json.dumps(resumen_global(args.escuela), ensure_ascii=False, indent=2))
+    elif args.comando == "crear":
+        try:
+            _, ruta_excel, _ = rutas_particion(args.escuela, args.grado, args.grupo)
+        except ValueError as e:
+            parser.error(str(e))
+        print(os.path.dirname(ruta_excel))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,10 +13,16 @@ import json # Necesario para la configuración
 import setup  # Importar el nuevo módulo de configuración
 setup.run_setup()  # Ejecutar la configuración inicial
 
-from wordgen import generar_word
-from excelgen import registrar_incidencia, actualizar_dashboard, inicializar_excel
-from resources import load_all_resources
+from excelgen import inicializar_excel
+from rotacion import rotar_si_corresponde
+from servicio import crear_contexto, crear_contexto_particion, registrar, reproducir
+from servidor import registrar_remoto
 import json_manager as jm
+import metricas
+import vigilante
+import duplicados
+import expediente
+import promocion
 
 # --- Cargar configuración global ---
 CONFIG = jm.obtener_config()
@@ -28,6 +34,9 @@ TEACHER_NAME = CONFIG.get("teacher_name", "Nombre Maestro")
 GRADE = CONFIG.get("grade", "1")
 GROUP = CONFIG.get("group", "A")
 
+# Cambios hechos a los JSON de data/ por otras herramientas
+vigilante_datos = vigilante.Vigilante()
+
 # ===================== VARIABLES GLOBALES =====================
 alumnos_data_global, padres_data_global, locations_data_global, tipos_data_global = [], {}, [], []
 alumnos_externos = []
@@ -36,8 +45,19 @@ maestros_externos = []
 # ===================== INICIALIZACIÓN =====================
 def inicializar_sistema():
     """Inicializa Excel y crea directorios necesarios."""
+    metricas.configurar(CONFIG)
     inicializar_excel()
+    rotar_si_corresponde()
     os.makedirs(INCIDENCIAS_DIR, exist_ok=True)
+    # Incidencias que quedaron en el diario sin llegar al Excel (ver diario.py)
+    try:
+        if CONFIG.get("usar_particiones"):
+            contexto = crear_contexto_particion(SCHOOL_NAME, GRADE, GROUP)
+        else:
+            contexto = crear_contexto(config=CONFIG, incidencias_dir=INCIDENCIAS_DIR)
+        reproducir(contexto)
+    except Exception as e:
+        print(f"Advertencia: no se pudieron aplicar las incidencias pendientes del diario: {e}")
 
 # ===================== FUNCIONES DE LA APLICACIÓN =====================
 
@@ -45,11 +65,16 @@ def inicializar_sistema():
 
 def recargar_recursos_y_actualizar_ui():
     """Recarga los datos desde los JSON y actualiza los widgets."""
-    global alumnos_data_global, padres_data_global, locations_data_global, tipos_data_global
+    recargar_config()
+    recargar_alumnos()
+    recargar_ubicaciones()
+    recargar_tipos()
+
+def recargar_config():
+    """Recarga config.json y actualiza lo que depende de ella (grupo actual y campos de configuración)."""
     global CONFIG, INCIDENCIAS_DIR, SCHOOL_NAME, LOCATION, DIRECTOR_NAME, TEACHER_NAME, GRADE, GROUP
-    
-    # Recargar configuración
     CONFIG = jm.obtener_config()
+    vigilante_datos.visto(jm.CONFIG_FILE)
     INCIDENCIAS_DIR = CONFIG.get("incidencias_dir", "incidencias")
     SCHOOL_NAME = CONFIG.get("school_name", "Nombre Escuela")
     LOCATION = CONFIG.get("location", "Ubicación Escuela")
@@ -57,41 +82,78 @@ def recargar_recursos_y_actualizar_ui():
     TEACHER_NAME = CONFIG.get("teacher_name", "Nombre Maestro")
     GRADE = CONFIG.get("grade", "1")
     GROUP = CONFIG.get("group", "A")
+    metricas.configurar(CONFIG)
+    os.makedirs(INCIDENCIAS_DIR, exist_ok=True)
 
-    # Cargar otros recursos
-    alumnos_data_global, padres_data_global, locations_data_global, tipos_data_global = load_all_resources()
+    label_alumnos_grupo.config(text=f"Alumnos de {GRADE}° '{GROUP}':")
+    actualizar_lista_alumnos_grupo()
+    # No sobrescribir lo que el usuario está editando
+    if btn_guardar_config is not None and str(btn_guardar_config["state"]) != tk.NORMAL:
+        poblar_campos_config()
+
+def recargar_alumnos():
+    """Recarga alumnos.json y actualiza la lista del grupo y la tabla de administración."""
+    global alumnos_data_global, padres_data_global
+    alumnos_data_global = jm.obtener_alumnos()
+    vigilante_datos.visto(jm.ALUMNOS_FILE)
+    padres_data_global = {a.get("nombre"): a.get("padre", "") for a in alumnos_data_global}
+    actualizar_lista_alumnos_grupo()
+    if tree_alumnos is not None and str(btn_guardar_alumno["state"]) != tk.NORMAL:
+        poblar_treeview_alumnos()
 
-    # Actualizar comboboxes
+def recargar_ubicaciones():
+    global locations_data_global
+    locations_data_global = jm.obtener_ubicaciones()
+    vigilante_datos.visto(jm.LOCATIONS_FILE)
     combo_lugar['values'] = locations_data_global
-    combo_tipo['values'] = tipos_data_global
-
-    # Actualizar listbox de alumnos (solo los del grupo actual)
-    actualizar_lista_alumnos_grupo()
-    
-    # Actualizar la pestaña de administración
-    poblar_treeview_alumnos()
     poblar_listbox_ubicaciones()
+
+def recargar_tipos():
+    global tipos_data_global
+    tipos_data_global = jm.obtener_tipos_incidencia()
+    vigilante_datos.visto(jm.TIPOS_FILE)
+    combo_tipo['values'] = tipos_data_global
     poblar_listbox_tipos()
-    poblar_campos_config() # Llenar campos de configuración
+
+def revisar_archivos_datos():
+    """Recarga los archivos de datos que otra herramienta modificó (ver vigilante.py)."""
+    recargas = {
+        jm.CONFIG_FILE: recargar_config, jm.ALUMNOS_FILE: recargar_alumnos,
+        jm.LOCATIONS_FILE: recargar_ubicaciones, jm.TIPOS_FILE: recargar_tipos,
+    }
+    try:
+        for ruta in vigilante_datos.cambios():
+            with metricas.medir("vigilante.recargar", archivo=ruta):
+                recargas[ruta]()
+    except Exception as e:
+        print(f"Advertencia: no se pudieron recargar los archivos de datos: {e}")
+    root.after(vigilante.INTERVALO_MS, revisar_archivos_datos)
 
 def actualizar_lista_alumnos_grupo():
-    """Filtra y muestra solo los alumnos del grupo actual."""
+    """Filtra y muestra solo los alumnos del grupo actual, conservando la selección."""
+    seleccionados = {listbox_alumnos.get(i) for i in listbox_alumnos.curselection()}
     listbox_alumnos.delete(0, tk.END)
     if alumnos_data_global: # Asegurarse de que alumnos no esté vacío
         for alumno in alumnos_data_global:
             if alumno.get("grado") == GRADE and alumno.get("grupo") == GROUP:
                 listbox_alumnos.insert(tk.END, alumno.get("nombre", ""))
+                if alumno.get("nombre", "") in seleccionados:
+                    listbox_alumnos.selection_set(tk.END)
 
 def toggle_alumnos_externos():
     if var_check_externos.get():
+        if frame_externos is None:
+            construir_frame_externos()
         frame_externos.pack(fill="x", expand=True, padx=10, pady=5)
-    else:
+    elif frame_externos is not None:
         frame_externos.pack_forget()
 
 def toggle_maestros_externos():
     if var_check_maestros.get():
+        if frame_maestros_externos is None:
+            construir_frame_maestros_externos()
         frame_maestros_externos.pack(fill="x", expand=True, padx=10, pady=5)
-    else:
+    elif frame_maestros_externos is not None:
         frame_maestros_externos.pack_forget()
 
 def agregar_alumno_externo():
@@ -142,12 +204,14 @@ def limpiar_formulario():
         text_widget.delete("1.0", tk.END)
     
     alumnos_externos.clear()
-    listbox_externos.delete(0, tk.END)
+    if listbox_externos is not None:
+        listbox_externos.delete(0, tk.END)
     var_check_externos.set(False)
     toggle_alumnos_externos()
 
     maestros_externos.clear()
-    listbox_maestros.delete(0, tk.END)
+    if listbox_maestros is not None:
+        listbox_maestros.delete(0, tk.END)
     var_check_maestros.set(False)
     toggle_maestros_externos()
     
@@ -178,34 +242,64 @@ def generar_doc():
         messagebox.showwarning("Falta información", "Debe seleccionar al menos un alumno y completar todos los menús desplegables.")
         return
 
-    # Preparar y generar documentos
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombres_alumnos = "_".join(p["nombre"] for p in participantes).replace(" ", "")
-    output_filename = f"Incidencia_{nombres_alumnos}_{timestamp}.docx"
-    output_path = os.path.join(INCIDENCIAS_DIR, output_filename)
+    incidente = {
+        **datos, "participantes": participantes,
+        "maestros_externos": maestros_externos, "teacher_name": TEACHER_NAME
+    }
 
-    try:
-        generar_word(
-            **datos, participantes=participantes, padres_dict=padres_data_global,
-            output_path=output_path, maestros_externos=maestros_externos,
-            school_name=SCHOOL_NAME, director_name=DIRECTOR_NAME,
-            teacher_name=TEACHER_NAME, grade=GRADE, group=GROUP
-        )
-        datos_excel = {k: v for k, v in datos.items() if k in ["fecha", "hora", "lugar", "gravedad"]}
-        datos_excel["participantes"] = participantes
-        datos_excel["link"] = output_path
-        registrar_incidencia(datos_excel)
-        actualizar_dashboard()
-        messagebox.showinfo("Éxito", f"Incidencia registrada.\nWord guardado en: {output_path}")
+    # Si hay un servidor configurado, él genera el documento y escribe el Excel
+    servidor_url = CONFIG.get("servidor_url")
+    if servidor_url:
+        if CONFIG.get("usar_particiones"):
+            incidente.update({"escuela": SCHOOL_NAME, "grado": GRADE, "grupo": GROUP})
+        try:
+            resp = registrar_remoto(servidor_url, incidente)
+            if resp.get("duplicados"):
+                if not confirmar_duplicado(incidente, resp["duplicados"]):
+                    return
+                resp = registrar_remoto(servidor_url, incidente)
+            if resp.get("pendiente"):
+                messagebox.showwarning("Registro pendiente", f"Word guardado en: {resp['link']}\n{resp['error']}")
+            else:
+                messagebox.showinfo("Éxito", f"Incidencia registrada.\nWord guardado en: {resp['link']}")
+            limpiar_formulario()
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo registrar en el servidor:\n{e}")
+        return
+
+    # Generar el documento y registrarlo en Excel
+    if CONFIG.get("usar_particiones"):
+        # Cada escuela/grado/grupo escribe en su propia carpeta (ver particiones.py)
+        contexto = crear_contexto_particion(SCHOOL_NAME, GRADE, GROUP, padres=padres_data_global)
+    else:
+        contexto = crear_contexto(config=CONFIG, padres=padres_data_global, incidencias_dir=INCIDENCIAS_DIR)
+    resultado = registrar(incidente, contexto)
+    if resultado["duplicados"]:
+        if not confirmar_duplicado(incidente, resultado["duplicados"]):
+            return
+        resultado = registrar(incidente, contexto)
+    if resultado["ok"] and resultado["pendiente"]:
+        # El Word existe y la incidencia está en el diario; falta escribirla en el Excel
+        messagebox.showwarning("Registro pendiente", f"Word guardado en: {resultado['link']}\n{resultado['error']}")
         limpiar_formulario()
-    except Exception as e:
-        messagebox.showerror("Error", f"No se pudo generar el documento o registrar en Excel:\n{e}")
+    elif resultado["ok"]:
+        messagebox.showinfo("Éxito", f"Incidencia registrada.\nWord guardado en: {resultado['link']}")
+        limpiar_formulario()
+    else:
+        messagebox.showerror("Error", f"No se pudo generar el documento o registrar en Excel:\n{resultado['error']}")
+
+def confirmar_duplicado(incidente, similares):
+    """Pregunta si se registra una incidencia que parece duplicada; si es así, la marca para reenviarla."""
+    if messagebox.askyesno("Posible duplicado", f"{duplicados.describir(similares)}\n\n¿Registrar de todos modos?"):
+        incidente["confirmar_duplicado"] = True
+        return True
+    return False
 
 # --- Funciones de la Pestaña de Administración ---
 
 def poblar_treeview_alumnos():
     tree_alumnos.delete(*tree_alumnos.get_children())
-    for alumno in jm.obtener_alumnos():
+    for alumno in alumnos_data_global:
         tree_alumnos.insert("", "end", values=(alumno.get('nombre', ''), alumno.get('padre', ''), alumno.get('grado', ''), alumno.get('grupo', '')))
 
 def on_alumno_select(event):
@@ -250,13 +344,37 @@ def guardar_cambios_alumno():
             alumno["grupo"] = entry_admin_grupo.get()
             break
     jm.guardar_alumnos(alumnos_data)
-    recargar_recursos_y_actualizar_ui()
     limpiar_campos_admin_alumnos()
     set_state_admin_alumnos(tk.DISABLED) # Volver a deshabilitar
     btn_modificar_alumno.config(state=tk.NORMAL)
     btn_guardar_alumno.config(state=tk.DISABLED)
+    recargar_alumnos()
     # tree_alumnos.config(state=tk.NORMAL) # Habilitar selección de nuevo
 
+def agregar_alumno():
+    """La primera vez habilita los campos vacíos; la segunda agrega el alumno capturado."""
+    if str(entry_admin_nombre["state"]) == tk.DISABLED:
+        limpiar_campos_admin_alumnos()
+        set_state_admin_alumnos(tk.NORMAL)
+        btn_modificar_alumno.config(state=tk.DISABLED)
+        entry_admin_nombre.focus_set()
+        return
+    nuevo = {
+        "nombre": entry_admin_nombre.get().strip(), "padre": entry_admin_padre.get().strip(),
+        "grado": entry_admin_grado.get().strip(), "grupo": entry_admin_grupo.get().strip(),
+    }
+    if not all([nuevo["nombre"], nuevo["grado"], nuevo["grupo"]]):
+        messagebox.showwarning("Datos incompletos", "Debe rellenar nombre, grado y grupo.")
+        return
+    alumnos_data = jm.obtener_alumnos()
+    if any(a.get("nombre") == nuevo["nombre"] for a in alumnos_data):
+        messagebox.showwarning("Alumno existente", f"Ya existe un alumno llamado {nuevo['nombre']}.")
+        return
+    alumnos_data.append(nuevo)
+    jm.guardar_alumnos(alumnos_data)
+    limpiar_campos_admin_alumnos()
+    recargar_alumnos()
+
 def eliminar_alumno():
     if not tree_alumnos.selection():
         messagebox.showwarning("Sin selección", "Seleccione un alumno para eliminar.")
@@ -264,8 +382,40 @@ def eliminar_alumno():
     nombre_a_eliminar = tree_alumnos.item(tree_alumnos.selection()[0], "values")[0]
     alumnos_data = [a for a in jm.obtener_alumnos() if a["nombre"] != nombre_a_eliminar]
     jm.guardar_alumnos(alumnos_data)
-    recargar_recursos_y_actualizar_ui()
     limpiar_campos_admin_alumnos()
+    recargar_alumnos()
+
+def generar_expediente_alumno():
+    if not tree_alumnos.selection():
+        messagebox.showwarning("Sin selección", "Seleccione un alumno para generar su expediente.")
+        return
+    nombre, _, grado, grupo = tree_alumnos.item(tree_alumnos.selection()[0], "values")
+    if CONFIG.get("usar_particiones"):
+        contexto = crear_contexto_particion(SCHOOL_NAME, grado, grupo)
+    else:
+        contexto = crear_contexto(config=CONFIG, incidencias_dir=INCIDENCIAS_DIR)
+    try:
+        ruta = expediente.generar_expediente(nombre, ruta=contexto["excel_path"], config=CONFIG, alumnos=alumnos_data_global)
+        messagebox.showinfo("Expediente", f"Expediente guardado en: {ruta}")
+    except Exception as e:
+        messagebox.showerror("Error", f"No se pudo generar el expediente:\n{e}")
+
+def promover_fin_de_ciclo():
+    """Promueve a todos los alumnos al grado siguiente y da de baja a los que egresan (ver promocion.py)."""
+    nuevos, cambios, avisos = promocion.transformar(jm.obtener_alumnos(), grado_final=int(CONFIG.get("grado_final", promocion.GRADO_FINAL)))
+    if not cambios:
+        messagebox.showinfo("Fin de ciclo", promocion.vista_previa(cambios, avisos))
+        return
+    if not messagebox.askyesno("Fin de ciclo", f"{promocion.vista_previa(cambios, avisos, limite=20)}\n\n¿Aplicar los cambios?"):
+        return
+    try:
+        respaldo = promocion.aplicar(nuevos)
+    except OSError as e:
+        messagebox.showerror("Error", f"No se pudo guardar la lista de alumnos:\n{e}")
+        return
+    limpiar_campos_admin_alumnos()
+    recargar_alumnos()
+    messagebox.showinfo("Fin de ciclo", f"Lista actualizada.\nRespaldo de la lista anterior: {respaldo}")
 
 def limpiar_campos_admin_alumnos():
     for entry in [entry_admin_nombre, entry_admin_padre, entry_admin_grado, entry_admin_grupo]:
@@ -278,8 +428,10 @@ def limpiar_campos_admin_alumnos():
     btn_guardar_alumno.config(state=tk.DISABLED)
 
 def poblar_listbox_ubicaciones():
+    if listbox_ubicaciones is None:
+        return
     listbox_ubicaciones.delete(0, tk.END)
-    for item in jm.obtener_ubicaciones():
+    for item in locations_data_global:
         listbox_ubicaciones.insert(tk.END, item)
 
 def agregar_ubicacion():
@@ -289,7 +441,7 @@ def agregar_ubicacion():
     if nueva not in data:
         data.append(nueva)
         jm.guardar_ubicaciones(data)
-        recargar_recursos_y_actualizar_ui()
+        recargar_ubicaciones()
     entry_admin_ubicacion.delete(0, tk.END)
 
 def eliminar_ubicacion():
@@ -298,11 +450,13 @@ def eliminar_ubicacion():
     a_eliminar = listbox_ubicaciones.get(seleccion[0])
     data = [u for u in jm.obtener_ubicaciones() if u != a_eliminar]
     jm.guardar_ubicaciones(data)
-    recargar_recursos_y_actualizar_ui()
+    recargar_ubicaciones()
 
 def poblar_listbox_tipos():
+    if listbox_tipos is None:
+        return
     listbox_tipos.delete(0, tk.END)
-    for item in jm.obtener_tipos_incidencia():
+    for item in tipos_data_global:
         listbox_tipos.insert(tk.END, item)
 
 def agregar_tipo():
@@ -312,7 +466,7 @@ def agregar_tipo():
     if nuevo not in data:
         data.append(nuevo)
         jm.guardar_tipos_incidencia(data)
-        recargar_recursos_y_actualizar_ui()
+        recargar_tipos()
     entry_admin_tipo.delete(0, tk.END)
 
 def eliminar_tipo():
@@ -321,17 +475,24 @@ def eliminar_tipo():
     a_eliminar = listbox_tipos.get(seleccion[0])
     data = [t for t in jm.obtener_tipos_incidencia() if t != a_eliminar]
     jm.guardar_tipos_incidencia(data)
-    recargar_recursos_y_actualizar_ui()
+    recargar_tipos()
 
 # --- Funciones para la Pestaña de Configuración General ---
 def poblar_campos_config():
-    config = jm.obtener_config()
+    config = CONFIG
+    campos = [entry_config_teacher, entry_config_grade, entry_config_group, entry_config_director, entry_config_school, entry_config_location]
+    # Los campos deshabilitados no aceptan texto; se habilitan mientras se llenan
+    estados = [str(w["state"]) for w in campos]
+    for widget in campos:
+        widget.config(state=tk.NORMAL)
     entry_config_teacher.delete(0, tk.END); entry_config_teacher.insert(0, config.get("teacher_name", ""))
     entry_config_grade.delete(0, tk.END); entry_config_grade.insert(0, config.get("grade", ""))
     entry_config_group.delete(0, tk.END); entry_config_group.insert(0, config.get("group", ""))
     entry_config_director.delete(0, tk.END); entry_config_director.insert(0, config.get("director_name", ""))
     entry_config_school.delete(0, tk.END); entry_config_school.insert(0, config.get("school_name", ""))
     entry_config_location.delete(0, tk.END); entry_config_location.insert(0, config.get("location", ""))
+    for widget, estado in zip(campos, estados):
+        widget.config(state=estado)
 
 def habilitar_edicion_config():
     for widget in [entry_config_teacher, entry_config_grade, entry_config_group, entry_config_director, entry_config_school, entry_config_location]:
@@ -340,7 +501,8 @@ def habilitar_edicion_config():
     btn_guardar_config.config(state=tk.NORMAL)
 
 def guardar_configuracion():
-    nueva_config = {
+    # Se conservan las demás claves (servidor_url, grado_final, metricas...), que no tienen campo en la pestaña
+    nueva_config = dict(CONFIG, **{
         "teacher_name": entry_config_teacher.get(),
         "grade": entry_config_grade.get(),
         "group": entry_config_group.get(),
@@ -348,18 +510,156 @@ def guardar_configuracion():
         "school_name": entry_config_school.get(),
         "location": entry_config_location.get(),
         "incidencias_dir": INCIDENCIAS_DIR # Mantener el directorio de incidencias
-    }
+    })
     if jm.guardar_config(nueva_config):
         messagebox.showinfo("Guardado", "Configuración guardada exitosamente.")
-        recargar_recursos_y_actualizar_ui() # Recargar todo para aplicar cambios
         # Volver a deshabilitar los campos después de guardar
         for widget in [entry_config_teacher, entry_config_grade, entry_config_group, entry_config_director, entry_config_school, entry_config_location]:
             widget.config(state=tk.DISABLED)
         btn_modificar_config.config(state=tk.NORMAL)
         btn_guardar_config.config(state=tk.DISABLED)
+        recargar_config() # Aplicar el nuevo grado, grupo y nombres
     else:
         messagebox.showerror("Error", "No se pudo guardar la configuración.")
 
+# ===================== CONSTRUCCIÓN BAJO DEMANDA =====================
+# Las sub-pestañas de administración y los recuadros de participantes externos se
+# construyen y se llenan la primera vez que se muestran; la mayoría de las sesiones
+# solo registran incidencias. Mientras no existan, sus widgets valen None.
+frame_externos = entry_nombre_externo = entry_grado_externo = entry_grupo_externo = listbox_externos = None
+frame_maestros_externos = entry_nombre_maestro = entry_grupo_maestro = listbox_maestros = None
+tree_alumnos = entry_admin_nombre = entry_admin_padre = entry_admin_grado = entry_admin_grupo = None
+btn_modificar_alumno = btn_guardar_alumno = None
+listbox_ubicaciones = entry_admin_ubicacion = listbox_tipos = entry_admin_tipo = None
+entry_config_teacher = entry_config_grade = entry_config_group = None
+entry_config_director = entry_config_school = entry_config_location = None
+btn_modificar_config = btn_guardar_config = None
+
+def construir_frame_externos():
+    global frame_externos, entry_nombre_externo, entry_grado_externo, entry_grupo_externo, listbox_externos
+    frame_externos = ttk.Frame(frame_alumnos, padding=5)
+    ttk.Label(frame_externos, text="Nombre:").grid(row=0, column=0, sticky="w")
+    entry_nombre_externo = ttk.Entry(frame_externos); entry_nombre_externo.grid(row=0, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_externos, text="Grado:").grid(row=0, column=2, sticky="w", padx=5)
+    entry_grado_externo = ttk.Entry(frame_externos, width=5); entry_grado_externo.grid(row=0, column=3, sticky="w")
+    ttk.Label(frame_externos, text="Grupo:").grid(row=0, column=4, sticky="w", padx=5)
+    entry_grupo_externo = ttk.Entry(frame_externos, width=5); entry_grupo_externo.grid(row=0, column=5, sticky="w")
+    btn_agregar_externo = ttk.Button(frame_externos, text="Agregar", command=agregar_alumno_externo); btn_agregar_externo.grid(row=0, column=6, padx=10)
+    frame_externos.columnconfigure(1, weight=1)
+    ttk.Label(frame_externos, text="Alumnos externos añadidos:").grid(row=1, column=0, columnspan=7, sticky="w", pady=(10, 2))
+    listbox_externos = tk.Listbox(frame_externos, height=4); listbox_externos.grid(row=2, column=0, columnspan=6, sticky="ew")
+    btn_quitar_externo = ttk.Button(frame_externos, text="Quitar", command=quitar_alumno_externo); btn_quitar_externo.grid(row=2, column=6, padx=10, sticky="n")
+
+def construir_frame_maestros_externos():
+    global frame_maestros_externos, entry_nombre_maestro, entry_grupo_maestro, listbox_maestros
+    frame_maestros_externos = ttk.Frame(frame_alumnos, padding=5)
+    ttk.Label(frame_maestros_externos, text="Nombre:").grid(row=0, column=0, sticky="w")
+    entry_nombre_maestro = ttk.Entry(frame_maestros_externos); entry_nombre_maestro.grid(row=0, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_maestros_externos, text="Grupo/Asignatura:").grid(row=0, column=2, sticky="w", padx=5)
+    entry_grupo_maestro = ttk.Entry(frame_maestros_externos, width=15); entry_grupo_maestro.grid(row=0, column=3, sticky="w")
+    btn_agregar_maestro = ttk.Button(frame_maestros_externos, text="Agregar", command=agregar_maestro_externo); btn_agregar_maestro.grid(row=0, column=4, padx=10)
+    frame_maestros_externos.columnconfigure(1, weight=1)
+    ttk.Label(frame_maestros_externos, text="Maestros externos añadidos:").grid(row=1, column=0, columnspan=5, sticky="w", pady=(10, 2))
+    listbox_maestros = tk.Listbox(frame_maestros_externos, height=3); listbox_maestros.grid(row=2, column=0, columnspan=4, sticky="ew")
+    btn_quitar_maestro = ttk.Button(frame_maestros_externos, text="Quitar", command=quitar_maestro_externo); btn_quitar_maestro.grid(row=2, column=4, padx=10, sticky="n")
+
+def construir_tab_alumnos():
+    global tree_alumnos, entry_admin_nombre, entry_admin_padre, entry_admin_grado, entry_admin_grupo
+    global btn_modificar_alumno, btn_guardar_alumno
+    frame_tree = ttk.Frame(tab_admin_alumnos); frame_tree.pack(fill="both", expand=True, pady=5)
+    cols = ("Nombre", "Padre/Madre", "Grado", "Grupo")
+    tree_alumnos = ttk.Treeview(frame_tree, columns=cols, show="headings")
+    for col in cols:
+        tree_alumnos.heading(col, text=col)
+    tree_alumnos.pack(side="left", fill="both", expand=True)
+    tree_scrollbar = ttk.Scrollbar(frame_tree, orient="vertical", command=tree_alumnos.yview)
+    tree_alumnos.configure(yscrollcommand=tree_scrollbar.set)
+    tree_scrollbar.pack(side="right", fill="y")
+    tree_alumnos.bind("<<TreeviewSelect>>", on_alumno_select)
+
+    frame_form_admin = ttk.LabelFrame(tab_admin_alumnos, text="Datos del Alumno", padding=10); frame_form_admin.pack(fill="x", pady=5)
+    ttk.Label(frame_form_admin, text="Nombre:").grid(row=0, column=0, sticky="w")
+    entry_admin_nombre = ttk.Entry(frame_form_admin); entry_admin_nombre.grid(row=0, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_form_admin, text="Padre/Madre:").grid(row=0, column=2, sticky="w", padx=10)
+    entry_admin_padre = ttk.Entry(frame_form_admin); entry_admin_padre.grid(row=0, column=3, sticky="ew", padx=5)
+    ttk.Label(frame_form_admin, text="Grado:").grid(row=1, column=0, sticky="w")
+    entry_admin_grado = ttk.Entry(frame_form_admin); entry_admin_grado.grid(row=1, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_form_admin, text="Grupo:").grid(row=1, column=2, sticky="w", padx=10)
+    entry_admin_grupo = ttk.Entry(frame_form_admin); entry_admin_grupo.grid(row=1, column=3, sticky="ew", padx=5)
+    frame_form_admin.columnconfigure(1, weight=1); frame_form_admin.columnconfigure(3, weight=1)
+
+    frame_botones_admin = ttk.Frame(tab_admin_alumnos); frame_botones_admin.pack(fill="x", pady=5)
+    ttk.Button(frame_botones_admin, text="Agregar", command=agregar_alumno).pack(side="left", padx=5)
+    btn_modificar_alumno = ttk.Button(frame_botones_admin, text="Modificar", command=habilitar_edicion_alumno)
+    btn_modificar_alumno.pack(side="left", padx=5)
+    btn_guardar_alumno = ttk.Button(frame_botones_admin, text="Guardar Cambios", command=guardar_cambios_alumno, state=tk.DISABLED)
+    btn_guardar_alumno.pack(side="left", padx=5)
+    ttk.Button(frame_botones_admin, text="Eliminar", command=eliminar_alumno).pack(side="left", padx=5)
+    ttk.Button(frame_botones_admin, text="Expediente", command=generar_expediente_alumno).pack(side="left", padx=5)
+    ttk.Button(frame_botones_admin, text="Fin de ciclo", command=promover_fin_de_ciclo).pack(side="left", padx=5)
+    ttk.Button(frame_botones_admin, text="Limpiar Campos", command=limpiar_campos_admin_alumnos).pack(side="right", padx=5)
+    poblar_treeview_alumnos()
+
+def construir_catalogo(tab_frame, adder_func, remover_func, label_text):
+    """Lista de un catálogo (ubicaciones o tipos) con su campo para agregar. Devuelve (listbox, entry)."""
+    listbox_current = tk.Listbox(tab_frame); listbox_current.pack(fill="both", expand=True, padx=5, pady=5)
+    frame_add_current = ttk.Frame(tab_frame); frame_add_current.pack(fill="x", padx=5, pady=5)
+    ttk.Label(frame_add_current, text=label_text).pack(side="left")
+    entry_current = ttk.Entry(frame_add_current); entry_current.pack(side="left", fill="x", expand=True, padx=5)
+    ttk.Button(frame_add_current, text="Agregar", command=adder_func).pack(side="left")
+    ttk.Button(tab_frame, text="Eliminar Selección", command=remover_func).pack(pady=5)
+    return listbox_current, entry_current
+
+def construir_tab_ubicaciones():
+    global listbox_ubicaciones, entry_admin_ubicacion
+    listbox_ubicaciones, entry_admin_ubicacion = construir_catalogo(tab_admin_ubicaciones, agregar_ubicacion, eliminar_ubicacion, "Ubicación:")
+    poblar_listbox_ubicaciones()
+
+def construir_tab_tipos():
+    global listbox_tipos, entry_admin_tipo
+    listbox_tipos, entry_admin_tipo = construir_catalogo(tab_admin_tipos, agregar_tipo, eliminar_tipo, "Tipo de Incidencia:")
+    poblar_listbox_tipos()
+
+def construir_tab_config():
+    global entry_config_teacher, entry_config_grade, entry_config_group
+    global entry_config_director, entry_config_school, entry_config_location
+    global btn_modificar_config, btn_guardar_config
+    frame_config_general = ttk.LabelFrame(tab_config, text="Ajustes Generales", padding=10)
+    frame_config_general.pack(fill="x", expand=True, padx=10, pady=5)
+
+    ttk.Label(frame_config_general, text="Nombre Maestro:").grid(row=0, column=0, sticky="w", pady=2)
+    entry_config_teacher = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_teacher.grid(row=0, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_config_general, text="Grado:").grid(row=0, column=2, sticky="w", padx=10)
+    entry_config_grade = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_grade.grid(row=0, column=3, sticky="ew", padx=5)
+    ttk.Label(frame_config_general, text="Grupo:").grid(row=0, column=4, sticky="w", padx=10)
+    entry_config_group = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_group.grid(row=0, column=5, sticky="ew", padx=5)
+
+    ttk.Label(frame_config_general, text="Director:").grid(row=1, column=0, sticky="w", pady=2)
+    entry_config_director = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_director.grid(row=1, column=1, sticky="ew", padx=5)
+    ttk.Label(frame_config_general, text="Escuela:").grid(row=1, column=2, sticky="w", padx=10)
+    entry_config_school = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_school.grid(row=1, column=3, sticky="ew", padx=5)
+    ttk.Label(frame_config_general, text="Ubicación:").grid(row=1, column=4, sticky="w", padx=10)
+    entry_config_location = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_location.grid(row=1, column=5, sticky="ew", padx=5)
+
+    for i in [1, 3, 5]: frame_config_general.columnconfigure(i, weight=1)
+
+    frame_config_botones = ttk.Frame(tab_config); frame_config_botones.pack(fill="x", pady=5)
+    btn_modificar_config = ttk.Button(frame_config_botones, text="Modificar", command=habilitar_edicion_config)
+    btn_modificar_config.pack(side="left", padx=5)
+    btn_guardar_config = ttk.Button(frame_config_botones, text="Guardar Cambios", command=guardar_configuracion, state=tk.DISABLED)
+    btn_guardar_config.pack(side="left", padx=5)
+    poblar_campos_config()
+
+def construir_pestana_visible(event=None):
+    """Construye la sub-pestaña de administración que se está mostrando, si aún no existe."""
+    if notebook.select() != str(tab_admin):
+        return
+    pestana = admin_notebook.select()
+    constructor = pestanas_pendientes.pop(pestana, None)
+    if constructor:
+        with metricas.medir("ui.construir_pestana", pestana=admin_notebook.tab(pestana, "text")):
+            constructor()
+
 # ===================== INTERFAZ GRÁFICA =====================
 root = tk.Tk()
 root.title("Bitácora de Incidencias")
@@ -402,36 +702,12 @@ for i in [1, 3, 5]: frame_info.columnconfigure(i, weight=1)
 
 frame_alumnos = ttk.LabelFrame(scrollable_frame, text="Personas Implicadas", padding=10)
 frame_alumnos.pack(fill="x", expand=True, padx=10, pady=5)
-ttk.Label(frame_alumnos, text=f"Alumnos de {GRADE}° '{GROUP}':").pack(anchor="w")
+label_alumnos_grupo = ttk.Label(frame_alumnos, text=f"Alumnos de {GRADE}° '{GROUP}':"); label_alumnos_grupo.pack(anchor="w")
 listbox_alumnos = tk.Listbox(frame_alumnos, selectmode="multiple", height=6, exportselection=False); listbox_alumnos.pack(fill="x", expand=True, pady=5)
 var_check_externos = tk.BooleanVar()
 ttk.Checkbutton(frame_alumnos, text="¿Incluir alumno de otro grupo?", variable=var_check_externos, command=toggle_alumnos_externos).pack(anchor="w", pady=5)
-frame_externos = ttk.Frame(frame_alumnos, padding=5)
-ttk.Label(frame_externos, text="Nombre:").grid(row=0, column=0, sticky="w")
-entry_nombre_externo = ttk.Entry(frame_externos); entry_nombre_externo.grid(row=0, column=1, sticky="ew", padx=5)
-ttk.Label(frame_externos, text="Grado:").grid(row=0, column=2, sticky="w", padx=5)
-entry_grado_externo = ttk.Entry(frame_externos, width=5); entry_grado_externo.grid(row=0, column=3, sticky="w")
-ttk.Label(frame_externos, text="Grupo:").grid(row=0, column=4, sticky="w", padx=5)
-entry_grupo_externo = ttk.Entry(frame_externos, width=5); entry_grupo_externo.grid(row=0, column=5, sticky="w")
-btn_agregar_externo = ttk.Button(frame_externos, text="Agregar", command=agregar_alumno_externo); btn_agregar_externo.grid(row=0, column=6, padx=10)
-frame_externos.columnconfigure(1, weight=1)
-ttk.Label(frame_externos, text="Alumnos externos añadidos:").grid(row=1, column=0, columnspan=7, sticky="w", pady=(10, 2))
-listbox_externos = tk.Listbox(frame_externos, height=4); listbox_externos.grid(row=2, column=0, columnspan=6, sticky="ew")
-btn_quitar_externo = ttk.Button(frame_externos, text="Quitar", command=quitar_alumno_externo); btn_quitar_externo.grid(row=2, column=6, padx=10, sticky="n")
-
 var_check_maestros = tk.BooleanVar()
 ttk.Checkbutton(frame_alumnos, text="¿Incluir maestro de otro grupo?", variable=var_check_maestros, command=toggle_maestros_externos).pack(anchor="w", pady=5)
-frame_maestros_externos = ttk.Frame(frame_alumnos, padding=5)
-ttk.Label(frame_maestros_externos, text="Nombre:").grid(row=0, column=0, sticky="w")
-entry_nombre_maestro = ttk.Entry(frame_maestros_externos); entry_nombre_maestro.grid(row=0, column=1, sticky="ew", padx=5)
-ttk.Label(frame_maestros_externos, text="Grupo/Asignatura:").grid(row=0, column=2, sticky="w", padx=5)
-entry_grupo_maestro = ttk.Entry(frame_maestros_externos, width=15); entry_grupo_maestro.grid(row=0, column=3, sticky="w")
-btn_agregar_maestro = ttk.Button(frame_maestros_externos, text="Agregar", command=agregar_maestro_externo); btn_agregar_maestro.grid(row=0, column=4, padx=10)
-frame_maestros_externos.columnconfigure(1, weight=1)
-ttk.Label(frame_maestros_externos, text="Maestros externos añadidos:").grid(row=1, column=0, columnspan=5, sticky="w", pady=(10, 2))
-listbox_maestros = tk.Listbox(frame_maestros_externos, height=3); listbox_maestros.grid(row=2, column=0, columnspan=4, sticky="ew")
-btn_quitar_maestro = ttk.Button(frame_maestros_externos, text="Quitar", command=quitar_maestro_externo); btn_quitar_maestro.grid(row=2, column=4, padx=10, sticky="n")
-
 frame_desc = ttk.LabelFrame(scrollable_frame, text="Descripción de los Hechos y Acciones", padding=10)
 frame_desc.pack(fill="x", expand=True, padx=10, pady=5)
 ttk.Label(frame_desc, text="Narración:").pack(anchor="w")
@@ -452,91 +728,26 @@ notebook.add(tab_admin, text="Administrar Datos")
 admin_notebook = ttk.Notebook(tab_admin)
 admin_notebook.pack(fill="both", expand=True, padx=5, pady=5)
 
-# Sub-pestaña Alumnos
+# Sub-pestañas vacías; su contenido se construye al seleccionarlas (ver construir_pestana_visible)
 tab_admin_alumnos = ttk.Frame(admin_notebook)
 admin_notebook.add(tab_admin_alumnos, text="Alumnos")
-frame_tree = ttk.Frame(tab_admin_alumnos); frame_tree.pack(fill="both", expand=True, pady=5)
-cols = ("Nombre", "Padre/Madre", "Grado", "Grupo")
-tree_alumnos = ttk.Treeview(frame_tree, columns=cols, show="headings")
-for col in cols:
-    tree_alumnos.heading(col, text=col)
-tree_alumnos.pack(side="left", fill="both", expand=True)
-tree_scrollbar = ttk.Scrollbar(frame_tree, orient="vertical", command=tree_alumnos.yview)
-tree_alumnos.configure(yscrollcommand=tree_scrollbar.set)
-tree_scrollbar.pack(side="right", fill="y")
-tree_alumnos.bind("<<TreeviewSelect>>", on_alumno_select)
-
-frame_form_admin = ttk.LabelFrame(tab_admin_alumnos, text="Datos del Alumno", padding=10); frame_form_admin.pack(fill="x", pady=5)
-ttk.Label(frame_form_admin, text="Nombre:").grid(row=0, column=0, sticky="w")
-entry_admin_nombre = ttk.Entry(frame_form_admin); entry_admin_nombre.grid(row=0, column=1, sticky="ew", padx=5)
-ttk.Label(frame_form_admin, text="Padre/Madre:").grid(row=0, column=2, sticky="w", padx=10)
-entry_admin_padre = ttk.Entry(frame_form_admin); entry_admin_padre.grid(row=0, column=3, sticky="ew", padx=5)
-ttk.Label(frame_form_admin, text="Grado:").grid(row=1, column=0, sticky="w")
-entry_admin_grado = ttk.Entry(frame_form_admin); entry_admin_grado.grid(row=1, column=1, sticky="ew", padx=5)
-ttk.Label(frame_form_admin, text="Grupo:").grid(row=1, column=2, sticky="w", padx=10)
-entry_admin_grupo = ttk.Entry(frame_form_admin); entry_admin_grupo.grid(row=1, column=3, sticky="ew", padx=5)
-frame_form_admin.columnconfigure(1, weight=1); frame_form_admin.columnconfigure(3, weight=1)
-
-frame_botones_admin = ttk.Frame(tab_admin_alumnos); frame_botones_admin.pack(fill="x", pady=5)
-ttk.Button(frame_botones_admin, text="Agregar", command=agregar_alumno).pack(side="left", padx=5)
-btn_modificar_alumno = ttk.Button(frame_botones_admin, text="Modificar", command=habilitar_edicion_alumno)
-btn_modificar_alumno.pack(side="left", padx=5)
-btn_guardar_alumno = ttk.Button(frame_botones_admin, text="Guardar Cambios", command=guardar_cambios_alumno, state=tk.DISABLED)
-btn_guardar_alumno.pack(side="left", padx=5)
-ttk.Button(frame_botones_admin, text="Eliminar", command=eliminar_alumno).pack(side="left", padx=5)
-ttk.Button(frame_botones_admin, text="Limpiar Campos", command=limpiar_campos_admin_alumnos).pack(side="right", padx=5)
-
-# Sub-pestaña Ubicaciones y Tipos
-for tab_frame, getter_func, adder_func, remover_func, label_text in [
-    (ttk.Frame(admin_notebook), jm.obtener_ubicaciones, agregar_ubicacion, eliminar_ubicacion, "Ubicación:"),
-    (ttk.Frame(admin_notebook), jm.obtener_tipos_incidencia, agregar_tipo, eliminar_tipo, "Tipo de Incidencia:")
-]:
-    admin_notebook.add(tab_frame, text=label_text.replace(":", ""))
-    
-    listbox_current = tk.Listbox(tab_frame); listbox_current.pack(fill="both", expand=True, padx=5, pady=5)
-    frame_add_current = ttk.Frame(tab_frame); frame_add_current.pack(fill="x", padx=5, pady=5)
-    ttk.Label(frame_add_current, text=label_text).pack(side="left")
-    entry_current = ttk.Entry(frame_add_current); entry_current.pack(side="left", fill="x", expand=True, padx=5)
-    ttk.Button(frame_add_current, text="Agregar", command=adder_func).pack(side="left")
-    ttk.Button(tab_frame, text="Eliminar Selección", command=remover_func).pack(pady=5)
-    
-    if "Ubicación" in label_text:
-        listbox_ubicaciones = listbox_current
-        entry_admin_ubicacion = entry_current
-    else:
-        listbox_tipos = listbox_current
-        entry_admin_tipo = entry_current
-
-# --- Pestaña de Configuración General ---
+tab_admin_ubicaciones = ttk.Frame(admin_notebook)
+admin_notebook.add(tab_admin_ubicaciones, text="Ubicación")
+tab_admin_tipos = ttk.Frame(admin_notebook)
+admin_notebook.add(tab_admin_tipos, text="Tipo de Incidencia")
 tab_config = ttk.Frame(admin_notebook)
 admin_notebook.add(tab_config, text="Configuración General")
 
-frame_config_general = ttk.LabelFrame(tab_config, text="Ajustes Generales", padding=10)
-frame_config_general.pack(fill="x", expand=True, padx=10, pady=5)
-
-ttk.Label(frame_config_general, text="Nombre Maestro:").grid(row=0, column=0, sticky="w", pady=2)
-entry_config_teacher = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_teacher.grid(row=0, column=1, sticky="ew", padx=5)
-ttk.Label(frame_config_general, text="Grado:").grid(row=0, column=2, sticky="w", padx=10)
-entry_config_grade = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_grade.grid(row=0, column=3, sticky="ew", padx=5)
-ttk.Label(frame_config_general, text="Grupo:").grid(row=0, column=4, sticky="w", padx=10)
-entry_config_group = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_group.grid(row=0, column=5, sticky="ew", padx=5)
-
-ttk.Label(frame_config_general, text="Director:").grid(row=1, column=0, sticky="w", pady=2)
-entry_config_director = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_director.grid(row=1, column=1, sticky="ew", padx=5)
-ttk.Label(frame_config_general, text="Escuela:").grid(row=1, column=2, sticky="w", padx=10)
-entry_config_school = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_school.grid(row=1, column=3, sticky="ew", padx=5)
-ttk.Label(frame_config_general, text="Ubicación:").grid(row=1, column=4, sticky="w", padx=10)
-entry_config_location = ttk.Entry(frame_config_general, state=tk.DISABLED); entry_config_location.grid(row=1, column=5, sticky="ew", padx=5)
-
-for i in [1, 3, 5]: frame_config_general.columnconfigure(i, weight=1)
-
-frame_config_botones = ttk.Frame(tab_config); frame_config_botones.pack(fill="x", pady=5)
-btn_modificar_config = ttk.Button(frame_config_botones, text="Modificar", command=habilitar_edicion_config)
-btn_modificar_config.pack(side="left", padx=5)
-btn_guardar_config = ttk.Button(frame_config_botones, text="Guardar Cambios", command=guardar_configuracion, state=tk.DISABLED)
-btn_guardar_config.pack(side="left", padx=5)
+pestanas_pendientes = {
+    str(tab_admin_alumnos): construir_tab_alumnos, str(tab_admin_ubicaciones): construir_tab_ubicaciones,
+    str(tab_admin_tipos): construir_tab_tipos, str(tab_config): construir_tab_config,
+}
+notebook.bind("<<NotebookTabChanged>>", construir_pestana_visible)
+admin_notebook.bind("<<NotebookTabChanged>>", construir_pestana_visible)
 
 # --- Inicialización Final ---
 inicializar_sistema()
 recargar_recursos_y_actualizar_ui()
+root.after(vigilante.INTERVALO_MS, revisar_archivos_datos)
 root.mainloop()
+vigilante_datos.cerrar()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: promocion.py
+Descripción: Cambios de fin de ciclo en la lista de alumnos (data/alumnos.json) en
+             una sola operación: promover a todos al grado siguiente, dar de baja a
+             los que egresan, aplicar un archivo de asignaciones y equilibrar los
+             grupos de cada grado.
+
+             La lista se transforma en memoria en una sola pasada y se guarda con
+             una sola escritura atómica. Antes de guardar se muestra la vista previa
+             de los cambios y se guarda una copia de la lista anterior en
+             data/respaldos/ para poder revertir.
+
+                 python promocion.py                               (solo vista previa)
+                 python promocion.py --grupos A,B,C --aplicar
+                 python promocion.py --sin-promover --asignaciones grupos.csv --aplicar
+                 python promocion.py --restaurar                   (la copia más reciente)
+
+             El archivo de asignaciones (CSV con columnas nombre, grado, grupo, o JSON
+             con {"nombre": {"grado": ..., "grupo": ...}}) indica el grado y grupo del
+             ciclo nuevo para alumnos específicos; a esos alumnos no los mueve el
+             equilibrio de grupos. Primero se promueve y después se aplican solo los
+             campos que trae la asignación: un grupo solo no evita la promoción ni el
+             egreso; un grado explícito sí reemplaza la promoción.
+"""
+
+import os
+import csv
+import json
+import math
+import shutil
+import argparse
+from datetime import datetime
+
+import json_manager as jm
+from particiones import normalizar_nombre
+from metricas import medir
+
+RESPALDOS_DIR = os.path.join(jm.DATA_DIR, "respaldos")
+# Último grado de la escuela (primaria); quienes lo terminan egresan
+GRADO_FINAL = 6
+
+
+# --- Transformación ---
+
+def leer_asignaciones(ruta):
+    """Asignaciones del archivo: nombre normalizado -> {"grado", "grupo"} (los que vengan)."""
+    if ruta.lower().endswith(".json"):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        filas = [dict(valores, nombre=nombre) for nombre, valores in datos.items()]
+    else:
+        with open(ruta, encoding="utf-8-sig", newline="") as f:
+            filas = list(csv.DictReader(f))
+    asignaciones = {}
+    for fila in filas:
+        fila = {str(k).strip().lower(): str(v or "").strip() for k, v in fila.items() if k}
+        if fila.get("nombre"):
+            asignaciones[normalizar_nombre(fila["nombre"])] = {
+                k: fila[k] for k in ("grado", "grupo") if fila.get(k)
+            }
+    return asignaciones
+
+
+def _equilibrar(alumnos, grupos, fijos):
+    """
+    Reparte a los alumnos de cada grado entre 'grupos' para que queden del mismo
+    tamaño, moviendo al menor número de alumnos: se quedan en su grupo hasta llenar
+    el cupo y los demás pasan a los grupos con lugar. Devuelve {índice: grupo nuevo}.
+    """
+    por_grado = {}
+    for i, alumno in enumerate(alumnos):
+        por_grado.setdefault(alumno.get("grado", ""), []).append(i)
+    movimientos = {}
+    for indices in por_grado.values():
+        cupo = math.ceil(len(indices) / len(grupos))
+        conteo = {g: 0 for g in grupos}
+        pendientes = []
+        # Primero los asignados a mano, que cuentan para el cupo pero no se mueven
+        for i in sorted(indices, key=lambda i: i not in fijos):
+            grupo = alumnos[i].get("grupo", "")
+            if i in fijos or (grupo in conteo and conteo[grupo] < cupo):
+                conteo[grupo] = conteo.get(grupo, 0) + 1
+            else:
+                pendientes.append(i)
+        for i in sorted(pendientes, key=lambda i: alumnos[i].get("nombre", "")):
+            grupo = min(grupos, key=lambda g: conteo[g])
+            conteo[grupo] += 1
+            movimientos[i] = grupo
+    return movimientos
+
+
+def transformar(alumnos, promover=True, grado_final=GRADO_FINAL, asignaciones=None, grupos=None):
+    """
+    Aplica los cambios de fin de ciclo a la lista, sin modificarla. Devuelve
+    (lista nueva, cambios, avisos); cada cambio es (acción, alumno antes, alumno
+    después o None si egresa).
+    """
+    asignaciones = asignaciones or {}
+    nuevos, cambios, avisos, fijos, origen = [], [], [], set(), []
+    usadas = set()
+    for alumno in alumnos:
+        nuevo = dict(alumno)
+        clave = normalizar_nombre(alumno.get("nombre", ""))
+        asignacion = asignaciones.get(clave)
+        if asignacion is not None:
+            usadas.add(clave)
+        # Un grado asignado reemplaza la promoción; un grupo solo, no
+        if promover and not (asignacion and asignacion.get("grado")):
+            try:
+                grado = int(str(alumno.get("grado", "")).strip())
+            except ValueError:
+                avisos.append(f"{alumno.get('nombre', '')}: grado '{alumno.get('grado', '')}' no numérico, sin cambios")
+            else:
+                if grado >= grado_final:
+                    cambios.append(("egresa", alumno, None))
+                    if asignacion:
+                        avisos.append(f"{alumno.get('nombre', '')}: egresa, se ignora su asignación")
+                    continue
+                nuevo["grado"] = str(grado + 1)
+        if asignacion is not None:
+            fijos.add(len(nuevos))
+            nuevo.update(asignacion)
+        nuevos.append(nuevo)
+        origen.append(alumno)
+
+    if grupos:
+        for i, grupo in _equilibrar(nuevos, grupos, fijos).items():
+            nuevos[i]["grupo"] = grupo
+
+    for antes, despues in zip(origen, nuevos):
+        if antes.get("grado") != despues.get("grado"):
+            cambios.append(("promovido" if antes.get("grupo") == despues.get("grupo") else "reasignado", antes, despues))
+        elif antes.get("grupo") != despues.get("grupo"):
+            cambios.append(("reasignado", antes, despues))
+    for clave in sorted(set(asignaciones) - usadas):
+        avisos.append(f"Asignación para '{clave}': el alumno no está en la lista")
+    return nuevos, cambios, avisos
+
+
+def vista_previa(cambios, avisos=(), limite=None):
+    """Texto con los cambios agrupados por acción, como en un diff."""
+    if not cambios:
+        lineas = ["Sin cambios."]
+    else:
+        conteo = {}
+        for accion, _, _ in cambios:
+            conteo[accion] = conteo.get(accion, 0) + 1
+        lineas = [", ".join(f"{n} {accion}" for accion, n in sorted(conteo.items()))]
+        for accion, antes, despues in cambios[:limite]:
+            origen = f"{antes.get('grado', '')}° '{antes.get('grupo', '')}'"
+            destino = "egresa" if despues is None else f"{despues.get('grado', '')}° '{despues.get('grupo', '')}'"
+            lineas.append(f"{'-' if despues is None else '~'} {antes.get('nombre', '')}: {origen} -> {destino}")
+        if limite is not None and len(cambios) > limite:
+            lineas.append(f"... y {len(cambios) - limite} cambios más")
+    return "\n".join(lineas + [f"Aviso: {a}" for a in avisos])
+
+
+# --- Respaldos ---
+
+def respaldar(ruta=jm.ALUMNOS_FILE):
+    """Copia la lista actual a data/respaldos/ y devuelve la ruta de la copia."""
+    os.makedirs(RESPALDOS_DIR, exist_ok=True)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    destino = os.path.join(RESPALDOS_DIR, f"{base}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json")
+    shutil.copy2(ruta, destino)
+    return destino
+
+
+def respaldos(ruta=jm.ALUMNOS_FILE):
+    """Copias de la lista, de la más reciente a la más antigua."""
+    if not os.path.isdir(RESPALDOS_DIR):
+        return []
+    base = os.path.splitext(os.path.basename(ruta))[0] + "_"
+    return sorted((os.path.join(RESPALDOS_DIR, n) for n in os.listdir(RESPALDOS_DIR)
+                   if n.startswith(base) and n.endswith(".json")), reverse=True)
+
+
+def aplicar(nuevos, ruta=jm.ALUMNOS_FILE):
+    """Respalda la lista actual y la reemplaza por 'nuevos'. Devuelve la ruta del respaldo."""
+    with medir("promocion.aplicar", alumnos=len(nuevos)):
+        respaldo = respaldar(ruta) if os.path.exists(ruta) else None
+        if not jm.escribir_json(ruta, nuevos):
+            raise OSError(f"No se pudo escribir {ruta}")
+    return respaldo
+
+
+def restaurar(respaldo=None, ruta=jm.ALUMNOS_FILE):
+    """
+    Vuelve a la lista de un respaldo (por defecto, el más reciente). La lista que
+    se reemplaza también se respalda, así que restaurar se puede deshacer.
+    Devuelve la ruta del respaldo restaurado.
+    """
+    if respaldo is None:
+        disponibles = respaldos(ruta)
+        if not disponibles:
+            raise FileNotFoundError("No hay respaldos de la lista de alumnos.")
+        respaldo = disponibles[0]
+    with open(respaldo, encoding="utf-8") as f:
+        datos = json.load(f)
+    aplicar(datos, ruta)
+    return respaldo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Promoción de fin de ciclo y reasignación de grupos.")
+    parser.add_argument("--alumnos", default=jm.ALUMNOS_FILE)
+    parser.add_argument("--sin-promover", action="store_true", help="No cambiar de grado (solo reasignar).")
+    parser.add_argument("--grado-final", type=int, default=GRADO_FINAL)
+    parser.add_argument("--asignaciones", help="CSV o JSON con el grado y grupo nuevo de alumnos específicos.")
+    parser.add_argument("--grupos", help="Grupos entre los que se equilibra cada grado, ej. A,B,C.")
+    parser.add_argument("--aplicar", action="store_true", help="Guardar los cambios (sin esto, solo se muestran).")
+    parser.add_argument("--restaurar", nargs="?", const="", metavar="RESPALDO",
+                        help="Restaurar un respaldo (por defecto, el más reciente).")
+    parser.add_argument("--respaldos", action="store_true", help="Listar los respaldos.")
+    args = parser.parse_args()
+
+    if args.respaldos:
+        for respaldo in respaldos(args.alumnos):
+            print(respaldo)
+        return
+    if args.restaurar is not None:
+        print(f"Restaurado {restaurar(args.restaurar or None, args.alumnos)}")
+        return
+
+    asignaciones = leer_asignaciones(args.asignaciones) if args.asignaciones else None
+    grupos = [g.strip() for g in args.grupos.split(",") if g.strip()] if args.grupos else None
+    nuevos, cambios, avisos = transformar(jm.leer_json(args.alumnos, []), not args.sin_promover,
+                                          args.grado_final, asignaciones, grupos)
+    print(vista_previa(cambios, avisos))
+    if args.aplicar and cambios:
+        print(f"Guardado. Respaldo anterior: {aplicar(nuevos, args.alumnos)}")
+    elif cambios:
+        print("Vista previa: use --aplicar para guardar.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: reportes.py
+Descripción: Reporte mensual o por periodo escolar de incidencias para la dirección, en Word,
+             con el mismo encabezado y logos de la bitácora (ver wordgen.py).
+
+             El reporte incluye un resumen redactado, las tablas por gravedad, por
+             alumno y por lugar, las gráficas del periodo (si matplotlib está
+             instalado) y el detalle de las incidencias graves. Las gráficas se
+             dibujan con graficas.py a partir de los mismos agregados del reporte.
+
+             Las incidencias se leen en una sola pasada en streaming sobre los libros
+             del Excel, y los libros archivados de ciclos fuera del periodo no se
+             abren. Solo se guardan contadores y un número limitado de incidencias
+             graves para el detalle, así que la memoria no crece con el número de
+             incidencias del periodo.
+
+             Los periodos escolares son tres periodos de cuatro meses por ciclo
+             (no trimestres de calendario); ver periodo_escolar().
+
+                 python reportes.py --mes 2025-03
+                 python reportes.py --periodo 2024-2025/2
+                 python reportes.py --desde 2025-01-06 --hasta 2025-03-28
+"""
+
+import os
+import re
+import argparse
+from datetime import date, datetime, timedelta
+
+from docx.shared import Inches
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from wordgen import nuevo_documento, agregar_encabezado, agregar_titulo, agregar_subtitulo, agregar_tabla
+from excelgen import EXCEL_PATH, GRAVEDADES, nombres_participantes
+from rotacion import MES_INICIO_CICLO, libros_del_periodo
+import json_manager as jm
+from metricas import medir
+import columnar
+
+REPORTES_DIR = "reportes"
+# Límites de las tablas: el documento no crece sin control en periodos largos
+MAX_ALUMNOS = 100
+MAX_LUGARES = 10
+MAX_DETALLE_GRAVES = 100
+# Con más días que esto, la gráfica de gravedad se agrupa por mes en lugar de por semana
+DIAS_GRAFICA_SEMANAL = 62
+# El ciclo de doce meses se divide en tres periodos escolares de cuatro meses
+PERIODOS_CICLO = 3
+MESES_PERIODO_ESCOLAR = 12 // PERIODOS_CICLO
+
+
+# --- Periodos ---
+
+def periodo_mes(mes):
+    """('AAAA-MM-01', último día) del mes 'AAAA-MM'."""
+    inicio = datetime.strptime(mes, "%Y-%m").date()
+    siguiente = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio.isoformat(), (siguiente - timedelta(days=1)).isoformat()
+
+
+def periodo_escolar(ciclo, numero, mes_inicio=MES_INICIO_CICLO):
+    """
+    Fechas del periodo escolar 'numero' (1 a 3) del ciclo 'AAAA-AAAA'. El ciclo de
+    doce meses se divide en tres periodos de cuatro meses a partir de mes_inicio.
+    """
+    if numero not in range(1, PERIODOS_CICLO + 1):
+        raise ValueError(f"El periodo escolar debe ser de 1 a {PERIODOS_CICLO}.")
+    anio = int(ciclo.split("-")[0])
+    mes = mes_inicio - 1 + (numero - 1) * MESES_PERIODO_ESCOLAR
+    inicio = date(anio + mes // 12, mes % 12 + 1, 1)
+    mes += MESES_PERIODO_ESCOLAR
+    fin = date(anio + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
+    return inicio.isoformat(), fin.isoformat()
+
+
+def _periodo_anterior(desde, hasta):
+    """Periodo de la misma duración inmediatamente anterior."""
+    inicio = datetime.strptime(desde, "%Y-%m-%d").date()
+    fin = datetime.strptime(hasta, "%Y-%m-%d").date()
+    anterior_fin = inicio - timedelta(days=1)
+    return (anterior_fin - (fin - inicio)).isoformat(), anterior_fin.isoformat()
+
+
+def _inicio_periodo(fecha, semanal, memo):
+    """Lunes de la semana o primer día del mes de la fecha 'AAAA-MM-DD'."""
+    if not semanal:
+        return fecha[:7]
+    inicio = memo.get(fecha)
+    if inicio is None:
+        dia = datetime.strptime(fecha, "%Y-%m-%d").date()
+        inicio = memo[fecha] = (dia - timedelta(days=dia.weekday())).isoformat()
+    return inicio
+
+
+# --- Agregados ---
+
+def _vacio():
+    return {g: 0 for g in GRAVEDADES}
+
+
+def agregar_periodo(ruta, desde, hasta):
+    """
+    Una pasada sobre los libros: conteos del periodo y total del periodo anterior
+    de igual duración (para la comparación del resumen).
+    """
+    anterior_desde, anterior_hasta = _periodo_anterior(desde, hasta)
+    dias = (datetime.strptime(hasta, "%Y-%m-%d") - datetime.strptime(desde, "%Y-%m-%d")).days
+    semanal = dias <= DIAS_GRAFICA_SEMANAL
+    memo_semanas = {}
+    datos = {
+        "desde": desde, "hasta": hasta, "total": 0, "anterior": 0,
+        "gravedad": _vacio(), "anterior_gravedad": _vacio(),
+        "alumnos": {}, "lugares": {}, "tipos": {}, "horas": {}, "graves": [], "graves_omitidas": 0,
+        # Para las gráficas
+        "serie": {}, "tipo_gravedad": {},
+    }
+    for libro in libros_del_periodo(ruta, anterior_desde, hasta):
+        for fila in columnar.leer_libro(libro):
+            fecha = str(fila["fecha"])[:10]
+            gravedad = fila["gravedad"]
+            if anterior_desde <= fecha <= anterior_hasta:
+                datos["anterior"] += 1
+                if gravedad in GRAVEDADES:
+                    datos["anterior_gravedad"][gravedad] += 1
+                continue
+            if not desde <= fecha <= hasta:
+                continue
+            datos["total"] += 1
+            if gravedad in GRAVEDADES:
+                datos["gravedad"][gravedad] += 1
+                periodo = _inicio_periodo(fecha, semanal, memo_semanas)
+                datos["serie"].setdefault(periodo, _vacio())[gravedad] += 1
+                datos["tipo_gravedad"].setdefault(fila["tipo"] or "", _vacio())[gravedad] += 1
+            for campo, valor in (("lugares", fila["lugar"]), ("tipos", fila["tipo"])):
+                valor = valor or "(sin dato)"
+                datos[campo][valor] = datos[campo].get(valor, 0) + 1
+            hora = str(fila["hora"] or "")[:2]
+            if hora.isdigit():
+                datos["horas"][int(hora)] = datos["horas"].get(int(hora), 0) + 1
+            for nombre in nombres_participantes(fila["participantes"]):
+                conteo = datos["alumnos"].setdefault(nombre, dict(_vacio(), Total=0))
+                conteo["Total"] += 1
+                if gravedad in GRAVEDADES:
+                    conteo[gravedad] += 1
+            if gravedad == "Grave":
+                if len(datos["graves"]) < MAX_DETALLE_GRAVES:
+                    datos["graves"].append({
+                        "fecha": fecha, "hora": fila["hora"], "lugar": fila["lugar"], "tipo": fila["tipo"],
+                        "participantes": fila["participantes"],
+                    })
+                else:
+                    datos["graves_omitidas"] += 1
+    return datos
+
+
+def _mayor(conteos):
+    return max(conteos.items(), key=lambda kv: kv[1]) if conteos else (None, 0)
+
+
+def resumen_redactado(datos):
+    """Párrafos del resumen del periodo."""
+    total = datos["total"]
+    if not total:
+        return [f"Del {datos['desde']} al {datos['hasta']} no se registraron incidencias."]
+    g = datos["gravedad"]
+    parrafos = []
+    texto = (f"Del {datos['desde']} al {datos['hasta']} se registraron {total} incidencias: "
+             f"{g['Leve']} leves, {g['Moderada']} moderadas y {g['Grave']} graves.")
+    anterior = datos["anterior"]
+    if anterior:
+        cambio = (total - anterior) * 100.0 / anterior
+        if abs(cambio) < 1:
+            texto += f" La cifra es similar a la del periodo anterior ({anterior})."
+        else:
+            texto += (f" Esto representa {abs(cambio):.0f}% {'más' if cambio > 0 else 'menos'} "
+                      f"que en el periodo anterior de igual duración ({anterior}).")
+    else:
+        texto += " En el periodo anterior de igual duración no hubo incidencias registradas."
+    parrafos.append(texto)
+
+    lugar, n_lugar = _mayor(datos["lugares"])
+    tipo, n_tipo = _mayor(datos["tipos"])
+    hora, n_hora = _mayor(datos["horas"])
+    texto = f"El lugar con más incidencias fue {lugar} ({n_lugar}) y el tipo más frecuente fue {tipo} ({n_tipo})."
+    if hora is not None:
+        texto += f" La franja con más incidencias fue de {hora}:00 a {hora}:59 horas ({n_hora})."
+    parrafos.append(texto)
+
+    alumnos = datos["alumnos"]
+    reincidentes = sum(1 for c in alumnos.values() if c["Total"] >= 3)
+    texto = f"Participaron {len(alumnos)} alumnos en al menos una incidencia"
+    texto += f"; {reincidentes} de ellos en tres o más." if reincidentes else "."
+    con_graves = sorted((n for n, c in alumnos.items() if c["Grave"] >= 2), key=lambda n: -alumnos[n]["Grave"])
+    if con_graves:
+        texto += (" Se recomienda dar seguimiento a quienes tuvieron dos o más incidencias graves: "
+                  f"{', '.join(con_graves[:10])}{' y otros' if len(con_graves) > 10 else ''}.")
+    parrafos.append(texto)
+    return parrafos
+
+
+# --- Documento ---
+
+def _graficas(datos):
+    """
+    Rutas de las gráficas del periodo, dibujadas (o tomadas de la caché) con los
+    agregados de la misma pasada. Devuelve [] si matplotlib no está disponible.
+    """
+    serie = [dict({"periodo": p}, **c) for p, c in sorted(datos["serie"].items())]
+    lugares = sorted(datos["lugares"].items(), key=lambda kv: -kv[1])
+    tipos = sorted(datos["tipo_gravedad"])
+    cruce = {"tipos": tipos, "gravedades": list(GRAVEDADES),
+             "conteos": [[datos["tipo_gravedad"][t][g] for g in GRAVEDADES] for t in tipos]}
+    try:
+        import graficas
+        return [
+            graficas.renderizar("gravedad", serie, graficas.dibujar_gravedad),
+            graficas.renderizar("lugar", lugares, graficas.dibujar_barras("Incidencias por lugar")),
+            graficas.renderizar("tipo", cruce, graficas.dibujar_tipo_gravedad),
+        ]
+    except ImportError as e:
+        print(f"Advertencia: el reporte se genera sin gráficas. Causa: {e}")
+        return []
+
+
+def construir_reporte(datos, config, titulo, imagenes=()):
+    """Construye en memoria el documento del reporte a partir de los agregados."""
+    doc = nuevo_documento()
+    agregar_encabezado(doc)
+    agregar_titulo(doc, f"{titulo} - {config.get('school_name') or ''}", config.get("location"))
+
+    p = doc.add_paragraph(f"Periodo: del {datos['desde']} al {datos['hasta']}")
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    agregar_subtitulo(doc, "Resumen")
+    for texto in resumen_redactado(datos):
+        p = doc.add_paragraph(texto)
+        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+
+    agregar_subtitulo(doc, "Incidencias por gravedad")
+    total = datos["total"] or 1
+    filas = [(g, datos["gravedad"][g], f"{datos['gravedad'][g] * 100.0 / total:.1f}%", datos["anterior_gravedad"][g])
+             for g in GRAVEDADES]
+    filas.append(("Total", datos["total"], "100%" if datos["total"] else "0%", datos["anterior"]))
+    agregar_tabla(doc, ["Gravedad", "Incidencias", "Porcentaje", "Periodo anterior"], filas)
+
+    for imagen in imagenes:
+        doc.add_picture(imagen, width=Inches(7.0))
+        doc.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    agregar_subtitulo(doc, "Incidencias por alumno")
+    alumnos = sorted(datos["alumnos"].items(), key=lambda kv: (-kv[1]["Total"], -kv[1]["Grave"], kv[0]))
+    agregar_tabla(doc, ["Alumno", "Total", "Leve", "Moderada", "Grave"],
+                  [(n, c["Total"], c["Leve"], c["Moderada"], c["Grave"]) for n, c in alumnos[:MAX_ALUMNOS]])
+    if len(alumnos) > MAX_ALUMNOS:
+        doc.add_paragraph(f"Se muestran los {MAX_ALUMNOS} alumnos con más incidencias de {len(alumnos)}.")
+
+    agregar_subtitulo(doc, "Lugares con más incidencias")
+    lugares = sorted(datos["lugares"].items(), key=lambda kv: -kv[1])[:MAX_LUGARES]
+    agregar_tabla(doc, ["Lugar", "Incidencias"], lugares)
+
+    if datos["graves"]:
+        agregar_subtitulo(doc, "Detalle de incidencias graves")
+        agregar_tabla(doc, ["Fecha", "Hora", "Lugar", "Tipo", "Participantes"],
+                      [(g["fecha"], g["hora"], g["lugar"], g["tipo"], g["participantes"]) for g in datos["graves"]])
+        if datos["graves_omitidas"]:
+            doc.add_paragraph(f"Y {datos['graves_omitidas']} incidencias graves más (ver el Excel).")
+
+    doc.add_paragraph()
+    firma = doc.add_paragraph(f"\n\n_______________________________\n{config.get('director_name') or 'Director(a)'}")
+    firma.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    return doc
+
+
+def generar_reporte(desde, hasta, output_path=None, ruta=EXCEL_PATH, config=None,
+                    titulo="REPORTE DE INCIDENCIAS", con_graficas=True):
+    """Genera el reporte del periodo y devuelve la ruta del documento."""
+    if config is None:
+        config = jm.obtener_config()
+    if output_path is None:
+        output_path = os.path.join(REPORTES_DIR, f"Reporte_{desde}_{hasta}.docx")
+    with medir("reporte.agregar", archivo=ruta) as extra:
+        datos = agregar_periodo(ruta, desde, hasta)
+        extra["incidencias"] = datos["total"]
+    imagenes = _graficas(datos) if con_graficas and datos["total"] else []
+    with medir("reporte.construir"):
+        doc = construir_reporte(datos, config, titulo, imagenes)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with medir("reporte.guardar", archivo=output_path):
+        doc.save(output_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el reporte de incidencias de un periodo.")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--mes", help="Mes AAAA-MM.")
+    grupo.add_argument("--periodo", "--trimestre", dest="periodo",
+                       help="Periodo escolar del ciclo (1 a 3, de cuatro meses cada uno), ej. 2024-2025/2.")
+    grupo.add_argument("--desde", help="Fecha inicial AAAA-MM-DD (requiere --hasta).")
+    parser.add_argument("--hasta")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--salida", help="Ruta del documento (por defecto en reportes/).")
+    parser.add_argument("--sin-graficas", action="store_true")
+    args = parser.parse_args()
+
+    if args.mes:
+        try:
+            desde, hasta = periodo_mes(args.mes)
+        except ValueError:
+            parser.error(f"--mes debe ser AAAA-MM: {args.mes}")
+        titulo = "REPORTE MENSUAL DE INCIDENCIAS"
+    elif args.periodo:
+        ciclo, _, numero = args.periodo.partition("/")
+        if not (re.fullmatch(r"\d{4}-\d{4}", ciclo) and numero.isdigit()
+                and 1 <= int(numero) <= PERIODOS_CICLO):
+            parser.error(f"--periodo debe ser AAAA-AAAA/N con N de 1 a {PERIODOS_CICLO}, ej. 2024-2025/2")
+        desde, hasta = periodo_escolar(ciclo, int(numero))
+        titulo = "REPORTE DE INCIDENCIAS DEL PERIODO ESCOLAR"
+    else:
+        if not args.hasta:
+            parser.error("--desde requiere --hasta")
+        desde, hasta = args.desde, args.hasta
+        titulo = "REPORTE DE INCIDENCIAS"
+    print(generar_reporte(desde, hasta, args.salida, args.excel, titulo=titulo, con_graficas=not args.sin_graficas))
+
+
+if __name__ == "__main__":
+    main()
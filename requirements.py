@@ -9,7 +9,7 @@ import sys
 import subprocess
 
 # 🔽 Paquetes necesarios
-REQUIRED_PACKAGES = ["python-docx", "openpyxl", "matplotlib"]
+REQUIRED_PACKAGES = ["python-docx", "openpyxl", "matplotlib", "numpy"]
 
 def install_missing_packages():
     """Instala automáticamente los paquetes que falten."""
@@ -7,6 +7,8 @@ Descripción: Carga de recursos desde archivos JSON.
 import json
 import os
 
+from metricas import medir
+
 DATA_DIR = "data"
 ALUMNOS_FILE = os.path.join(DATA_DIR, "alumnos.json")
 LOCATIONS_FILE = os.path.join(DATA_DIR, "ubicaciones.json")
@@ -18,8 +20,9 @@ def load_json_data(filepath, default_value=None):
         default_value = []
     try:
         if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with medir("json.leer", archivo=filepath):
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    return json.load(f)
         else:
             # Si el archivo no existe, lo creamos con el valor por defecto
             with open(filepath, 'w', encoding='utf-8') as f:
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: rotacion.py
+Descripción: Rotación del Excel por ciclo escolar. Las incidencias de ciclos ya
+             cerrados se mueven a un libro propio (ej. data/bitacoras_2024-2025.xlsx),
+             escrito de forma compacta y marcado como de solo lectura. El libro actual
+             conserva solo el ciclo en curso más una hoja 'Histórico' con los totales
+             por ciclo, alumno y gravedad, de modo que el registro diario solo abre y
+             guarda un archivo pequeño y los tableros de varios años leen el resumen.
+
+             La rotación se revisa al iniciar (rotar_si_corresponde) y al escribir:
+             si una incidencia recién guardada es de un ciclo cerrado (capturada
+             tarde), diario.aplicar rota en ese momento (rotar_si_hay_cerradas).
+
+             python rotacion.py            (rota si hay incidencias de ciclos cerrados)
+"""
+
+import os
+import re
+import stat
+import argparse
+from datetime import datetime, date, timedelta
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+
+from excelgen import (EXCEL_PATH, ENCABEZADO_INCIDENCIAS, GRAVEDADES, HOJA_HISTORICO, TOTAL_INCIDENCIAS,
+                      autosize_sheet, leer_incidencias, nombres_participantes, _escribir_dashboard)
+from metricas import medir
+
+ENCABEZADO_HISTORICO = ["Ciclo", "Alumno", "Total de Faltas", "Leve", "Moderada", "Grave"]
+# El ciclo escolar inicia a finales de agosto: de agosto a julio del año siguiente
+MES_INICIO_CICLO = 8
+PATRON_ARCHIVO_CICLO = re.compile(r"_(\d{4})-(\d{4})\.xlsx$")
+
+
+def _a_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    try:
+        return datetime.strptime(str(valor)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def ciclo_escolar(fecha, mes_inicio=MES_INICIO_CICLO):
+    """Devuelve el ciclo escolar de la fecha, ej. '2025-2026', o None si no es una fecha."""
+    fecha = _a_fecha(fecha)
+    if fecha is None:
+        return None
+    inicio = fecha.year if fecha.month >= mes_inicio else fecha.year - 1
+    return f"{inicio}-{inicio + 1}"
+
+
+def ruta_ciclo(ciclo, ruta=EXCEL_PATH):
+    """Ruta del libro archivado de un ciclo, junto al libro actual."""
+    base, ext = os.path.splitext(ruta)
+    return f"{base}_{ciclo}{ext}"
+
+
+def rutas_ledger(ruta=EXCEL_PATH):
+    """Libros archivados (del más antiguo al más reciente) seguidos del libro actual."""
+    directorio = os.path.dirname(ruta) or "."
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    archivados = []
+    if os.path.isdir(directorio):
+        for nombre in os.listdir(directorio):
+            if nombre.startswith(base + "_") and PATRON_ARCHIVO_CICLO.search(nombre):
+                archivados.append(os.path.join(directorio, nombre))
+    rutas = sorted(archivados)
+    if os.path.exists(ruta):
+        rutas.append(ruta)
+    return rutas
+
+
+def libros_del_periodo(ruta=EXCEL_PATH, desde=None, hasta=None, mes_inicio=MES_INICIO_CICLO):
+    """
+    Libros del Excel que pueden tener incidencias entre desde y hasta ('AAAA-MM-DD',
+    cualquiera puede omitirse). Los archivados de ciclos fuera del rango se omiten.
+    """
+    for libro in rutas_ledger(ruta):
+        m = PATRON_ARCHIVO_CICLO.search(libro)
+        if m:
+            inicio = date(int(m.group(1)), mes_inicio, 1).isoformat()
+            fin = (date(int(m.group(2)), mes_inicio, 1) - timedelta(days=1)).isoformat()
+            if (hasta and hasta < inicio) or (desde and desde > fin):
+                continue
+        yield libro
+
+
+def necesita_rotacion(ruta=EXCEL_PATH, hoy=None, mes_inicio=MES_INICIO_CICLO):
+    """
+    Indica si el libro actual contiene incidencias de un ciclo cerrado. Se revisan
+    todas las filas: las fechas no siempre llegan en orden (incidencias capturadas
+    días después, entradas del diario reproducidas, clientes con otro reloj).
+    """
+    if not os.path.exists(ruta):
+        return False
+    actual = ciclo_escolar(hoy or date.today(), mes_inicio)
+    for fila in leer_incidencias(ruta):
+        ciclo = ciclo_escolar(fila["fecha"], mes_inicio)
+        if ciclo is not None and ciclo < actual:
+            return True
+    return False
+
+
+def _valores(fila):
+    """Fila leída con leer_incidencias, en el orden de columnas de la hoja."""
+    return [fila["fecha"], fila["hora"], fila["lugar"], fila["gravedad"], fila["participantes"],
+            fila["link"], fila["tipo"]]
+
+
+def _filas_hoja(ruta):
+    """
+    Filas de datos de la hoja 'Incidencias' con todos sus valores, incluidas las
+    que leer_incidencias omite por no tener fecha.
+    """
+    wb = load_workbook(ruta, read_only=True)
+    try:
+        for row in wb["Incidencias"].iter_rows(min_row=2, values_only=True):
+            if any(v is not None for v in row):
+                yield list(row)
+    finally:
+        wb.close()
+
+
+def _guardar_atomico(wb, ruta):
+    temporal = ruta + ".tmp"
+    wb.save(temporal)
+    os.replace(temporal, ruta)
+
+
+def _congelar(ruta):
+    os.chmod(ruta, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+
+
+def _descongelar(ruta):
+    os.chmod(ruta, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH)
+
+
+def _escribir_archivo_ciclo(ruta_destino, filas):
+    """
+    Escribe el libro de un ciclo cerrado en modo de solo escritura (sin estilos ni
+    dashboard), agregando después de las filas que ya tuviera.
+    """
+    previas = []
+    if os.path.exists(ruta_destino):
+        previas = [_valores(f) for f in leer_incidencias(ruta_destino)]
+        _descongelar(ruta_destino)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Incidencias")
+    ws.append(ENCABEZADO_INCIDENCIAS)
+    for fila in previas + filas:
+        ws.append(fila)
+    _guardar_atomico(wb, ruta_destino)
+    _congelar(ruta_destino)
+
+
+def _totales_ciclo(ruta_ciclo):
+    """
+    {alumno: {'Total', 'Leve', 'Moderada', 'Grave'}} de un libro archivado. Los
+    totales de incidencias del ciclo van bajo la clave TOTAL_INCIDENCIAS.
+    """
+    totales = {TOTAL_INCIDENCIAS: {"Total": 0, "Leve": 0, "Moderada": 0, "Grave": 0}}
+    for fila in leer_incidencias(ruta_ciclo):
+        t = totales[TOTAL_INCIDENCIAS]
+        t["Total"] += 1
+        if fila["gravedad"] in GRAVEDADES:
+            t[fila["gravedad"]] += 1
+        for nombre in nombres_participantes(fila["participantes"]):
+            t = totales.setdefault(nombre, {"Total": 0, "Leve": 0, "Moderada": 0, "Grave": 0})
+            t["Total"] += 1
+            if fila["gravedad"] in GRAVEDADES:
+                t[fila["gravedad"]] += 1
+    return totales
+
+
+def _escribir_historico(wb, totales_por_ciclo):
+    if HOJA_HISTORICO in wb.sheetnames:
+        del wb[HOJA_HISTORICO]
+    ws = wb.create_sheet(HOJA_HISTORICO)
+    ws.append(ENCABEZADO_HISTORICO)
+    for celda in ws[1]:
+        celda.font = Font(bold=True)
+    for ciclo in sorted(totales_por_ciclo):
+        # La fila de totales del ciclo va primero; el Dashboard la lee de aquí
+        for alumno, t in sorted(totales_por_ciclo[ciclo].items(), key=lambda kv: (kv[0] != TOTAL_INCIDENCIAS, kv[0])):
+            ws.append([ciclo, alumno, t["Total"], t["Leve"], t["Moderada"], t["Grave"]])
+    autosize_sheet(ws)
+
+
+def rotar(ruta=EXCEL_PATH, hoy=None, mes_inicio=MES_INICIO_CICLO):
+    """
+    Mueve las incidencias de ciclos cerrados a sus libros archivados y deja en el
+    libro actual solo el ciclo en curso y la hoja 'Histórico'. Las filas sin fecha
+    se quedan en el libro actual tal como están.
+    Devuelve {ciclo: filas_movidas}.
+    """
+    actual = ciclo_escolar(hoy or date.today(), mes_inicio)
+    cerradas = {}
+    vigentes = []
+    for valores in _filas_hoja(ruta):
+        ciclo = ciclo_escolar(valores[0], mes_inicio)
+        if ciclo is not None and ciclo < actual:
+            cerradas.setdefault(ciclo, []).append(valores)
+        else:
+            vigentes.append(valores)
+    if not cerradas:
+        return {}
+
+    # Primero los archivos de ciclo: si algo falla después, las filas quedan
+    # duplicadas pero nunca se pierden.
+    with medir("rotacion.archivar", ciclos=len(cerradas)):
+        for ciclo, filas in cerradas.items():
+            _escribir_archivo_ciclo(ruta_ciclo(ciclo, ruta), filas)
+
+    totales = {}
+    for ruta_archivo in rutas_ledger(ruta)[:-1]:
+        m = PATRON_ARCHIVO_CICLO.search(ruta_archivo)
+        totales[f"{m.group(1)}-{m.group(2)}"] = _totales_ciclo(ruta_archivo)
+
+    with medir("rotacion.compactar", archivo=ruta):
+        wb = load_workbook(ruta)
+        indice = wb.sheetnames.index("Incidencias")
+        del wb["Incidencias"]
+        ws = wb.create_sheet("Incidencias", indice)
+        ws.append(ENCABEZADO_INCIDENCIAS)
+        for fila in vigentes:
+            ws.append(fila)
+        autosize_sheet(ws)
+        _escribir_historico(wb, totales)
+        _escribir_dashboard(wb)
+        _guardar_atomico(wb, ruta)
+    return {ciclo: len(filas) for ciclo, filas in cerradas.items()}
+
+
+def rotar_si_corresponde(ruta=EXCEL_PATH, hoy=None, mes_inicio=MES_INICIO_CICLO):
+    """Rota el libro solo si contiene incidencias de ciclos cerrados."""
+    if necesita_rotacion(ruta, hoy, mes_inicio):
+        return rotar(ruta, hoy, mes_inicio)
+    return {}
+
+
+def rotar_si_hay_cerradas(fechas, ruta=EXCEL_PATH, hoy=None, mes_inicio=MES_INICIO_CICLO):
+    """
+    Rota el libro si alguna de las fechas (de filas recién escritas) es de un
+    ciclo cerrado. No recorre el libro cuando ninguna lo es.
+    """
+    actual = ciclo_escolar(hoy or date.today(), mes_inicio)
+    if any((ciclo_escolar(fecha, mes_inicio) or actual) < actual for fecha in fechas):
+        return rotar(ruta, hoy, mes_inicio)
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rota el Excel de incidencias por ciclo escolar.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--mes-inicio", type=int, default=MES_INICIO_CICLO,
+                        help="Mes en que inicia el ciclo escolar (por defecto %(default)s).")
+    args = parser.parse_args()
+
+    movidas = rotar_si_corresponde(args.excel, mes_inicio=args.mes_inicio)
+    if not movidas:
+        print("No hay incidencias de ciclos cerrados.")
+    for ciclo, n in sorted(movidas.items()):
+        print(f"{ciclo}: {n} incidencias movidas a {ruta_ciclo(ciclo, args.excel)}")
+
+
+if __name__ == "__main__":
+    main()
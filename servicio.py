@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: servicio.py
+Descripción: Capa de servicio independiente de la interfaz gráfica. Registra
+             incidencias (documento Word + fila en Excel + dashboard) a partir de un
+             diccionario, con la configuración y los almacenes pasados de forma
+             explícita. Cada incidencia pasa primero por el diario (ver diario.py).
+             La usan programa.py, servidor.py y la línea de comandos:
+
+                 python -m servicio < incidencias.json
+                 python -m servicio --lote 200 < incidencias.jsonl
+                 python -m servicio --escuela "Benito Juárez" --grado 5 --grupo B < inc.json
+
+             La entrada puede ser un objeto JSON, una lista de objetos o una
+             incidencia JSON por línea. Se imprime un resultado JSON por incidencia.
+
+             Una incidencia que parece duplicada de otra ya registrada (ver
+             duplicados.py) no se registra, a menos que traiga
+             "confirmar_duplicado": true o se use --permitir-duplicados. La
+             revisión y la anotación en el diario se hacen juntas bajo un candado
+             por libro, para que dos envíos iguales simultáneos no pasen ambos.
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import datetime
+
+from wordgen import generar_word
+from excelgen import EXCEL_PATH, GRAVEDADES, inicializar_excel
+from resources import ALUMNOS_FILE, load_all_resources
+import json_manager as jm
+from rotacion import rotar_si_corresponde
+import particiones
+import diario
+import duplicados
+import archivo
+import expediente
+import metricas
+
+CAMPOS_OBLIGATORIOS = ["fecha", "hora", "lugar", "tipo_inc", "gravedad", "participantes"]
+LOTE_CLI = 100
+
+# Un candado por libro de Excel: revisar duplicados y anotar en el diario van juntos
+_candados_registro = {}
+_candado_candados = threading.Lock()
+# Padres de data/alumnos.json: (tamaño y fecha de modificación del archivo, padres)
+_cache_padres = (None, None)
+
+
+def padres_de_familia():
+    """Padre o madre de cada alumno; se vuelve a leer solo si data/alumnos.json cambió."""
+    global _cache_padres
+    try:
+        st = os.stat(ALUMNOS_FILE)
+        firma = (st.st_size, st.st_mtime_ns)
+    except OSError:
+        firma = None
+    if firma is None or _cache_padres[0] != firma:
+        _, padres, _, _ = load_all_resources()
+        _cache_padres = (firma, padres)
+    return _cache_padres[1]
+
+
+def crear_contexto(config=None, padres=None, excel_path=EXCEL_PATH, incidencias_dir=None):
+    """
+    Reúne la configuración y los almacenes que usa el registro. Los valores omitidos
+    se leen de los archivos de 'data/' (los padres, de una caché en memoria).
+    """
+    if config is None:
+        config = jm.obtener_config()
+    if padres is None:
+        padres = padres_de_familia()
+    return {
+        "config": config,
+        "padres": padres,
+        "excel_path": excel_path,
+        "incidencias_dir": incidencias_dir or config.get("incidencias_dir", "incidencias"),
+        "particion": None,
+    }
+
+
+def crear_contexto_particion(escuela, grado, grupo, padres=None):
+    """Contexto que lee y escribe solo en la partición escuela/grado/grupo."""
+    config, excel_path, incidencias_dir = particiones.rutas_particion(escuela, grado, grupo)
+    contexto = crear_contexto(config=config, padres=padres, excel_path=excel_path,
+                              incidencias_dir=incidencias_dir)
+    contexto["particion"] = (escuela, grado, grupo)
+    return contexto
+
+
+def validar(incidente):
+    """Devuelve un mensaje de error, o None si la incidencia es válida."""
+    if not isinstance(incidente, dict):
+        return "La incidencia debe ser un objeto JSON."
+    faltantes = [c for c in CAMPOS_OBLIGATORIOS if not incidente.get(c)]
+    if faltantes:
+        return f"Faltan campos: {', '.join(faltantes)}"
+    if incidente["gravedad"] not in GRAVEDADES:
+        return f"Gravedad inválida: {incidente['gravedad']}"
+    # La rotación, los filtros y los índices comparan la fecha como texto AAAA-MM-DD
+    try:
+        fecha_valida = datetime.strptime(str(incidente["fecha"]), "%Y-%m-%d").strftime("%Y-%m-%d") == incidente["fecha"]
+    except ValueError:
+        fecha_valida = False
+    if not fecha_valida:
+        return f"Fecha inválida (use AAAA-MM-DD): {incidente['fecha']}"
+    if not isinstance(incidente["participantes"], list):
+        return "'participantes' debe ser una lista."
+    for p in incidente["participantes"]:
+        if not isinstance(p, dict) or not all(p.get(k) for k in ("nombre", "grado", "grupo")):
+            return "Cada participante requiere nombre, grado y grupo."
+    return None
+
+
+def reservar_nombre_documento(participantes, directorio):
+    """
+    Reserva un nombre único para el documento Word creando el archivo vacío; evita
+    choques si dos registros con los mismos alumnos coinciden en el mismo segundo.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nombres_alumnos = "_".join(p["nombre"] for p in participantes).replace(" ", "")
+    base = f"Incidencia_{nombres_alumnos}_{timestamp}"
+    n = 1
+    while True:
+        sufijo = f"_{n}" if n > 1 else ""
+        ruta = os.path.join(directorio, f"{base}{sufijo}.docx")
+        try:
+            open(ruta, "x").close()
+            return ruta
+        except FileExistsError:
+            n += 1
+
+
+def generar_documento(incidente, contexto, output_path=None):
+    """
+    Genera el documento Word de la incidencia y devuelve su ruta. Si no se indica
+    output_path, se reserva un nombre nuevo.
+    """
+    config = contexto["config"]
+    if output_path is None:
+        output_path = reservar_nombre_documento(incidente["participantes"], contexto["incidencias_dir"])
+    try:
+        generar_word(
+            fecha=incidente["fecha"], hora=incidente["hora"], lugar=incidente["lugar"],
+            actividad=incidente.get("actividad", ""), participantes=incidente["participantes"],
+            tipo_inc=incidente["tipo_inc"], gravedad=incidente["gravedad"],
+            narracion=incidente.get("narracion", ""), medidas=incidente.get("medidas", ""),
+            seguimiento=incidente.get("seguimiento", ""), padres_dict=contexto["padres"],
+            output_path=output_path, maestros_externos=incidente.get("maestros_externos"),
+            school_name=config.get("school_name"), director_name=config.get("director_name"),
+            teacher_name=incidente.get("teacher_name") or config.get("teacher_name"),
+            grade=config.get("grade"), group=config.get("group"), location=config.get("location")
+        )
+    except Exception:
+        # No dejar el archivo vacío reservado
+        if os.path.exists(output_path) and os.path.getsize(output_path) == 0:
+            os.remove(output_path)
+        raise
+    return output_path
+
+
+def datos_registro(incidente, link):
+    """Campos de la incidencia que se guardan en la hoja 'Incidencias'."""
+    return {
+        "fecha": incidente["fecha"], "hora": incidente["hora"], "lugar": incidente["lugar"],
+        "gravedad": incidente["gravedad"], "participantes": incidente["participantes"],
+        "link": link, "tipo": incidente["tipo_inc"],
+    }
+
+
+def buscar_duplicados(incidente, contexto):
+    """
+    Incidencias ya registradas que parecen la misma que 'incidente' (lista vacía si
+    trae 'confirmar_duplicado'). Un índice dañado no impide registrar.
+    """
+    if incidente.get("confirmar_duplicado"):
+        return []
+    try:
+        return duplicados.buscar(incidente, contexto["excel_path"])
+    except Exception as e:
+        print(f"Advertencia: no se pudo revisar si la incidencia está duplicada: {e}", file=sys.stderr)
+        return []
+
+
+def candado_registro(ruta_excel):
+    """Candado que serializa revisar duplicados y anotar en el diario de un libro."""
+    clave = os.path.abspath(ruta_excel)
+    with _candado_candados:
+        return _candados_registro.setdefault(clave, threading.Lock())
+
+
+def _agregar_a_indice(indice, incidente, link, contexto):
+    try:
+        indice.agregar(incidente, link, contexto["excel_path"])
+    except Exception as e:
+        print(f"Advertencia: no se pudo agregar {link} al índice {indice.__name__}: {e}", file=sys.stderr)
+
+
+def anotar_sin_duplicar(incidente, contexto):
+    """
+    Revisa si la incidencia está duplicada y, si no, reserva el nombre del
+    documento, la anota en el diario y la agrega al índice de duplicados, todo
+    bajo el candado del libro. Devuelve (entrada, similares); la entrada es None
+    si hay similares.
+    """
+    with candado_registro(contexto["excel_path"]):
+        similares = buscar_duplicados(incidente, contexto)
+        if similares:
+            return None, similares
+        link = reservar_nombre_documento(incidente["participantes"], contexto["incidencias_dir"])
+        entrada = diario.anotar(contexto["excel_path"], incidente, link, datos_registro(incidente, link))
+        _agregar_a_indice(duplicados, incidente, link, contexto)
+    return entrada, []
+
+
+def generar_anotada(entrada, contexto):
+    """
+    Genera el Word de una entrada recién anotada y la agrega al índice del
+    expediente. Si el Word falla, la entrada se descarta y la excepción se propaga.
+    """
+    try:
+        generar_documento(entrada["incidente"], contexto, entrada["link"])
+    except Exception:
+        diario.descartar(contexto["excel_path"], [entrada["id"]])
+        raise
+    _agregar_a_indice(expediente, entrada["incidente"], entrada["link"], contexto)
+    return entrada
+
+
+def reproducir(contexto, nuevas=()):
+    """
+    Aplica al Excel, con un solo guardado, las entradas 'nuevas' y las que hayan
+    quedado pendientes en el diario. De las pendientes se omiten las que ya están
+    en el Excel y se regenera el Word si no llegó a guardarse.
+    Devuelve el número de incidencias aplicadas.
+    """
+    ruta = contexto["excel_path"]
+    ids_nuevas = {e["id"] for e in nuevas}
+    previas = [e for e in diario.pendientes(ruta) if e["id"] not in ids_nuevas]
+    listas = []
+    if previas:
+        for entrada in diario.sin_aplicar(ruta, previas):
+            link = entrada["link"]
+            # Un documento ya empaquetado (ver archivo.py) no se regenera
+            if (not os.path.exists(link) or os.path.getsize(link) == 0) and not archivo.esta_empaquetado(link):
+                try:
+                    generar_documento(entrada["incidente"], contexto, link)
+                except Exception as e:
+                    # Queda pendiente para el siguiente intento
+                    print(f"Advertencia: no se pudo regenerar {link}: {e}", file=sys.stderr)
+                    continue
+            listas.append(entrada)
+    return diario.aplicar(ruta, listas + list(nuevas), con_resumen=bool(contexto["particion"]))
+
+
+def registrar_lote(incidentes, contexto=None):
+    """
+    Registra varias incidencias: anota cada una en el diario, genera su documento
+    y escribe todas las filas (más las que hubieran quedado pendientes) con un solo
+    guardado del Excel. Devuelve un resultado por incidencia, en el mismo orden:
+    {'ok', 'link', 'error', 'pendiente', 'duplicados'}. Si el Excel no se pudo
+    guardar, la incidencia queda registrada en el diario ('pendiente': True) y se
+    aplica después. Si parece duplicada, no se registra y 'duplicados' trae las
+    incidencias parecidas; se registra al reenviarla con 'confirmar_duplicado'.
+    """
+    if contexto is None:
+        contexto = crear_contexto()
+    inicializar_excel(contexto["excel_path"])
+
+    resultados = []
+    nuevas = []
+    for incidente in incidentes:
+        error = validar(incidente)
+        if error:
+            resultados.append({"ok": False, "link": None, "error": error, "pendiente": False, "duplicados": []})
+            continue
+        try:
+            entrada, similares = anotar_sin_duplicar(incidente, contexto)
+            if similares:
+                resultados.append({"ok": False, "link": None, "error": duplicados.describir(similares),
+                                   "pendiente": False, "duplicados": similares})
+                continue
+            generar_anotada(entrada, contexto)
+        except Exception as e:
+            resultados.append({"ok": False, "link": None, "error": f"No se pudo generar el documento: {e}",
+                               "pendiente": False, "duplicados": []})
+            continue
+        resultados.append({"ok": True, "link": entrada["link"], "error": None, "pendiente": False,
+                           "duplicados": []})
+        nuevas.append(entrada)
+
+    if nuevas or diario.hay_pendientes(contexto["excel_path"]):
+        try:
+            reproducir(contexto, nuevas)
+        except Exception as e:
+            for r in resultados:
+                if r["ok"]:
+                    r["pendiente"] = True
+                    r["error"] = f"No se pudo registrar en Excel: {e}. Se aplicará en el siguiente registro."
+    return resultados
+
+
+def registrar(incidente, contexto=None):
+    """Registra una incidencia. Devuelve {'ok', 'link', 'error', 'pendiente', 'duplicados'}."""
+    return registrar_lote([incidente], contexto)[0]
+
+
+def _leer_entrada(flujo):
+    """Itera incidencias desde un objeto JSON, una lista JSON o JSON por línea."""
+    primero = ""
+    while not primero:
+        linea = flujo.readline()
+        if not linea:
+            return
+        primero = linea.strip()
+    if primero.startswith("["):
+        yield from json.loads(primero + flujo.read())
+        return
+    try:
+        yield json.loads(primero)
+    except json.JSONDecodeError:
+        # Un solo objeto repartido en varias líneas
+        yield json.loads(primero + flujo.read())
+        return
+    for linea in flujo:
+        if linea.strip():
+            yield json.loads(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registra incidencias leídas como JSON desde la entrada estándar.")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--lote", type=int, default=LOTE_CLI,
+                        help="Incidencias por guardado del Excel (por defecto %(default)s).")
+    parser.add_argument("--escuela", help="Registrar en la partición de esta escuela (requiere --grado y --grupo).")
+    parser.add_argument("--grado")
+    parser.add_argument("--grupo")
+    parser.add_argument("--permitir-duplicados", action="store_true",
+                        help="Registrar aunque la incidencia parezca duplicada.")
+    args = parser.parse_args()
+    metricas.configurar(jm.obtener_config())
+
+    if args.escuela:
+        if not (args.grado and args.grupo):
+            parser.error("--escuela requiere --grado y --grupo")
+        try:
+            contexto = crear_contexto_particion(args.escuela, args.grado, args.grupo)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        contexto = crear_contexto(excel_path=args.excel)
+    inicializar_excel(contexto["excel_path"])
+    rotar_si_corresponde(contexto["excel_path"])
+    aplicadas = reproducir(contexto)
+    if aplicadas:
+        print(f"Se aplicaron {aplicadas} incidencias pendientes del diario.", file=sys.stderr)
+    lote = []
+    errores = 0
+
+    def procesar():
+        nonlocal errores
+        for r in registrar_lote(lote, contexto):
+            errores += not r["ok"]
+            print(json.dumps(r, ensure_ascii=False))
+        lote.clear()
+
+    for incidente in _leer_entrada(sys.stdin):
+        if args.permitir_duplicados:
+            incidente["confirmar_duplicado"] = True
+        lote.append(incidente)
+        if len(lote) >= args.lote:
+            procesar()
+    if lote:
+        procesar()
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
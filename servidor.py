@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: servidor.py
+Descripción: Servicio HTTP/JSON local que es dueño de los datos (Excel, JSON y carpeta
+             de incidencias) y serializa las escrituras. Varias computadoras pueden
+             registrar incidencias contra una misma carpeta compartida sin pisarse:
+             cada documento Word se genera en paralelo, pero las filas del Excel las
+             escribe un único hilo que agrupa todas las incidencias pendientes en un
+             solo guardado del libro (group commit). Cada incidencia se anota antes
+             en el diario (ver diario.py), así que un guardado fallido no la pierde.
+
+Endpoints:
+    POST /incidencias   Registra una incidencia (JSON con los mismos campos del formulario).
+                        Responde 409 con 'duplicados' si parece una incidencia ya
+                        registrada; se registra al reenviarla con "confirmar_duplicado": true.
+    GET  /incidencias   Consulta el registro, incluidos los ciclos archivados (ver
+                        rotacion.py). Filtros: desde, hasta, gravedad, lugar, alumno.
+    GET  /dashboard     Conteo de incidencias por gravedad. Filtros: desde, hasta.
+    GET  /resumen       Resumen combinado de las particiones. Filtro: escuela.
+    GET  /graficas/<g>  Gráfica 'gravedad', 'lugar' o 'tipo'. Filtros: desde, hasta, formato (png/svg).
+
+Si la incidencia incluye 'escuela', 'grado' y 'grupo', se registra en esa partición
+(ver particiones.py); cada partición tiene su propio escritor. Las consultas GET
+aceptan los mismos tres parámetros.
+"""
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+from excelgen import EXCEL_PATH, GRAVEDADES, inicializar_excel
+from servicio import (crear_contexto, crear_contexto_particion, validar, anotar_sin_duplicar,
+                      generar_anotada, reproducir)
+from rotacion import rotar_si_corresponde
+import particiones
+import diario
+import duplicados
+import graficas
+import exportar
+import metricas
+import json_manager as jm
+
+HOST = "127.0.0.1"
+PUERTO = 8765
+
+# Máximo de incidencias por guardado y tiempo que el escritor espera a que lleguen más
+# antes de guardar. 50 ms son imperceptibles para quien registra y, al inicio del
+# recreo, permiten juntar en un solo guardado las solicitudes que llegan casi a la vez.
+LOTE_MAXIMO = 100
+VENTANA_LOTE = 0.05
+# Si quedan incidencias sin guardar y no llegan solicitudes, se reintenta cada tanto
+REINTENTO_SEGUNDOS = 30
+
+
+class EscritorRegistro:
+    """
+    Hilo único que escribe en el Excel. Las solicitudes (entradas ya anotadas en el
+    diario) se encolan y se aplican por lotes: una carga, todas las filas pendientes,
+    el dashboard y un solo guardado. Si el guardado falla, las entradas se reintentan
+    junto con el siguiente lote o, si no llega ninguno, cada REINTENTO_SEGUNDOS.
+    """
+
+    def __init__(self, contexto):
+        self.contexto = contexto
+        self.ruta = contexto["excel_path"]
+        self.con_resumen = bool(contexto["particion"])
+        self.reintentos = []
+        self.cola = queue.Queue()
+        # Solo para escribir: el libro se guarda con un reemplazo atómico, así que las
+        # consultas lo leen sin esperar al guardado en grupo.
+        self.candado = threading.Lock()
+        self.hilo = threading.Thread(target=self._ciclo, name="escritor-registro", daemon=True)
+
+    def iniciar(self):
+        inicializar_excel(self.ruta)
+        rotar_si_corresponde(self.ruta)
+        # Incidencias que quedaron en el diario sin llegar al Excel
+        try:
+            reproducir(self.contexto)
+        except Exception as e:
+            print(f"Advertencia: no se pudo aplicar el diario de {self.ruta}: {e}")
+            self.reintentos = diario.pendientes(self.ruta)
+        self.hilo.start()
+
+    def encolar(self, entrada):
+        """
+        Encola una entrada del diario y espera a que quede guardada en el Excel.
+        Devuelve el tamaño del lote.
+        """
+        pendiente = {"entrada": entrada, "listo": threading.Event(), "error": None, "lote": 0}
+        self.cola.put(pendiente)
+        pendiente["listo"].wait()
+        if pendiente["error"] is not None:
+            raise pendiente["error"]
+        return pendiente["lote"]
+
+    def _ciclo(self):
+        while True:
+            try:
+                lote = [self.cola.get(timeout=REINTENTO_SEGUNDOS if self.reintentos else None)]
+            except queue.Empty:
+                lote = []
+            limite = time.monotonic() + VENTANA_LOTE
+            while lote and len(lote) < LOTE_MAXIMO:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self.cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            error = None
+            entradas = [p["entrada"] for p in lote]
+            try:
+                with self.candado:
+                    # Un reintento cuyo guardado sí se hizo no se vuelve a escribir
+                    self.reintentos = diario.sin_aplicar(self.ruta, self.reintentos)
+                    diario.aplicar(self.ruta, self.reintentos + entradas, con_resumen=self.con_resumen)
+                self.reintentos = []
+            except Exception as e:
+                # Siguen en el diario; se vuelven a intentar con el próximo lote
+                self.reintentos = self.reintentos + entradas
+                error = e
+            for p in lote:
+                p["error"] = error
+                p["lote"] = len(lote)
+                p["listo"].set()
+
+
+class ServidorIncidencias(ThreadingHTTPServer):
+    # La cola de conexiones por defecto (5) se desborda cuando todo el personal
+    # registra al mismo tiempo al inicio del recreo.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def crear_servidor(host=HOST, puerto=PUERTO, ruta_excel=EXCEL_PATH):
+    """Crea el servidor HTTP y sus escritores. Llamar a serve_forever() para atenderlo."""
+    principal = EscritorRegistro(crear_contexto(excel_path=ruta_excel))
+    principal.iniciar()
+    escritores = {}
+    candado_escritores = threading.Lock()
+
+    def escritor_para(contexto):
+        if not contexto["particion"]:
+            return principal
+        with candado_escritores:
+            escritor = escritores.get(contexto["excel_path"])
+            if escritor is None:
+                escritor = EscritorRegistro(contexto)
+                escritor.iniciar()
+                escritores[contexto["excel_path"]] = escritor
+            return escritor
+
+    def contexto_para(datos):
+        if datos.get("escuela") and datos.get("grado") and datos.get("grupo"):
+            return crear_contexto_particion(datos["escuela"], datos["grado"], datos["grupo"])
+        return crear_contexto(excel_path=principal.ruta)
+
+    def contexto_consulta(filtros):
+        """
+        Contexto de una consulta GET, o None si la partición pedida no existe. Una
+        consulta no crea carpetas, libros ni escritores para particiones nuevas.
+        """
+        claves = [filtros.get(k) for k in ("escuela", "grado", "grupo")]
+        if not any(claves):
+            return contexto_para(filtros)
+        if not all(claves):
+            return None
+        directorio = particiones.directorio_particion(*claves)
+        if not os.path.exists(os.path.join(directorio, "bitacoras.xlsx")):
+            return None
+        return contexto_para(filtros)
+
+    class Manejador(BaseHTTPRequestHandler):
+        def _responder(self, codigo, cuerpo):
+            datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            filtros = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == "/resumen":
+                self._responder(200, particiones.resumen_global(filtros.get("escuela")))
+                return
+            try:
+                contexto = contexto_consulta(filtros)
+            except ValueError as e:
+                self._responder(400, {"error": str(e)})
+                return
+            if contexto is None:
+                self._responder(404, {"error": "Partición no encontrada"})
+                return
+            escritor = escritor_para(contexto)
+            if url.path == "/incidencias":
+                criterios = {k: filtros.get(k) for k in ("desde", "hasta", "gravedad", "lugar", "alumno")}
+                filas = list(exportar.incidencias(escritor.ruta, **criterios))
+                self._responder(200, {"incidencias": filas, "total": len(filas)})
+            elif url.path == "/dashboard":
+                conteo = {g: 0 for g in GRAVEDADES}
+                for fila in exportar.incidencias(escritor.ruta, desde=filtros.get("desde"),
+                                                 hasta=filtros.get("hasta")):
+                    if fila["gravedad"] in conteo:
+                        conteo[fila["gravedad"]] += 1
+                self._responder(200, conteo)
+            elif url.path.startswith("/graficas/"):
+                self._enviar_grafica(url.path.rsplit("/", 1)[1], escritor, filtros)
+            else:
+                self._responder(404, {"error": "Ruta no encontrada"})
+
+        def _enviar_grafica(self, nombre, escritor, filtros):
+            formato = filtros.get("formato", "png")
+            if nombre not in graficas.GRAFICAS or formato not in graficas.FORMATOS:
+                self._responder(404, {"error": "Gráfica no encontrada"})
+                return
+            try:
+                ruta = graficas.GRAFICAS[nombre](escritor.ruta, desde=filtros.get("desde"),
+                                                 hasta=filtros.get("hasta"), formato=formato)
+            except Exception as e:
+                self._responder(500, {"error": str(e)})
+                return
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png" if formato == "png" else "image/svg+xml")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/incidencias":
+                self._responder(404, {"error": "Ruta no encontrada"})
+                return
+            try:
+                largo = int(self.headers.get("Content-Length", 0))
+                datos = json.loads(self.rfile.read(largo).decode("utf-8"))
+            except (ValueError, UnicodeDecodeError):
+                self._responder(400, {"error": "JSON inválido"})
+                return
+            if not isinstance(datos, dict):
+                self._responder(400, {"error": "La incidencia debe ser un objeto JSON."})
+                return
+            error = validar(datos)
+            if error:
+                self._responder(400, {"error": error})
+                return
+
+            try:
+                contexto = contexto_para(datos)
+            except ValueError as e:
+                self._responder(400, {"error": str(e)})
+                return
+            escritor = escritor_para(contexto)
+            try:
+                # La revisión de duplicados y la anotación en el diario van bajo el candado
+                # del libro; dos envíos iguales simultáneos no se registran ambos.
+                entrada, similares = anotar_sin_duplicar(datos, contexto)
+                if similares:
+                    self._responder(409, {"error": duplicados.describir(similares), "duplicados": similares})
+                    return
+                # El Word se genera en el hilo de la solicitud: cada documento es un archivo
+                # independiente, solo el Excel necesita serializarse.
+                generar_anotada(entrada, contexto)
+            except Exception as e:
+                self._responder(500, {"error": str(e)})
+                return
+            try:
+                lote = escritor.encolar(entrada)
+            except Exception as e:
+                # La incidencia ya está en el diario; el escritor la reintenta
+                self._responder(202, {"link": entrada["link"], "pendiente": True,
+                                      "error": f"No se pudo registrar en Excel: {e}"})
+                return
+            self._responder(201, {"link": entrada["link"], "lote": lote})
+
+        def log_message(self, formato, *args):
+            pass
+
+    return ServidorIncidencias((host, puerto), Manejador)
+
+
+# --- Cliente ---
+
+def registrar_remoto(url_base, datos, timeout=30):
+    """
+    Envía una incidencia al servidor. Devuelve la respuesta como diccionario; si
+    parece duplicada, la respuesta trae 'duplicados' y no se registró.
+    Lanza RuntimeError con el mensaje del servidor si el registro falla.
+    """
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    solicitud = Request(url_base.rstrip("/") + "/incidencias", data=cuerpo, method="POST",
+                        headers={"Content-Type": "application/json; charset=utf-8"})
+    try:
+        with urlopen(solicitud, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except HTTPError as e:
+        try:
+            respuesta = json.loads(e.read().decode("utf-8"))
+        except ValueError:
+            raise RuntimeError(str(e)) from e
+        if e.code == 409 and respuesta.get("duplicados"):
+            return respuesta
+        raise RuntimeError(respuesta.get("error", str(e))) from e
+    except OSError as e:
+        raise RuntimeError(f"No se pudo contactar al servidor {url_base}: {e}") from e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio local de registro de incidencias.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    args = parser.parse_args()
+    # Una sola vez al iniciar, no en los hilos de las solicitudes
+    metricas.configurar(jm.obtener_config())
+
+    servidor = crear_servidor(args.host, args.puerto, args.excel)
+    print(f"Servidor de incidencias en http://{args.host}:{args.puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo: vigilante.py
+Descripción: Detecta cambios en los archivos de datos (config.json, alumnos.json,
+             ubicaciones.json, tipos_incidencia.json) hechos por otras herramientas
+             o por la sincronización de la oficina central, para que el programa
+             recargue solo el recurso que cambió.
+
+             En Linux se usa inotify (por ctypes, sin dependencias): cada revisión es
+             una lectura sin bloqueo del descriptor y solo se consulta el disco
+             cuando llegó un evento. En otros sistemas, o si inotify no está
+             disponible, se compara la fecha de modificación y el tamaño de cada
+             archivo en cada revisión.
+
+             Un archivo solo se reporta cuando su contenido es JSON válido; si otra
+             herramienta lo está escribiendo, se espera a que termine. Los borrados
+             se ignoran (la sincronización suele borrar y volver a crear).
+
+             El programa llama a cambios() periódicamente con root.after(). Para
+             probarlo por separado:
+                 python vigilante.py
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import struct
+import ctypes
+import ctypes.util
+
+import json_manager as jm
+
+INTERVALO_MS = 1000
+ARCHIVOS_DATOS = (jm.CONFIG_FILE, jm.ALUMNOS_FILE, jm.LOCATIONS_FILE, jm.TIPOS_FILE)
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+MASCARA = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENTO = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _firma(ruta):
+    """(mtime_ns, tamaño) del archivo, o None si no existe."""
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _json_valido(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            json.load(f)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _abrir_inotify(directorios):
+    """Descriptor de inotify vigilando los directorios y {wd: directorio}, o (None, {})."""
+    if not sys.platform.startswith("linux"):
+        return None, {}
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None, {}
+    if fd < 0:
+        return None, {}
+    directorios_wd = {}
+    for directorio in directorios:
+        # Se vigila el directorio y no el archivo: quien reemplaza el archivo con
+        # os.replace() cambia su inodo y una vigilancia sobre el archivo se perdería.
+        wd = libc.inotify_add_watch(fd, os.fsencode(directorio), MASCARA)
+        if wd < 0:
+            os.close(fd)
+            return None, {}
+        directorios_wd[wd] = directorio
+    return fd, directorios_wd
+
+
+class Vigilante:
+    """Vigila un conjunto de archivos JSON y reporta los que cambiaron."""
+
+    def __init__(self, rutas=ARCHIVOS_DATOS, usar_inotify=True):
+        self.rutas = [os.path.normpath(r) for r in rutas]
+        self._firmas = {r: _firma(r) for r in self.rutas}
+        directorios = sorted({os.path.dirname(os.path.abspath(r)) for r in self.rutas})
+        self._fd, self._directorios = _abrir_inotify(directorios) if usar_inotify else (None, {})
+        self._por_nombre = {(os.path.dirname(os.path.abspath(r)), os.path.basename(r)): r for r in self.rutas}
+
+    @property
+    def modo(self):
+        return "inotify" if self._fd is not None else "sondeo"
+
+    def visto(self, ruta):
+        """Registra el estado actual del archivo (por ejemplo, después de que el propio programa lo guardó)."""
+        ruta = os.path.normpath(ruta)
+        if ruta in self._firmas:
+            self._firmas[ruta] = _firma(ruta)
+
+    def _eventos(self):
+        """Rutas vigiladas con eventos de inotify desde la última revisión."""
+        candidatas = set()
+        while True:
+            try:
+                datos = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return candidatas
+                raise
+            posicion = 0
+            while posicion + _EVENTO.size <= len(datos):
+                wd, mascara, _, largo = _EVENTO.unpack_from(datos, posicion)
+                posicion += _EVENTO.size
+                nombre = os.fsdecode(datos[posicion:posicion + largo].rstrip(b"\0"))
+                posicion += largo
+                if mascara & IN_Q_OVERFLOW:
+                    candidatas.update(self.rutas)
+                ruta = self._por_nombre.get((self._directorios.get(wd), nombre))
+                if ruta:
+                    candidatas.add(ruta)
+
+    def cambios(self):
+        """Rutas cuyo contenido cambió y es JSON válido, en el orden en que se registraron."""
+        candidatas = self._eventos() if self._fd is not None else self.rutas
+        cambiadas = []
+        for ruta in self.rutas:
+            if ruta not in candidatas:
+                continue
+            firma = _firma(ruta)
+            if firma == self._firmas[ruta]:
+                continue
+            self._firmas[ruta] = firma
+            # Borrado o escritura a medias: se espera al siguiente cambio
+            if firma is not None and _json_valido(ruta):
+                cambiadas.append(ruta)
+        return cambiadas
+
+    def cerrar(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def main():
+    vigilante = Vigilante()
+    print(f"Vigilando {', '.join(vigilante.rutas)} ({vigilante.modo}). Ctrl+C para salir.")
+    try:
+        while True:
+            for ruta in vigilante.cambios():
+                print(f"{time.strftime('%H:%M:%S')} cambió {ruta}")
+            time.sleep(INTERVALO_MS / 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        vigilante.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 from docx.enum.table import WD_ALIGN_VERTICAL, WD_TABLE_ALIGNMENT
 
+from metricas import medir
+
 # No longer importing from config, these will be passed as arguments
 
 # El diccionario vuelve a usar la variable {lugar} directamente.
@@ -74,71 +76,44 @@ def set_cell_borders(cell, **kwargs):
 def generar_word(fecha, hora, lugar, actividad, participantes, tipo_inc,
                  gravedad, narracion, medidas, seguimiento, padres_dict,
                  output_path, maestros_externos=None, school_name=None,
-                 director_name=None, teacher_name=None, grade=None, group=None):
+                 director_name=None, teacher_name=None, grade=None, group=None,
+                 location=None):
     """
     Genera el documento Word de la bitácora de manera segura.
     """
+    with medir("word.construir", participantes=len(participantes)):
+        doc = construir_documento(
+            fecha, hora, lugar, actividad, participantes, tipo_inc, gravedad, narracion,
+            medidas, seguimiento, padres_dict, maestros_externos=maestros_externos,
+            school_name=school_name, director_name=director_name, teacher_name=teacher_name,
+            grade=grade, group=group, location=location
+        )
+
+    # Guardar documento
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    with medir("word.guardar", archivo=output_path):
+        doc.save(output_path)
+    return output_path
+
+
+def construir_documento(fecha, hora, lugar, actividad, participantes, tipo_inc,
+                        gravedad, narracion, medidas, seguimiento, padres_dict,
+                        maestros_externos=None, school_name=None, director_name=None,
+                        teacher_name=None, grade=None, group=None, location=None):
+    """
+    Construye en memoria el documento Word de la bitácora, sin guardarlo.
+    """
     if not isinstance(padres_dict, dict):
         padres_dict = {}
     if maestros_externos is None:
         maestros_externos = []
+    if location is None:
+        location = ""
 
-    doc = Document()
-    sec = doc.sections[0]
-    sec.page_width = Inches(8.5)
-    sec.page_height = Inches(11)
-
-    margin_size = Inches(0.5)
-    sec.top_margin = margin_size
-    sec.bottom_margin = margin_size
-    sec.left_margin = margin_size
-    sec.right_margin = margin_size
-
-    # ----- Encabezado con logos -----
-    try:
-        header = sec.header
-        header_table = header.add_table(rows=1, cols=3, width=Inches(7.5))
-        header_table.autofit = False
-
-        cell_logo1 = header_table.cell(0, 0)
-        cell_logo1.width = Inches(1.5)
-        cell_logo1.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-        logo1_path = os.path.join("recursos", "logo1.png")
-        if os.path.exists(logo1_path):
-            run = cell_logo1.paragraphs[0].add_run()
-            run.add_picture(logo1_path, width=Inches(1.0))
-        else:
-            cell_logo1.paragraphs[0].add_run("Logo Izquierdo")
-
-        cell_center = header_table.cell(0, 1)
-        cell_center.width = Inches(3.5)
-
-        cell_logo2 = header_table.cell(0, 2)
-        cell_logo2.width = Inches(2.5)
-        cell_logo2.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        logo2_path = os.path.join("recursos", "logo2.png")
-        if os.path.exists(logo2_path):
-            run = cell_logo2.paragraphs[0].add_run()
-            run.add_picture(logo2_path, width=Inches(2.5))
-        else:
-            cell_logo2.paragraphs[0].add_run("Logo Derecho")
-    except Exception as e:
-        print(f"Advertencia: No se pudieron agregar los logos al encabezado. Causa: {e}")
-
-    # ----- Título -----
-    t = doc.add_paragraph()
-    r = t.add_run(f"BITÁCORA DE INCIDENCIA - {school_name}\n")
-    r.bold = True
-    r.font.size = Pt(14)
-    t.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    try:
-        p_sub = doc.add_paragraph(location, style='Subtitle')
-        p_sub.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    except Exception:
-        # Si style 'Subtitle' no existe, añadimos sin estilo
-        p = doc.add_paragraph(location)
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    doc.add_paragraph()
+    doc = nuevo_documento()
+    agregar_encabezado(doc)
+    agregar_titulo(doc, f"BITÁCORA DE INCIDENCIA - {school_name}", location)
 
     # ----- Narración Dinámica con formato -----
     participantes_str_list = [f"{p['nombre']} ({p['grado']}° '{p['grupo']}')" for p in participantes]
@@ -215,8 +190,95 @@ def generar_word(fecha, hora, lugar, actividad, participantes, tipo_inc,
             cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
             set_cell_borders(cell, bottom=border_normal, top=border_none, left=border_none, right=border_none)
 
-    # Guardar documento
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
-    doc.save(output_path)
-    return output_path
+    return doc
+
+
+def nuevo_documento():
+    """Documento carta con márgenes de media pulgada, como la bitácora."""
+    doc = Document()
+    sec = doc.sections[0]
+    sec.page_width = Inches(8.5)
+    sec.page_height = Inches(11)
+
+    margin_size = Inches(0.5)
+    sec.top_margin = margin_size
+    sec.bottom_margin = margin_size
+    sec.left_margin = margin_size
+    sec.right_margin = margin_size
+    return doc
+
+
+def agregar_encabezado(doc):
+    """Encabezado con los logos de 'recursos/' (o un texto si no existen)."""
+    sec = doc.sections[0]
+    # ----- Encabezado con logos -----
+    try:
+        header = sec.header
+        header_table = header.add_table(rows=1, cols=3, width=Inches(7.5))
+        header_table.autofit = False
+
+        cell_logo1 = header_table.cell(0, 0)
+        cell_logo1.width = Inches(1.5)
+        cell_logo1.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
+        logo1_path = os.path.join("recursos", "logo1.png")
+        if os.path.exists(logo1_path):
+            run = cell_logo1.paragraphs[0].add_run()
+            run.add_picture(logo1_path, width=Inches(1.0))
+        else:
+            cell_logo1.paragraphs[0].add_run("Logo Izquierdo")
+
+        cell_center = header_table.cell(0, 1)
+        cell_center.width = Inches(3.5)
+
+        cell_logo2 = header_table.cell(0, 2)
+        cell_logo2.width = Inches(2.5)
+        cell_logo2.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        logo2_path = os.path.join("recursos", "logo2.png")
+        if os.path.exists(logo2_path):
+            run = cell_logo2.paragraphs[0].add_run()
+            run.add_picture(logo2_path, width=Inches(2.5))
+        else:
+            cell_logo2.paragraphs[0].add_run("Logo Derecho")
+    except Exception as e:
+        print(f"Advertencia: No se pudieron agregar los logos al encabezado. Causa: {e}")
+
+
+def agregar_titulo(doc, titulo, location=None):
+    """Título centrado en negritas y, debajo, la ubicación de la escuela."""
+    # ----- Título -----
+    t = doc.add_paragraph()
+    r = t.add_run(f"{titulo}\n")
+    r.bold = True
+    r.font.size = Pt(14)
+    t.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    try:
+        p_sub = doc.add_paragraph(location or "", style='Subtitle')
+        p_sub.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    except Exception:
+        # Si style 'Subtitle' no existe, añadimos sin estilo
+        p = doc.add_paragraph(location or "")
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.add_paragraph()
+
+
+def agregar_subtitulo(doc, texto):
+    """Subtítulo de sección en negritas."""
+    p = doc.add_paragraph()
+    r = p.add_run(texto)
+    r.bold = True
+    r.font.size = Pt(12)
+
+
+def agregar_tabla(doc, encabezados, filas):
+    """Tabla con cuadrícula y encabezados en negritas, seguida de un párrafo vacío."""
+    tabla = doc.add_table(rows=1, cols=len(encabezados))
+    tabla.style = "Table Grid"
+    for celda, texto in zip(tabla.rows[0].cells, encabezados):
+        celda.text = texto
+        celda.paragraphs[0].runs[0].bold = True
+        celda.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    for fila in filas:
+        for celda, valor in zip(tabla.add_row().cells, fila):
+            celda.text = str(valor if valor is not None else "")
+    doc.add_paragraph()
+    return tabla